@@ -0,0 +1,115 @@
+"""
+Compares section archive strategies on a synthetic section.
+
+Builds a section that looks like what students submit (docx/pptx/odt containers, PDFs with
+compressed streams, doc/ppt files and plain text) and streams it through every compression
+strategy, reporting CPU time and archive size for each.
+
+Usage (needs the same environment variables as the app since main_app is imported):
+    python benchmarks/archive_compression.py [--students 60] [--size-kb 900] [--level 6]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from main_app.main.archive import stream_zip, CompressionPolicy
+
+
+WORDS = (
+    "assignment lecture seminar project department faculty university report result "
+    "analysis method introduction conclusion reference student course semester"
+).split()
+
+
+def text_bytes(size: int) -> bytes:
+    rng = random.Random(size)
+    words = []
+    total = 0
+
+    while total < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        total += len(word) + 1
+
+    return " ".join(words).encode()[:size]
+
+
+def office_container(size: int) -> bytes:
+    """A docx/pptx/odt look-alike: a zip of deflated xml plus an embedded image"""
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("[Content_Types].xml", text_bytes(2048))
+        zipf.writestr("word/document.xml", text_bytes(size // 2))
+        zipf.writestr("word/media/image1.png", os.urandom(size // 2), compress_type=zipfile.ZIP_STORED)
+
+    return buffer.getvalue()
+
+
+def pdf_bytes(size: int) -> bytes:
+    """A PDF look-alike whose page content is stored in flate streams"""
+    stream = zlib.compress(text_bytes(size * 4), 9)[:size]
+
+    return b"%PDF-1.7\n1 0 obj\n<< /Filter /FlateDecode >>\nstream\n" + stream + b"\nendstream\nendobj\n%%EOF\n"
+
+
+def build_section(directory: Path, students: int, size: int) -> list[tuple[Path, str]]:
+    makers = {
+        "docx": office_container,
+        "pptx": office_container,
+        "odt": office_container,
+        "pdf": pdf_bytes,
+        "doc": lambda n: b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + text_bytes(n),
+        "txt": text_bytes,
+    }
+    extensions = list(makers)
+    members = []
+
+    for student in range(students):
+        ext = extensions[student % len(extensions)]
+        path = directory / f"student_{student}.{ext}"
+        path.write_bytes(makers[ext](size))
+        members.append((path, path.name))
+
+    return members
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--size-kb", type=int, default=900)
+    parser.add_argument("--level", type=int, default=6)
+    args = parser.parse_args()
+
+    strategies = {
+        "deflated": CompressionPolicy(mode="deflated", level=args.level),
+        "stored": CompressionPolicy(mode="stored", level=args.level),
+        "adaptive": CompressionPolicy(mode="adaptive", level=args.level, stored_extensions=frozenset({"docx", "pptx", "odt"})),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        members = build_section(Path(tmp), args.students, args.size_kb * 1024)
+        source_size = sum(path.stat().st_size for path, _ in members)
+
+        print(f"Synthetic section: {len(members)} files, {source_size / 1048576:.1f} MB")
+        print(f"{'strategy':<10} {'cpu (s)':>9} {'archive (MB)':>13} {'ratio':>7}")
+
+        for name, policy in strategies.items():
+            start = time.process_time()
+            size = sum(len(chunk) for chunk in stream_zip(members, policy=policy))
+            elapsed = time.process_time() - start
+
+            print(f"{name:<10} {elapsed:>9.3f} {size / 1048576:>13.2f} {size / source_size:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
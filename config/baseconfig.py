@@ -23,8 +23,77 @@ class BaseConfig(object):
     UPLOAD_EXTENSIONS={"docx", "doc", "txt", "pptx", "pdf", "odt", 'ppt'}
     MAX_CONTENT_LENGTH=25 * 1024 * 1024
     MIN_CONTENT_LENGTH=10 * 1024
+    UPLOAD_SECTION_CONCURRENCY=20 # Form uploads a section receives at once, checked before the body is read
+    UPLOAD_SLOT_TTL=120 # Seconds before the slot of an upload a crashed worker never released expires
     FILES_PER_PAGE=15
 
+    # Storage: directory (UPLOAD_PATH/<section>/<filename>) or cas (one blob per distinct content)
+    STORAGE_MODE=os.environ.get("STORAGE_MODE", "directory")
+    BLOB_DIR=".blobs"
+
+    # Where files live: local (UPLOAD_PATH) or s3 (any S3 compatible service, needs boto3)
+    STORAGE_BACKEND=os.environ.get("STORAGE_BACKEND", "local")
+    S3_BUCKET=os.environ.get("S3_BUCKET")
+    S3_PREFIX=os.environ.get("S3_PREFIX", "")
+    S3_ENDPOINT_URL=os.environ.get("S3_ENDPOINT_URL") # e.g. http://localhost:9000 for MinIO
+    S3_REGION=os.environ.get("S3_REGION")
+
+    # Resumable uploads
+    UPLOAD_STAGING_DIR=".staging"
+    UPLOAD_STAGING_TTL=24 * 60 * 60 # Seconds an unfinished upload is kept
+    UPLOAD_CHUNK_SIZE=64 * 1024
+
+    # Section archives
+    ARCHIVE_CHUNK_SIZE=64 * 1024
+    ARCHIVE_COMPRESSION="adaptive" # adaptive, deflated or stored
+    ARCHIVE_COMPRESSION_LEVEL=6 # Applied on Python 3.13 and later, zlib's default is 6 too
+    ARCHIVE_STORED_EXTENSIONS={"docx", "pptx", "odt"}
+    ARCHIVE_PROBE_SIZE=64 * 1024
+    ARCHIVE_MIN_RATIO=0.9
+    ARCHIVE_CACHE_ENABLED=True
+    ARCHIVE_CACHE_MAX_BYTES=10 * 1024 ** 3 # Least recently downloaded archives are dropped beyond it
+    ARCHIVE_CACHE_WAIT=60 # Seconds a download waits for a build it follows to write more
+
+    # Rendered dashboard and section page fragments kept in Redis
+    FRAGMENT_CACHE_ENABLED=True
+    FRAGMENT_CACHE_TTL=5 * 60
+
+    # Sections behind the public upload links, in an LRU of each process backed by Redis
+    UPLOAD_LINK_CACHE_ENABLED=True
+    UPLOAD_LINK_TTL=5 * 60
+    UPLOAD_LINK_MISSING_TTL=60 # Links leading nowhere
+    UPLOAD_LINK_LOCAL_TTL=30 # Bounds staleness if a process misses an invalidation
+    UPLOAD_LINK_FILTER_ENABLED=True # Turns away links to no section before the cache
+    UPLOAD_LINK_FILTER_FP_RATE=0.01
+    UPLOAD_LINK_FILTER_REBUILD=10 * 60 # Seconds, drops the links of deleted sections
+
+    # Live submission progress on the dashboard
+    LIVE_PROGRESS_HEARTBEAT=15 # Seconds between keep alive comments
+    LIVE_PROGRESS_MAX_DURATION=5 * 60 # Seconds a stream is kept open before the browser reconnects
+    LIVE_PROGRESS_RETRY=3000 # Milliseconds the browser waits before reconnecting
+
+    # Files of deleted submissions, removed by flask deletion-worker
+    DELETION_BATCH_SIZE=100
+    DELETION_MAX_ATTEMPTS=5
+    DELETION_WAIT=2 # Seconds the worker waits for work, under the Redis socket timeout
+
+    # Directories of deleted sections, removed by flask purge-trash
+    TRASH_DIR=".trash"
+    TRASH_GRACE=60 # Seconds a directory is kept before it is purged
+    TRASH_PURGE_FILES_PER_SECOND=200
+    TRASH_PURGE_BYTES_PER_SECOND=50 * 1024 * 1024
+
+    # flask storage-fsck
+    FSCK_MIN_AGE=60 * 60 # Seconds before a file without a submission counts as an orphan
+    FSCK_QUARANTINE_DIR=".quarantine"
+
+    # Downloads: local, x-accel (nginx) or x-sendfile (apache/lighttpd)
+    DOWNLOAD_BACKEND=os.environ.get("DOWNLOAD_BACKEND", "local")
+    X_ACCEL_UPLOAD_PREFIX="/protected/uploads"
+    X_ACCEL_ARCHIVE_PREFIX="/protected/archives"
+    DOWNLOAD_CHUNK_SIZE=64 * 1024
+    DOWNLOAD_MAX_RANGES=16
+
     USERS_PER_PAGE=30
 
     # Security
@@ -60,6 +129,9 @@ class BaseConfig(object):
         upload_dir = app.config["HOME_DIR"] / dir_path
         app.config["UPLOAD_PATH"] = upload_dir
 
+        # Cached section archives
+        app.config["ARCHIVE_CACHE_PATH"] = app.config["HOME_DIR"] / Path("/var/www/archive_cache")
+
         # Additional Mail Setup
         app.config["MAIL_DEBUG"] = app.debug
         
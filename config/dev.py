@@ -19,6 +19,9 @@ class DevelopmentConfig(BaseConfig):
     # Database
     SQLALCHEMY_DATABASE_URI=f"sqlite:///filesharing.db"
 
+    # Downloads are sent by the app since there is no front proxy
+    DOWNLOAD_BACKEND = "local"
+
     # Security
     SESSION_COOKIE_SECURE = False
 
@@ -44,4 +47,7 @@ class DevelopmentConfig(BaseConfig):
         dir_path = "uploaded_files"
         upload_dir = app.config["HOME_DIR"] / dir_path
         app.config["UPLOAD_PATH"] = upload_dir
+
+        # Cached section archives
+        app.config["ARCHIVE_CACHE_PATH"] = app.config["HOME_DIR"] / "archive_cache"
         
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from flask import Flask
 from pathlib import Path
@@ -17,6 +18,13 @@ class TestingConfig(BaseConfig):
     # Database
     SQLALCHEMY_DATABASE_URI=f"sqlite:///test.db"
 
+    # Downloads are sent by the app since there is no front proxy
+    DOWNLOAD_BACKEND = "local"
+
+    # Every test starts with a new database, fragments of a previous one would be served
+    FRAGMENT_CACHE_ENABLED = False
+    UPLOAD_LINK_CACHE_ENABLED = False
+
     # Security
     SECRET_KEY = "Teesting coniaihfgerfsehgviudgvhirtgsegfter"
     SESSION_COOKIE_SECURE = False
@@ -32,4 +40,7 @@ class TestingConfig(BaseConfig):
         dir_path = "uploaded_test_files"
         upload_dir = app.config["HOME_DIR"] / dir_path
         app.config["UPLOAD_PATH"] = upload_dir
+
+        # Cached section archives, outside the repository
+        app.config["ARCHIVE_CACHE_PATH"] = Path(tempfile.mkdtemp(prefix="archive_test_cache_"))
         
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+Gunicorn settings, read from the working directory by `gunicorn filesharing:app`.
+
+The dashboard's live progress is a Server-Sent Events stream kept open for up to
+LIVE_PROGRESS_MAX_DURATION seconds. A sync worker would be held by every open dashboard tab,
+so the workers are gevent ones, each serving up to worker_connections requests on greenlets.
+"""
+import multiprocessing
+import os
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gevent"
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+timeout = 30
+graceful_timeout = 30
@@ -4,10 +4,12 @@ from typing import Optional
 from main_app.logging import set_logger
 from config import get_config, config
 from main_app.utils import initialize_sentry, initialize_extensions, register_blueprints
+from main_app.main.staging import StagingRequest
 
 
 def create_app(config_name: Optional[str] = None):
     app = Flask(__name__)
+    app.request_class = StagingRequest
 
     if config_name:
         config_obj = config[config_name]
@@ -31,6 +33,18 @@ def create_app(config_name: Optional[str] = None):
     # Register blueprints
     register_blueprints(app)
 
+    # Drop cached fragments when submissions or sections change
+    from main_app.cache import register_cache_invalidation
+    register_cache_invalidation()
+
+    # Publish submission progress to the dashboards watching it
+    from main_app.live import register_live_progress
+    register_live_progress()
+
+    # Register maintenance commands
+    from main_app.commands import register_commands
+    register_commands(app)
+
     @app.cli.command("create-db")
     def create_db():
         from main_app.extensions import db
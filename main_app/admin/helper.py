@@ -5,7 +5,13 @@ from typing import Sequence
 
 from main_app.models import User, Section, Submissions, Message
 from main_app.extensions import db
+from main_app.events import emit, submission_deleted, section_changed
 from main_app.admin.exception import MessageDoesNotExist
+from main_app.main.pagination import SubmissionPage, paginate_submissions
+from main_app.main.helper import delete_section_and_its_files
+from main_app.main.archive import invalidate_section_archive
+from main_app.deletions import schedule_deletion
+from main_app.main.upload_links import upload_links
 
 
 
@@ -121,22 +127,17 @@ def get_user_section(id: int) -> Section | None:
     return None
 
 
-def get_user_submissions(section_id: int, page_num: int):
+def get_user_submissions(section_id: int, cursor: str | None = None) -> SubmissionPage:
     """
-    Docstring for get_user_submissions
+    Returns a page of the submissions of a section
     
-    :param section_id: Description
+    :param section_id: ID of the section
     :type section_id: int
-    :param page_num: Description
-    :type page_num: int
-    :return: Description
-    :rtype: Sequence[Submissions] | None
+    :param cursor: Cursor of the page, None for the first one
+    :type cursor: str | None
+    :rtype: SubmissionPage
     """
-    query = sql.select(Submissions).where(Submissions.section_id == section_id)
-
-    files = db.paginate(query, page=page_num, per_page=current_app.config["FILES_PER_PAGE"], error_out=False)
-
-    return files
+    return paginate_submissions(section_id, cursor, current_app.config["FILES_PER_PAGE"])
 
 
 def get_user_file(id: int) -> Submissions | None:
@@ -158,8 +159,13 @@ def is_section_deleted(section_id: int) -> bool:
     section = db.session.get(Section, section_id)
 
     if section:
-        db.session.delete(section)
-        db.session.commit()
+        user_id, section_name = section.user_id, section.section_name
+
+        delete_section_and_its_files(section)
+        upload_links.invalidate(section_name)
+        invalidate_section_archive(section_id)
+
+        emit(section_changed, user_id, section_id)
 
         return True
     
@@ -177,9 +183,17 @@ def is_file_deleted(file_id: int) -> bool:
     file = db.session.get(Submissions, file_id)
 
     if file:
+        user_id, section_id, file_path = file.section.user_id, file.section_id, file.file_path
+
         db.session.delete(file)
         db.session.commit()
 
+        # Kept while another submission points at it, see main_app.deletions
+        schedule_deletion([file_path])
+        invalidate_section_archive(section_id)
+
+        emit(submission_deleted, user_id, section_id)
+
         return True
     
     return False
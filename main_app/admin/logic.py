@@ -2,13 +2,17 @@ import sqlalchemy as sql
 from flask_login import current_user
 from flask import current_app
 
-from main_app.models import User
+from main_app.models import User, Section
 from main_app.extensions import db
 from main_app.admin.forms import RegisterUserForm, EditUser
 from main_app.admin.helper import (
     get_user_by_id, get_user_by_email, get_user_by_name
 )
 from main_app.admin.exception import CannotDeleteAdmin, UserAlreadyExist, EmailAlreadyExist
+from main_app.main.helper import delete_user_and_their_files
+from main_app.main.archive import invalidate_section_archive
+from main_app.main.upload_links import upload_links
+from main_app.cache import invalidate_user_fragments
 
 
 def registered_user(form: RegisterUserForm) -> bool:
@@ -51,8 +55,13 @@ def user_deleted(user_id: str) -> bool:
         if current_user.role == "admin" and user.role == "admin":
             raise CannotDeleteAdmin("Admin cannot delete admin")
         
-        db.session.delete(user)
-        db.session.commit()
+        # Their sections and submissions go with ON DELETE CASCADE, the files in the background
+        sections = delete_user_and_their_files(user)
+
+        for section_id, _ in sections:
+            invalidate_section_archive(section_id)
+
+        upload_links.invalidate(*(section_name for _, section_name in sections))
 
         return True
     except Exception:
@@ -108,6 +117,11 @@ def is_user_edited(form: EditUser, user: User) -> bool:
 
             db.session.commit()
 
+            # The links of their sections carry the share slug, which follows the username
+            if prev_username != username:
+                upload_links.add(*db.session.scalars(sql.select(Section.section_name).where(Section.user_id == user.id)))
+                invalidate_user_fragments(user.id)
+
             return True
         
         except Exception:
@@ -18,6 +18,7 @@ from main_app.admin.logic import (
 from main_app.admin.forms import RegisterUserForm, EditUser
 
 from main_app.admin.exception import CannotDeleteAdmin, UserAlreadyExist, EmailAlreadyExist, MessageDoesNotExist
+from main_app.main.exception import InvalidCursor
 
 
 @admin_bp.route("/dashboard", methods=["GET", "POST"])
@@ -314,19 +315,17 @@ def user_details(user_id):
 @admin_required
 def user_section(section_id: str):
     try:
-        page = request.args.get("page", 1, type=int)
+        cursor = request.args.get("cursor")
 
         section = get_user_section(int(section_id))
 
-        # Don't forget to paginate this properly 
-
-        paginated_files = get_user_submissions(section.id, page)
+        paginated_files = get_user_submissions(section.id, cursor)
 
-        next_url = url_for("admin_bp.user_section", section_id=section_id, page=paginated_files.next_num) \
-            if paginated_files.has_next else None
+        next_url = url_for("admin_bp.user_section", section_id=section_id, cursor=paginated_files.next_cursor) \
+            if paginated_files.next_cursor else None
         
-        prev_url = url_for("admin_bp.user_section", section_id=section_id, page=paginated_files.prev_num) \
-            if paginated_files.has_prev else None
+        prev_url = url_for("admin_bp.user_section", section_id=section_id, cursor=paginated_files.prev_cursor) \
+            if paginated_files.prev_cursor else None
 
         data = {
             "section": section,
@@ -338,6 +337,10 @@ def user_section(section_id: str):
         current_app.logger.info(f"{current_user.username} accessed section page eitj ID {section.id}")
         return render_template("admin/user-section.html", data=data)
     
+    except InvalidCursor:
+        flash("That page doesn't exist anymore", "warning")
+        return redirect(url_for("admin_bp.user_section", section_id=section_id))
+
     except Exception as e:
         flash("An error occured. Please try again later", "error")
         current_app.logger.error(f"{current_user.username}::An unexpected error occured due to {str(e)}")
@@ -0,0 +1,133 @@
+"""
+Rendered page fragments kept in Redis.
+
+The dashboard and section pages are polled and rebuilt the same HTML on every request. Their
+stat blocks and cards are rendered once and kept for FRAGMENT_CACHE_TTL seconds under a scope,
+user:<id> for the dashboard and section:<id> for the files of a section. The events in
+main_app.events bump the generation of the scopes a change touches, so fragments rendered
+before it are never read again and simply expire; a render racing with a change is stored
+under the old generation and can't be served either.
+
+Hits and misses are counted in Redis for all workers, see flask cache-stats.
+"""
+from flask import current_app, Flask
+from markupsafe import Markup
+from typing import Callable
+import redis
+
+from main_app.extensions import redis_client
+from main_app.events import submission_added, submission_deleted, section_changed
+
+
+class FragmentCache:
+    def __init__(self, client: redis.Redis, prefix: str = "fragment") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def _generation_key(self, scope: str) -> str:
+        return f"{self.prefix}:generation:{scope}"
+
+    def get_or_render(self, scope: str, name: str, render: Callable[[], str], ttl: int) -> Markup:
+        """
+        Returns the fragment name of scope, rendering and storing it when it isn't cached.
+        When Redis can't be reached the fragment is rendered every time.
+
+        :param scope: What the fragment is built from, e.g. user:1
+        :type scope: str
+        :param name: The fragment within the scope
+        :type name: str
+        :param render: Renders the fragment
+        :type render: Callable[[], str]
+        :param ttl: Seconds the fragment is kept
+        :type ttl: int
+        :rtype: Markup
+        """
+        try:
+            generation = self.client.get(self._generation_key(scope)) or 0
+            key = f"{self.prefix}:{scope}:{generation}:{name}"
+            fragment = self.client.get(key)
+
+            if fragment is not None:
+                self.client.incr(f"{self.prefix}:hits")
+                return Markup(fragment)
+
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Fragment cache unavailable, rendering {scope}/{name} due to {str(e)}")
+            return Markup(render())
+
+        fragment = render()
+
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.set(key, fragment, ex=ttl)
+                pipe.incr(f"{self.prefix}:misses")
+                pipe.execute()
+
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Couldn't cache fragment {scope}/{name} due to {str(e)}")
+
+        return Markup(fragment)
+
+    def invalidate(self, *scopes: str) -> None:
+        """Makes every fragment cached for scopes stale"""
+        with self.client.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(self._generation_key(scope))
+
+            pipe.execute()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of hits and misses counted so far"""
+        hits, misses = self.client.mget(f"{self.prefix}:hits", f"{self.prefix}:misses")
+
+        return {"hits": int(hits or 0), "misses": int(misses or 0)}
+
+
+fragment_cache = FragmentCache(redis_client)
+
+
+def cached_fragment(scope: str, name: str, render: Callable[[], str]) -> Markup:
+    """
+    Returns a fragment from the fragment cache, or renders it when FRAGMENT_CACHE_ENABLED is off
+
+    :param scope: What the fragment is built from, e.g. user:1
+    :type scope: str
+    :param name: The fragment within the scope
+    :type name: str
+    :param render: Renders the fragment
+    :type render: Callable[[], str]
+    :rtype: Markup
+    """
+    if not current_app.config["FRAGMENT_CACHE_ENABLED"]:
+        return Markup(render())
+
+    return fragment_cache.get_or_render(scope, name, render, current_app.config["FRAGMENT_CACHE_TTL"])
+
+
+def invalidate_user_fragments(user_id: int) -> None:
+    """Makes the dashboard fragments of a user stale, e.g. after their share slug changed"""
+    if not current_app.config["FRAGMENT_CACHE_ENABLED"]:
+        return
+
+    try:
+        fragment_cache.invalidate(f"user:{user_id}")
+
+    except redis.RedisError as e:
+        current_app.logger.error(f"Couldn't invalidate fragments of user {user_id} due to {str(e)}")
+
+
+def _invalidate_section_fragments(app: Flask, user_id: int, section_id: int) -> None:
+    if not app.config["FRAGMENT_CACHE_ENABLED"]:
+        return
+
+    try:
+        fragment_cache.invalidate(f"user:{user_id}", f"section:{section_id}")
+
+    except redis.RedisError as e:
+        # Fragments of this scope may be served until their TTL runs out
+        app.logger.error(f"Couldn't invalidate fragments of section {section_id} due to {str(e)}")
+
+
+def register_cache_invalidation() -> None:
+    for signal in (submission_added, submission_deleted, section_changed):
+        signal.connect(_invalidate_section_fragments)
@@ -0,0 +1,262 @@
+"""
+Maintenance commands, run with flask <command>
+"""
+import click
+import sqlalchemy as sql
+import uuid
+from flask import Flask
+from pathlib import Path
+
+from main_app.extensions import db
+from main_app.models import Section, Submissions, User
+from main_app.cache import fragment_cache
+from main_app.deletions import deletion_queue, process_deletions
+from main_app.main.trash import purge_trash
+from main_app.fsck import StorageFsck, ORPHAN_ACTIONS
+from main_app.storage import get_storage
+from main_app.main.helper import username_to_gibberish
+from main_app.main.upload_links import build_link_filter
+
+
+def recount_sections(after_id: int = 0, batch_size: int = 500) -> tuple[int | None, int]:
+    """
+    Recomputes the submission counters of the next batch_size sections with an id above after_id
+    from their submissions, in one UPDATE. Returns the last id of the batch, None when there are no
+    sections left, and how many sections had drifted.
+
+    :param after_id: The last section id of the previous batch
+    :type after_id: int
+    :param batch_size: Number of sections recounted at once
+    :type batch_size: int
+    :rtype: tuple[int | None, int]
+    """
+    ids = db.session.scalars(
+        sql.select(Section.id).where(Section.id > after_id).order_by(Section.id).limit(batch_size)
+    ).all()
+
+    if not ids:
+        return None, 0
+
+    def aggregate(column):
+        return sql.select(column).where(Submissions.section_id == Section.id).scalar_subquery()
+
+    submission_count = aggregate(sql.func.count(Submissions.id))
+    total_bytes = aggregate(sql.func.coalesce(sql.func.sum(Submissions.file_size), 0))
+    last_submission_at = aggregate(sql.func.max(Submissions.uploaded_at))
+
+    result = db.session.execute(
+        sql.update(Section)
+        .where(
+            Section.id.in_(ids),
+            (Section.submission_count != submission_count)
+            | (Section.total_bytes != total_bytes)
+            | Section.last_submission_at.is_distinct_from(last_submission_at)
+        )
+        .values(submission_count=submission_count, total_bytes=total_bytes, last_submission_at=last_submission_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return ids[-1], result.rowcount
+
+
+def backfill_share_slugs(after_id: int = 0, batch_size: int = 500) -> tuple[int | None, int]:
+    """
+    Sets the share slug of the users among the next batch_size with an id above after_id that
+    have none, in one UPDATE. Returns the last id of the batch, None when there are no users
+    left, and how many were set.
+
+    :param after_id: The last user id of the previous batch
+    :type after_id: int
+    :param batch_size: Number of users looked at at once
+    :type batch_size: int
+    :rtype: tuple[int | None, int]
+    """
+    users = db.session.execute(
+        sql.select(User.id, User.username, User.share_slug).where(User.id > after_id).order_by(User.id).limit(batch_size)
+    ).all()
+
+    if not users:
+        return None, 0
+
+    missing = [
+        {"id": user_id, "share_slug": username_to_gibberish(username)}
+        for user_id, username, share_slug in users if share_slug is None
+    ]
+
+    if missing:
+        db.session.execute(sql.update(User), missing)
+        db.session.commit()
+
+    return users[-1].id, len(missing)
+
+
+def backfill_checksums(after_id: int = 0, batch_size: int = 500) -> tuple[int | None, int]:
+    """
+    Stores the sha256 of the submissions among the next batch_size with an id above after_id
+    that have none, in one UPDATE. Their downloads get an ETag from then on. Returns the last id
+    of the batch, None when there are no submissions left, and how many were set.
+
+    :param after_id: The last submission id of the previous batch
+    :type after_id: int
+    :param batch_size: Number of submissions looked at at once
+    :type batch_size: int
+    :rtype: tuple[int | None, int]
+    """
+    submissions = db.session.execute(
+        sql.select(Submissions.id, Submissions.file_path, Submissions.checksum)
+        .where(Submissions.id > after_id).order_by(Submissions.id).limit(batch_size)
+    ).all()
+
+    if not submissions:
+        return None, 0
+
+    storage = get_storage()
+    missing = []
+
+    for submission_id, file_path, checksum in submissions:
+        if checksum is not None:
+            continue
+
+        try:
+            missing.append({"id": submission_id, "checksum": storage.checksum(file_path)})
+        except FileNotFoundError:
+            # storage-fsck reports missing files, they stay without a checksum
+            continue
+
+    if missing:
+        db.session.execute(sql.update(Submissions), missing)
+        db.session.commit()
+
+    return submissions[-1].id, len(missing)
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command("recount-sections")
+    @click.option("--batch-size", default=500, show_default=True, help="Sections recounted per transaction")
+    def recount_sections_command(batch_size: int):
+        """Repair the submission counters of every section"""
+        last_id, repaired = 0, 0
+
+        while True:
+            last_id, drifted = recount_sections(last_id, batch_size)
+
+            if last_id is None:
+                break
+
+            repaired += drifted
+
+        click.echo(f"Recounted sections, {repaired} had drifted.")
+
+
+    @app.cli.command("backfill-share-slugs")
+    @click.option("--batch-size", default=500, show_default=True, help="Users updated per transaction")
+    def backfill_share_slugs_command(batch_size: int):
+        """Set the share slug of users that have none"""
+        last_id, filled = 0, 0
+
+        while True:
+            last_id, updated = backfill_share_slugs(last_id, batch_size)
+
+            if last_id is None:
+                break
+
+            filled += updated
+
+        click.echo(f"Set the share slug of {filled} users.")
+
+
+    @app.cli.command("backfill-checksums")
+    @click.option("--batch-size", default=500, show_default=True, help="Submissions updated per transaction")
+    def backfill_checksums_command(batch_size: int):
+        """Store the checksum of submissions that have none"""
+        last_id, filled = 0, 0
+
+        while True:
+            last_id, updated = backfill_checksums(last_id, batch_size)
+
+            if last_id is None:
+                break
+
+            filled += updated
+
+        click.echo(f"Stored the checksum of {filled} submissions.")
+
+
+    @app.cli.command("cache-stats")
+    def cache_stats_command():
+        """Show the hits and misses of the fragment cache"""
+        stats = fragment_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups * 100 if lookups else 0
+
+        click.echo(f"Fragment cache: {stats['hits']} hits, {stats['misses']} misses ({ratio:.1f}% hit rate)")
+
+
+    @app.cli.command("link-filter-stats")
+    @click.option("--probes", default=10000, show_default=True, help="Made up links checked to measure false positives")
+    def link_filter_stats_command(probes: int):
+        """Show the size and false positive rate of the upload link filter"""
+        link_filter = build_link_filter(app.config["UPLOAD_LINK_FILTER_FP_RATE"])
+        false_positives = sum((uuid.uuid4().hex, uuid.uuid4().hex) in link_filter for _ in range(probes))
+
+        click.echo(f"Upload link filter: {link_filter.count} links, room for {link_filter.capacity}")
+        click.echo(f"Memory: {len(link_filter.bits)} bytes per process, {link_filter.hashes} hashes")
+        click.echo(f"False positives: {link_filter.fp_rate * 100:.3f}% expected, {false_positives / probes * 100 if probes else 0:.3f}% measured over {probes} links")
+
+
+    @app.cli.command("deletion-worker")
+    @click.option("--once", is_flag=True, help="Exit when the queue is empty instead of waiting for work")
+    def deletion_worker_command(once: bool):
+        """Delete the stored files of deleted submissions"""
+        config = app.config
+        recovered = deletion_queue.recover()
+
+        if recovered:
+            click.echo(f"Queued {recovered} files a stopped worker was deleting again.")
+
+        while True:
+            taken = process_deletions(config["DELETION_BATCH_SIZE"], config["DELETION_WAIT"], config["DELETION_MAX_ATTEMPTS"])
+
+            if once and not taken:
+                break
+
+        stats = deletion_queue.stats()
+        click.echo(f"Deletion queue empty, {stats['failed']} files failed.")
+
+
+    @app.cli.command("purge-trash")
+    def purge_trash_command():
+        """Delete the files of deleted sections from the trash"""
+        config = app.config
+        purged, removed = purge_trash(
+            config["TRASH_GRACE"], config["TRASH_PURGE_FILES_PER_SECOND"], config["TRASH_PURGE_BYTES_PER_SECOND"]
+        )
+
+        click.echo(f"Purged {purged} directories, {removed} files.")
+
+
+    @app.cli.command("storage-fsck")
+    @click.option("--orphans", type=click.Choice(ORPHAN_ACTIONS), default="report", show_default=True, help="What to do with files no submission points at")
+    @click.option("--batch-size", default=1000, show_default=True, help="Files or submissions checked per batch")
+    @click.option("--checkpoint", type=click.Path(dir_okay=False, path_type=Path), help="Where progress is kept, defaults to the instance folder")
+    @click.option("--restart", is_flag=True, help="Ignore the checkpoint of an interrupted run")
+    def storage_fsck_command(orphans: str, batch_size: int, checkpoint: Path | None, restart: bool):
+        """Report files without a submission and submissions without a file"""
+        if get_storage().local_path("") is None:
+            raise click.ClickException("storage-fsck walks UPLOAD_PATH, it needs STORAGE_BACKEND = local")
+
+        fsck = StorageFsck(checkpoint or Path(app.instance_path) / "storage-fsck.json", batch_size, orphans, click.echo)
+
+        if restart:
+            fsck.checkpoint.unlink(missing_ok=True)
+        elif fsck.checkpoint.exists():
+            click.echo(f"Resuming from {fsck.checkpoint}")
+
+        counts = fsck.run()
+
+        click.echo(
+            f"Checked {counts['files']} files and {counts['rows']} submissions: {counts['orphans']} orphans "
+            f"({counts['orphan_bytes']} bytes, {orphans}), {counts['missing']} submissions missing their file."
+        )
+
@@ -0,0 +1,179 @@
+"""
+Files of deleted submissions, removed in the background.
+
+Deleting the submissions of a section is one DELETE, and the names of their files are pushed
+to a Redis list once it commits. `flask deletion-worker` takes them off in batches of
+DELETION_BATCH_SIZE and deletes them from storage. A name being worked on sits in a processing
+list until it is done, so names a crashed worker held are put back on the queue when a worker
+starts again and nothing is left on disk for rows that are gone.
+
+A name is only deleted when no submission points at it and the file wasn't written again after
+it was queued, a blob another section shares or a file uploaded again under the same name is
+kept. Running a name twice is therefore harmless. A file that can't be deleted is retried
+DELETION_MAX_ATTEMPTS times, then moved to the failed list to be looked at.
+"""
+from flask import current_app
+from typing import Sequence
+import json
+import time
+import redis
+import sqlalchemy as sql
+
+from main_app.extensions import db, redis_client
+from main_app.models import Submissions
+from main_app.storage import get_storage
+
+
+class DeletionQueue:
+    def __init__(self, client: redis.Redis, name: str = "file-deletions") -> None:
+        self.client = client
+        self.name = name
+        self.processing = f"{name}:processing"
+        self.failed = f"{name}:failed"
+
+    def push(self, file_paths: Sequence[str]) -> None:
+        """Queues stored files to be deleted"""
+        if not file_paths:
+            return
+
+        queued_at = time.time()
+
+        self.client.lpush(self.name, *(json.dumps({"path": str(path), "queued_at": queued_at, "attempts": 0}) for path in file_paths))
+
+    def take(self, batch_size: int, timeout: float) -> list[str]:
+        """
+        Moves up to batch_size names to the processing list and returns them, waiting up to
+        timeout seconds for the first one
+
+        :param batch_size: Most names returned
+        :type batch_size: int
+        :param timeout: Seconds to wait when the queue is empty
+        :type timeout: float
+        :rtype: list[str]
+        """
+        first = self.client.blmove(self.name, self.processing, timeout, "RIGHT", "LEFT")
+
+        if first is None:
+            return []
+
+        items = [first]
+
+        while len(items) < batch_size and (item := self.client.lmove(self.name, self.processing, "RIGHT", "LEFT")) is not None:
+            items.append(item)
+
+        return items
+
+    def done(self, *items: str) -> None:
+        with self.client.pipeline() as pipe:
+            for item in items:
+                pipe.lrem(self.processing, 1, item)
+
+            pipe.execute()
+
+    def retry(self, item: str, max_attempts: int) -> bool:
+        """Queues an item again, or moves it to the failed list after max_attempts. Returns False when it failed for good."""
+        entry = json.loads(item)
+        entry["attempts"] += 1
+        retried = entry["attempts"] < max_attempts
+
+        with self.client.pipeline() as pipe:
+            pipe.lrem(self.processing, 1, item)
+            pipe.lpush(self.name if retried else self.failed, json.dumps(entry))
+            pipe.execute()
+
+        return retried
+
+    def recover(self) -> int:
+        """Puts names left in the processing list by a stopped worker back on the queue, returns how many"""
+        recovered = 0
+
+        while self.client.lmove(self.processing, self.name, "LEFT", "RIGHT") is not None:
+            recovered += 1
+
+        return recovered
+
+    def stats(self) -> dict[str, int]:
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in (self.name, self.processing, self.failed):
+                pipe.llen(key)
+
+            queued, processing, failed = pipe.execute()
+
+        return {"queued": queued, "processing": processing, "failed": failed}
+
+
+deletion_queue = DeletionQueue(redis_client)
+
+
+def _in_use(file_paths: Sequence[str]) -> set[str]:
+    try:
+        return set(db.session.scalars(sql.select(Submissions.file_path).where(Submissions.file_path.in_(set(file_paths)))))
+    finally:
+        # The worker mustn't hold a transaction open between batches
+        db.session.close()
+
+
+def schedule_deletion(file_paths: Sequence[str]) -> None:
+    """
+    Hands the stored files of deleted submissions to the deletion worker. When Redis can't be
+    reached they are deleted right away instead.
+
+    :param file_paths: Names of the stored files, after the delete of their submissions committed
+    :type file_paths: Sequence[str]
+    """
+    try:
+        deletion_queue.push(file_paths)
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Couldn't queue {len(file_paths)} files for deletion, deleting them now due to {str(e)}")
+        storage = get_storage()
+        in_use = _in_use(file_paths)
+
+        for file_path in file_paths:
+            if file_path not in in_use:
+                storage.delete(file_path)
+
+
+def process_deletions(batch_size: int, timeout: float, max_attempts: int) -> int:
+    """
+    Deletes the next batch of queued files and returns how many names were taken, 0 when the
+    queue stayed empty for timeout seconds
+
+    :param batch_size: Most names deleted at once
+    :type batch_size: int
+    :param timeout: Seconds to wait for work
+    :type timeout: float
+    :param max_attempts: Times a file is tried before it is moved to the failed list
+    :type max_attempts: int
+    :rtype: int
+    """
+    items = deletion_queue.take(batch_size, timeout)
+
+    if not items:
+        return 0
+
+    entries = [json.loads(item) for item in items]
+    in_use = _in_use([entry["path"] for entry in entries])
+    storage = get_storage()
+    finished = []
+
+    for item, entry in zip(items, entries):
+        try:
+            # A file written again since it was queued belongs to a new upload of the same name
+            if entry["path"] not in in_use and storage.stat(entry["path"]).modified.timestamp() <= entry["queued_at"]:
+                storage.delete(entry["path"])
+
+            finished.append(item)
+
+        except FileNotFoundError:
+            finished.append(item)
+
+        except Exception as e:
+            if deletion_queue.retry(item, max_attempts):
+                current_app.logger.warning(f"Couldn't delete {entry['path']}, retrying due to {str(e)}")
+            else:
+                current_app.logger.error(f"Gave up deleting {entry['path']} after {max_attempts} attempts due to {str(e)}")
+
+    deletion_queue.done(*finished)
+
+    return len(items)
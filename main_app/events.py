@@ -0,0 +1,28 @@
+"""
+Signals sent once a change to submissions or sections is committed, with the ids of the
+section and of the user owning it, so receivers such as the fragment cache can drop what the
+change made stale.
+"""
+from flask import current_app
+from blinker import Namespace, NamedSignal
+
+
+signals = Namespace()
+
+submission_added = signals.signal("submission-added")
+submission_deleted = signals.signal("submission-deleted")
+section_changed = signals.signal("section-changed")
+
+
+def emit(signal: NamedSignal, user_id: int, section_id: int) -> None:
+    """
+    Sends signal for a committed change to a section or its submissions
+
+    :param signal: One of the signals above
+    :type signal: NamedSignal
+    :param user_id: ID of the user owning the section
+    :type user_id: int
+    :param section_id: ID of the section
+    :type section_id: int
+    """
+    signal.send(current_app._get_current_object(), user_id=user_id, section_id=section_id)
@@ -7,6 +7,8 @@ from flask_limiter.util import get_remote_address
 from flask_mail import Mail
 from flask_talisman import Talisman
 import redis
+import sqlalchemy as sql
+import sqlite3
 
 import os
 
@@ -17,6 +19,15 @@ csrf = CSRFProtect()
 mail = Mail()
 talisman = Talisman()
 
+
+@sql.event.listens_for(sql.engine.Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are turned on for each connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 def get_redis_url() -> tuple[str, redis.Redis]:
     redis_host = os.environ.get("REDIS_HOST")
     redis_port = os.environ.get("REDIS_PORT")
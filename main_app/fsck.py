@@ -0,0 +1,185 @@
+"""
+Reconciliation of UPLOAD_PATH with the submissions table.
+
+flask storage-fsck walks UPLOAD_PATH with os.scandir, in sorted order, and looks its files up in
+Submissions.file_path a batch at a time. Then it reads the submissions in id order, a batch at a
+time, and checks that their files exist. Files no submission points at are orphans, submissions
+whose file is gone are missing. Nothing beyond a batch and the entries of one directory is held
+in memory, and the position reached is written to a checkpoint after every batch so an
+interrupted run carries on where it stopped.
+
+Files younger than FSCK_MIN_AGE seconds are left alone, an upload stores its file before its
+submission is committed. The staging directory never holds submissions, its files are orphans
+once they are older than UPLOAD_STAGING_TTL. The trash and the quarantine are skipped.
+"""
+from flask import current_app
+from pathlib import Path
+from typing import Callable, Iterator
+import json
+import os
+import time
+import sqlalchemy as sql
+
+from main_app.extensions import db
+from main_app.models import Submissions
+from main_app.storage import get_storage
+
+
+ORPHAN_ACTIONS = ("report", "quarantine", "delete")
+
+
+def walk_files(directory: str | Path, after: tuple[str, ...] = (), skip: frozenset[str] = frozenset(), parts: tuple[str, ...] = ()) -> Iterator[tuple[tuple[str, ...], os.DirEntry]]:
+    """
+    Yields the files under directory depth first in sorted order, as the parts of their path
+    relative to directory and their entry, starting after the file whose parts are after
+
+    :param directory: Where to start
+    :type directory: str | Path
+    :param after: Parts of the last file of a previous walk, () to start from the beginning
+    :type after: tuple[str, ...]
+    :param skip: Names of top level directories not walked
+    :type skip: frozenset[str]
+    :rtype: Iterator[tuple[tuple[str, ...], os.DirEntry]]
+    """
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+
+    for entry in entries:
+        entry_parts = parts + (entry.name,)
+
+        if entry.is_dir(follow_symlinks=False):
+            # Everything under a directory sorting before the checkpoint was checked already
+            if (not parts and entry.name in skip) or entry_parts < after[:len(entry_parts)]:
+                continue
+
+            yield from walk_files(entry.path, after, skip, entry_parts)
+
+        elif entry.is_file(follow_symlinks=False) and entry_parts > after:
+            yield entry_parts, entry
+
+
+class StorageFsck:
+    def __init__(self, checkpoint: Path, batch_size: int = 1000, orphans: str = "report", report: Callable[[str], None] = print) -> None:
+        config = current_app.config
+
+        self.root = Path(config["UPLOAD_PATH"])
+        self.checkpoint = Path(checkpoint)
+        self.batch_size = batch_size
+        self.orphans = orphans
+        self.report = report
+        self.min_age = config["FSCK_MIN_AGE"]
+        self.staging = config["UPLOAD_STAGING_DIR"]
+        self.staging_ttl = config["UPLOAD_STAGING_TTL"]
+        self.quarantine = config["FSCK_QUARANTINE_DIR"]
+        self.skip = frozenset({config["TRASH_DIR"], self.quarantine})
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.checkpoint.read_text())
+        except FileNotFoundError:
+            return {"phase": "files", "after": [], "after_id": 0, "files": 0, "orphans": 0, "orphan_bytes": 0, "rows": 0, "missing": 0}
+
+    def save(self, state: dict) -> None:
+        # Written aside and renamed so an interrupted write leaves the previous checkpoint
+        partial = self.checkpoint.with_suffix(".tmp")
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        partial.write_text(json.dumps(state))
+        os.replace(partial, self.checkpoint)
+
+    def _handle_orphan(self, parts: tuple[str, ...]) -> None:
+        path = self.root.joinpath(*parts)
+
+        try:
+            if self.orphans == "quarantine":
+                os.renames(path, self.root.joinpath(self.quarantine, *parts))
+            elif self.orphans == "delete":
+                get_storage().delete(str(path))
+        except FileNotFoundError:
+            pass
+
+    def _check_files(self, batch: list[tuple[tuple[str, ...], os.DirEntry]], state: dict) -> None:
+        now = time.time()
+        names = [str(self.root.joinpath(*parts)) for parts, _ in batch if parts[0] != self.staging]
+        known = set(db.session.scalars(sql.select(Submissions.file_path).where(Submissions.file_path.in_(names))))
+        db.session.close()
+
+        for parts, entry in batch:
+            if parts[0] == self.staging:
+                min_age = self.staging_ttl
+            elif str(self.root.joinpath(*parts)) in known:
+                continue
+            else:
+                min_age = self.min_age
+
+            stat = entry.stat(follow_symlinks=False)
+
+            if now - stat.st_mtime < min_age:
+                continue
+
+            self.report(f"orphan {'/'.join(parts)} {stat.st_size}")
+            self._handle_orphan(parts)
+
+            state["orphans"] += 1
+            state["orphan_bytes"] += stat.st_size
+
+        state["files"] += len(batch)
+        state["after"] = list(batch[-1][0])
+
+    def _check_rows(self, after_id: int) -> tuple[int | None, int, int]:
+        rows = db.session.execute(
+            sql.select(Submissions.id, Submissions.file_path)
+            .where(Submissions.id > after_id).order_by(Submissions.id).limit(self.batch_size)
+        ).all()
+        db.session.close()
+
+        if not rows:
+            return None, 0, 0
+
+        storage = get_storage()
+        missing = 0
+
+        for submission_id, file_path in rows:
+            if not storage.exists(file_path):
+                self.report(f"missing {submission_id} {file_path}")
+                missing += 1
+
+        return rows[-1].id, len(rows), missing
+
+    def run(self) -> dict:
+        """
+        Checks the files then the submissions from the checkpoint on, and removes the checkpoint
+        once both are done. Returns the counts of files, orphans, orphan_bytes, rows and missing.
+
+        :rtype: dict
+        """
+        state = self.load()
+
+        if state["phase"] == "files" and self.root.is_dir():
+            batch = []
+
+            for item in walk_files(self.root, tuple(state["after"]), self.skip):
+                batch.append(item)
+
+                if len(batch) == self.batch_size:
+                    self._check_files(batch, state)
+                    self.save(state)
+                    batch = []
+
+            if batch:
+                self._check_files(batch, state)
+
+            state["phase"] = "rows"
+            self.save(state)
+
+        while True:
+            last_id, rows, missing = self._check_rows(state["after_id"])
+
+            if last_id is None:
+                break
+
+            state.update(after_id=last_id, rows=state["rows"] + rows, missing=state["missing"] + missing)
+            self.save(state)
+
+        self.checkpoint.unlink(missing_ok=True)
+
+        return {key: state[key] for key in ("files", "orphans", "orphan_bytes", "rows", "missing")}
@@ -0,0 +1,98 @@
+"""
+Live submission progress for the dashboard.
+
+The signals of main_app.events are published to a Redis channel per lecturer with the new
+counters of the section, and the /live-progress endpoint relays that channel to the dashboard
+as Server-Sent Events. A stream ends after LIVE_PROGRESS_MAX_DURATION seconds and the browser
+reconnects, so a forgotten tab doesn't keep its connection forever.
+
+An open stream waits on Redis for most of its life, which would hold a whole sync worker. The
+app is served by the gevent workers of gunicorn.conf.py, where it only holds a greenlet.
+"""
+from flask import Flask
+from functools import partial
+from typing import Iterator
+import json
+import time
+import redis
+
+from main_app.extensions import db, redis_client
+from main_app.models import Section
+from main_app.events import submission_added, submission_deleted, section_changed
+
+
+# Every open stream holds a connection, they are kept apart from the pool the limiter uses
+pubsub_client = redis.Redis(connection_pool=redis.ConnectionPool(**redis_client.connection_pool.connection_kwargs))
+
+
+def progress_channel(user_id: int) -> str:
+    return f"live-progress:{user_id}"
+
+
+def _publish_progress(event: str, app: Flask, user_id: int, section_id: int) -> None:
+    try:
+        section = db.session.get(Section, section_id)
+
+        message = {"event": event, "section_id": section_id}
+
+        if section is not None:
+            message.update(
+                submission_count=section.submission_count,
+                expected_submission=section.expected_submission,
+                total_bytes=section.total_bytes
+            )
+
+        redis_client.publish(progress_channel(user_id), json.dumps(message))
+
+    except Exception as e:
+        # The change is committed already, the dashboard catches up on its next load
+        app.logger.warning(f"Couldn't publish progress of section {section_id} due to {str(e)}")
+
+
+_receivers = {signal: partial(_publish_progress, signal.name) for signal in (submission_added, submission_deleted, section_changed)}
+
+
+def register_live_progress() -> None:
+    for signal, receiver in _receivers.items():
+        signal.connect(receiver, weak=False)
+
+
+def stream_progress(user_id: int, heartbeat: float, max_duration: float, retry: int) -> Iterator[str]:
+    """
+    Subscribes to the progress events of a user and returns them as Server-Sent Events, with a
+    comment every heartbeat seconds so proxies keep the connection open, until max_duration
+    seconds have passed. Subscribing happens right away so Redis errors reach the caller.
+
+    :param user_id: ID of the lecturer
+    :type user_id: int
+    :param heartbeat: Seconds between keep alive comments
+    :type heartbeat: float
+    :param max_duration: Seconds before the stream ends and the browser reconnects
+    :type max_duration: float
+    :param retry: Milliseconds the browser waits before reconnecting
+    :type retry: int
+    :rtype: Iterator[str]
+    """
+    pubsub = pubsub_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress_channel(user_id))
+
+    def events() -> Iterator[str]:
+        try:
+            yield f"retry: {retry}\n\n"
+
+            deadline = time.monotonic() + max_duration
+
+            while (remaining := deadline - time.monotonic()) > 0:
+                message = pubsub.get_message(timeout=min(heartbeat, remaining))
+
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                data = json.loads(message["data"])
+                yield f"event: {data['event']}\ndata: {message['data']}\n\n"
+
+        finally:
+            pubsub.close()
+
+    return events()
@@ -1,7 +1,8 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import request, render_template, redirect, url_for
+from flask import request, render_template, redirect, url_for, make_response
 from flask_limiter.errors import RateLimitExceeded
+from werkzeug.exceptions import HTTPException
 
 def set_logger(app, homedir):
     """
@@ -141,4 +142,25 @@ def register_handlers(app):
         """This handles 429 status_code"""
         app.logger.warning(f"Too many request: {error} from {request.path}", exc_info=True)
 
-        return render_template("errors/429.html", error=error)
\ No newline at end of file
+        return render_template("errors/429.html", error=error)
+
+
+    @app.errorhandler(429)
+    def too_many_uploads(error):
+        """This handles 429 status_code raised by the app itself, such as a busy section"""
+        app.logger.warning(f"Too many request: {error} from {request.path}")
+
+        response = make_response(render_template("errors/429.html", error=error), 429)
+
+        if error.retry_after is not None:
+            response.headers["Retry-After"] = str(error.retry_after)
+
+        return response
+
+
+    @app.errorhandler(HTTPException)
+    def http_error(error):
+        """This logs the HTTP errors without a page of their own and returns their default page"""
+        app.logger.info(f"{error.code} error: {request.path} from {request.remote_addr}")
+
+        return error
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Admission of form uploads before their body is read.
+
+CSRFProtect reads request.form before any view runs, which parses the whole multipart body and
+spools its file into the staging directory. admit_upload runs ahead of it and turns an upload
+away from what the request line and headers already tell: a link leading to no section, a
+Content-Length that can't hold a file between MIN_CONTENT_LENGTH and MAX_CONTENT_LENGTH, or a
+section already receiving UPLOAD_SECTION_CONCURRENCY uploads. The body of a rejected upload is
+never read. An upload of the wrong size goes back to the form with the flash the form's size
+check gives, the others get the app's error pages.
+
+The uploads of a section in progress are a Redis sorted set of tokens scored by when they
+expire. A token is removed when its request is torn down, and one a crashed worker left behind
+expires after UPLOAD_SLOT_TTL seconds.
+"""
+from flask import Flask, Response, abort, current_app, flash, g, redirect, request
+import time
+import uuid
+import redis
+
+from main_app.extensions import redis_client
+from .upload_links import upload_links
+
+
+ADMITTED_ENDPOINTS = {"main_bp.upload_file"}
+
+
+class UploadSlots:
+    def __init__(self, client: redis.Redis, prefix: str = "upload-slots") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, section_id: int) -> str:
+        return f"{self.prefix}:{section_id}"
+
+    def acquire(self, section_id: int, limit: int, ttl: int) -> str | None:
+        """
+        Takes one of the limit upload slots of a section for ttl seconds and returns its token,
+        None when they are all taken
+
+        :param section_id: ID of the section
+        :type section_id: int
+        :param limit: Most uploads to the section at once
+        :type limit: int
+        :param ttl: Seconds the slot is held if it is never released
+        :type ttl: int
+        :rtype: str | None
+        """
+        key = self._key(section_id)
+        token = uuid.uuid4().hex
+        now = time.time()
+
+        with self.client.pipeline() as pipe:
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {token: now + ttl})
+            pipe.zcard(key)
+            pipe.expire(key, ttl)
+            _, _, held, _ = pipe.execute()
+
+        if held > limit:
+            self.client.zrem(key, token)
+            return None
+
+        return token
+
+    def release(self, section_id: int, token: str) -> None:
+        self.client.zrem(self._key(section_id), token)
+
+
+upload_slots = UploadSlots(redis_client)
+
+
+def admit_upload() -> Response | None:
+    """Turns away uploads that would be rejected anyway, before their body is read"""
+    if request.method != "POST" or request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+
+    config = current_app.config
+    section = upload_links.resolve(request.view_args["username"], request.view_args["section_name"])
+
+    if section is None:
+        current_app.logger.warning("An upload was sent to a wrong url")
+        abort(404)
+
+    length = request.content_length
+
+    # Browsers always send it with a form, a chunked body would have to be read to be measured
+    if length is None:
+        current_app.logger.warning(f"An upload to section {section.id} came without a Content-Length")
+        abort(411)
+
+    # The file is only part of the body, a smaller body can't hold a large enough file. Either
+    # way the student is sent back to the form with the message its size check would give.
+    if not config["MIN_CONTENT_LENGTH"] <= length <= config["MAX_CONTENT_LENGTH"]:
+        current_app.logger.warning(f"An upload of {length} bytes to section {section.id} was out of bounds")
+        flash("File must be between 10K and 25MB", "error")
+        return redirect(request.path)
+
+    try:
+        token = upload_slots.acquire(section.id, config["UPLOAD_SECTION_CONCURRENCY"], config["UPLOAD_SLOT_TTL"])
+
+        if token is None:
+            current_app.logger.warning(f"Section {section.id} is already receiving {config['UPLOAD_SECTION_CONCURRENCY']} uploads")
+            abort(429, description="This section is receiving many uploads right now, please try again in a few seconds.", retry_after=5)
+
+        g.upload_slot = (section.id, token)
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Couldn't count the uploads to section {section.id}, admitting it due to {str(e)}")
+
+    g.upload_section = section
+
+    return None
+
+
+def release_upload_slot(error: BaseException | None = None) -> None:
+    slot = g.pop("upload_slot", None)
+
+    if slot is None:
+        return
+
+    try:
+        upload_slots.release(*slot)
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Couldn't release an upload slot of section {slot[0]}, it expires by itself due to {str(e)}")
+
+
+def register_upload_admission(app: Flask) -> None:
+    """Must be called before csrf.init_app, its before_request hook reads the body"""
+    app.before_request(admit_upload)
+    app.teardown_request(release_upload_slot)
@@ -0,0 +1,528 @@
+from flask import current_app
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence, NamedTuple
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+
+from main_app.models import Submissions
+from main_app.storage import Storage, LocalStorage, get_storage
+
+
+class ChunkBuffer:
+    """
+    A write-only sink that zipfile writes the archive into.
+
+    It is deliberately not seekable so zipfile falls back to data descriptors, which lets
+    every member be written in a single pass. The generator drains it after every write,
+    so it never holds more than one chunk of compressed output.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+
+        return data
+
+
+class CompressionPolicy(NamedTuple):
+    """
+    Decides how each member of a section archive is compressed.
+
+    mode is either "adaptive", "deflated" or "stored". In adaptive mode members whose extension
+    is in stored_extensions are stored as is, and every other member is deflated only if a
+    probe of its first probe_size bytes shrinks below min_ratio of its size.
+    """
+    mode: str = "adaptive"
+    level: int = 6
+    stored_extensions: frozenset[str] = frozenset()
+    probe_size: int = 64 * 1024
+    min_ratio: float = 0.9
+
+    @classmethod
+    def from_config(cls, config) -> "CompressionPolicy":
+        return cls(
+            mode=config["ARCHIVE_COMPRESSION"],
+            level=config["ARCHIVE_COMPRESSION_LEVEL"],
+            stored_extensions=frozenset(config["ARCHIVE_STORED_EXTENSIONS"]),
+            probe_size=config["ARCHIVE_PROBE_SIZE"],
+            min_ratio=config["ARCHIVE_MIN_RATIO"]
+        )
+
+
+def choose_compression(
+    path: str | Path, policy: CompressionPolicy, arcname: str | None = None, storage: Storage | None = None
+) -> int:
+    """
+    Returns zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED for a member
+
+    :param path: Name of the member in storage
+    :type path: str | Path
+    :param policy: The compression policy of the archive
+    :type policy: CompressionPolicy
+    :param arcname: Name of the member in the archive, its extension is used instead of the path's
+    :type arcname: str | None
+    :param storage: Where the member is stored, plain file paths if None
+    :type storage: Storage | None
+    :rtype: int
+    """
+    if policy.mode == "stored":
+        return zipfile.ZIP_STORED
+
+    if policy.mode == "deflated":
+        return zipfile.ZIP_DEFLATED
+
+    # docx, pptx and odt are zip containers already, deflating them again gains nothing
+    if Path(arcname or path).suffix.lower().lstrip(".") in policy.stored_extensions:
+        return zipfile.ZIP_STORED
+
+    sample = b"".join((storage or LocalStorage()).read_range(str(path), 0, policy.probe_size))
+
+    if not sample:
+        return zipfile.ZIP_STORED
+
+    # A fast level is enough to tell text from already compressed data
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+
+    return zipfile.ZIP_DEFLATED if ratio < policy.min_ratio else zipfile.ZIP_STORED
+
+
+def archive_members(files: Sequence[Submissions], storage: Storage | None = None) -> list[tuple[str, str]]:
+    """
+    Returns the (name, arcname) pair of every submission that goes into a section archive.
+
+    The files are checked before the first byte is streamed so a missing file is still
+    reported to the user instead of cutting the download short.
+
+    :param files: Submissions of the section
+    :type files: Sequence[Submissions]
+    :param storage: Where the files are stored, plain file paths if None
+    :type storage: Storage | None
+    :return: A list of (name, arcname)
+    :rtype: list[tuple[str, str]]
+    """
+    storage = storage or LocalStorage()
+    members = []
+
+    for file in files:
+        if not storage.exists(file.file_path):
+            raise FileNotFoundError(file.file_path)
+
+        members.append((file.file_path, file.original_filename))
+
+    return members
+
+
+def member_info(storage: Storage, name: str, arcname: str, policy: CompressionPolicy) -> zipfile.ZipInfo:
+    """Returns the ZipInfo of a stored file, like ZipInfo.from_file does for a local one"""
+    stored = storage.stat(name)
+
+    zinfo = zipfile.ZipInfo(arcname, date_time=stored.modified.astimezone().timetuple()[:6])
+    zinfo.file_size = stored.size
+    zinfo.external_attr = 0o644 << 16
+    zinfo.compress_type = choose_compression(name, policy, arcname, storage)
+
+    # Public since Python 3.13, before it a member deflates at zlib's default level
+    if hasattr(zipfile.ZipInfo, "compress_level"):
+        zinfo.compress_level = policy.level
+
+    return zinfo
+
+
+def stream_zip(
+    members: Iterable[tuple[str | Path, str]], chunk_size: int = 64 * 1024,
+    policy: CompressionPolicy = CompressionPolicy(), storage: Storage | None = None
+) -> Iterator[bytes]:
+    """
+    Yields a ZIP archive of the members chunk by chunk.
+
+    Members are written with data descriptors and ZIP64 records are added whenever a member
+    or the archive itself outgrows the classic ZIP limits, so the archive size is unbounded
+    while memory stays bounded by chunk_size.
+
+    :param members: An iterable of (name, arcname)
+    :type members: Iterable[tuple[str | Path, str]]
+    :param chunk_size: Number of bytes read from a member at a time
+    :type chunk_size: int
+    :param policy: Decides whether each member is stored or deflated
+    :type policy: CompressionPolicy
+    :param storage: Where the members are stored, plain file paths if None
+    :type storage: Storage | None
+    :return: An iterator of archive bytes
+    :rtype: Iterator[bytes]
+    """
+    storage = storage or LocalStorage()
+    buffer = ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for name, arcname in members:
+            zinfo = member_info(storage, str(name), arcname, policy)
+
+            with storage.open(str(name)) as src, zipf.open(zinfo, "w") as dest:
+                while chunk := src.read(chunk_size):
+                    dest.write(chunk)
+
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory and end records
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+
+def submission_set_key(files: Sequence[Submissions]) -> str:
+    """
+    Returns a digest that identifies the set of submissions in a section archive
+
+    :param files: Submissions of the section
+    :type files: Sequence[Submissions]
+    :rtype: str
+    """
+    return _entries_key([[file.id, file.file_path] for file in files])
+
+
+def _entries_key(entries: list) -> str:
+    digest = hashlib.sha256()
+
+    for submission_id, file_path in sorted(entries):
+        digest.update(f"{submission_id}:{file_path}\n".encode())
+
+    return digest.hexdigest()
+
+
+class SectionArchiveCache:
+    """
+    Keeps a finished ZIP of every section on disk so repeat downloads are a plain file send.
+
+    Each section has three files in the cache directory: <id>.zip, <id>.json (the manifest of
+    submissions in the archive and their key) and <id>.lock. The lock is an flock held by the
+    build of the archive, which runs in a thread of its own and writes <id>.zip.<key>.tmp.
+    Every download of the same submissions, the one that started the build included, follows
+    that file as it grows, so concurrent downloads share one build and a client going away
+    doesn't cut it short. Archives are never modified in place; the finished file is swapped
+    in with os.replace so a download that is already being sent keeps reading a consistent
+    file.
+
+    Once the archives outgrow max_bytes, the least recently downloaded ones are dropped.
+    """
+
+    def __init__(
+        self, root: Path, policy: CompressionPolicy, chunk_size: int = 64 * 1024, max_bytes: int | None = None,
+        wait: float = 60, storage: Storage | None = None, logger: logging.Logger | None = None
+    ) -> None:
+        self.root = Path(root)
+        self.policy = policy
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.wait = wait
+        self.storage = storage or LocalStorage()
+        self.logger = logger or logging.getLogger(__name__)
+
+    def _paths(self, section_id: int) -> tuple[Path, Path, Path]:
+        return (
+            self.root / f"{section_id}.zip",
+            self.root / f"{section_id}.json",
+            self.root / f"{section_id}.lock"
+        )
+
+    def _lock(self, section_id: int):
+        """
+        Returns an open lock file holding the section's flock, or None if it is busy. A lock
+        file that was removed while it was being opened counts as busy.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._paths(section_id)[2]
+        lock_file = open(path, "a")
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                return lock_file
+
+        except (BlockingIOError, FileNotFoundError):
+            pass
+
+        lock_file.close()
+        return None
+
+    def _read_manifest(self, section_id: int) -> dict | None:
+        archive, manifest, _ = self._paths(section_id)
+
+        try:
+            with open(manifest) as file:
+                data = json.load(file)
+
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return data if archive.exists() else None
+
+    def _write_manifest(self, section_id: int, entries: list) -> None:
+        manifest = self._paths(section_id)[1]
+        tmp = manifest.with_name(f"{manifest.name}.{uuid.uuid4().hex}.tmp")
+
+        tmp.write_text(json.dumps({"key": _entries_key(entries), "entries": entries}))
+        os.replace(tmp, manifest)
+
+    def lookup(self, section_id: int, key: str) -> Path | None:
+        """Returns the cached archive if it holds exactly the submission set identified by key"""
+        data = self._read_manifest(section_id)
+
+        if not data or data.get("key") != key:
+            return None
+
+        archive = self._paths(section_id)[0]
+
+        try:
+            # Its mtime is when it was last downloaded, eviction goes by it
+            os.utime(archive)
+        except FileNotFoundError:
+            return None
+
+        return archive
+
+    def _tmp_path(self, section_id: int, key: str) -> Path:
+        return self.root / f"{section_id}.zip.{key}.tmp"
+
+    def open_or_build(self, section_id: int, files: Sequence[Submissions]) -> Path | Iterator[bytes]:
+        """
+        Returns the path of an up to date cached archive, or an iterator that streams the
+        archive while it is built into the cache.
+
+        If another request is already building the archive of the same submissions, the
+        iterator follows that build instead of starting a second one.
+
+        :param section_id: ID of the section
+        :type section_id: int
+        :param files: Submissions of the section
+        :type files: Sequence[Submissions]
+        :rtype: Path | Iterator[bytes]
+        """
+        key = submission_set_key(files)
+        cached = self.lookup(section_id, key)
+
+        if cached:
+            return cached
+
+        members = archive_members(files, self.storage)
+        entries = [[file.id, file.file_path] for file in files]
+        tmp = self._tmp_path(section_id, key)
+
+        lock_file = self._lock(section_id)
+
+        if lock_file is None:
+            try:
+                return self._follow(section_id, open(tmp, "rb"))
+
+            except FileNotFoundError:
+                # The build just finished, or it is one of other submissions
+                return self.lookup(section_id, key) or stream_zip(members, self.chunk_size, self.policy, self.storage)
+
+        # The holder before us may have just finished the same archive
+        cached = self.lookup(section_id, key)
+
+        if cached:
+            lock_file.close()
+            return cached
+
+        out = open(tmp, "wb")
+        src = open(tmp, "rb")
+
+        threading.Thread(target=self._build, args=(section_id, members, entries, lock_file, out), daemon=True).start()
+
+        return self._follow(section_id, src)
+
+    def _build(self, section_id: int, members: list[tuple[str, str]], entries: list, lock_file, out) -> None:
+        archive = self._paths(section_id)[0]
+        tmp = Path(out.name)
+
+        try:
+            with out:
+                for chunk in stream_zip(members, self.chunk_size, self.policy, self.storage):
+                    out.write(chunk)
+                    out.flush()
+
+                    # Under gevent workers the build is a greenlet, the downloads following it run meanwhile
+                    time.sleep(0)
+
+            os.replace(tmp, archive)
+            self._write_manifest(section_id, entries)
+            self.evict(keep=section_id)
+
+        except Exception as e:
+            self.logger.warning(f"Couldn't build the archive of section {section_id} due to {str(e)}", exc_info=True)
+
+        finally:
+            tmp.unlink(missing_ok=True)
+            lock_file.close()
+
+    def _follow(self, section_id: int, src) -> Iterator[bytes]:
+        """
+        Yields what a build writes into src as it is written. The build is over once the lock
+        is free; an archive that doesn't end in its end of central directory record failed.
+        """
+        tail = b""
+        finished = False
+        idle_since = time.monotonic()
+
+        with src:
+            while True:
+                chunk = src.read(self.chunk_size)
+
+                if chunk:
+                    tail = (tail + chunk)[-22:]
+                    idle_since = time.monotonic()
+                    yield chunk
+                    continue
+
+                if finished:
+                    break
+
+                lock_file = self._lock(section_id)
+
+                if lock_file is not None:
+                    # Whatever it wrote after the last read is still sent
+                    lock_file.close()
+                    finished = True
+                    continue
+
+                if time.monotonic() - idle_since > self.wait:
+                    raise OSError(f"The archive build of section {section_id} stalled")
+
+                time.sleep(0.05)
+
+        if not tail.startswith(b"PK\x05\x06"):
+            raise OSError(f"The archive build of section {section_id} failed")
+
+    def evict(self, keep: int | None = None) -> None:
+        """
+        Drops the least recently downloaded archives until the cache fits in max_bytes, then
+        removes the lock files of sections without an archive, such as deleted ones, and the
+        files of builds that are no longer running
+
+        :param keep: ID of a section whose archive is never dropped, e.g. the one just built
+        :type keep: int | None
+        """
+        archives = []
+
+        for archive in self.root.glob("*.zip"):
+            try:
+                stat = archive.stat()
+            except FileNotFoundError:
+                continue
+
+            archives.append((stat.st_mtime, stat.st_size, archive))
+
+        total = sum(size for _, size, _ in archives)
+
+        for _, size, archive in sorted(archives):
+            if self.max_bytes is None or total <= self.max_bytes:
+                break
+
+            if archive.stem == str(keep):
+                continue
+
+            self.invalidate(int(archive.stem))
+            total -= size
+
+        for lock in self.root.glob("*.lock"):
+            if not lock.with_suffix(".zip").exists():
+                self._remove_lock(int(lock.stem))
+
+        # Left behind by a worker that died during a build
+        for tmp in self.root.glob("*.tmp"):
+            section_id = int(tmp.name.split(".")[0])
+
+            if section_id == keep:
+                continue
+
+            lock_file = self._lock(section_id)
+
+            if lock_file is not None:
+                tmp.unlink(missing_ok=True)
+                lock_file.close()
+
+    def _remove_lock(self, section_id: int) -> None:
+        """Removes the lock file of a section unless a build holds it"""
+        lock = self._paths(section_id)[2]
+
+        if not lock.exists():
+            return
+
+        lock_file = self._lock(section_id)
+
+        if lock_file is None:
+            return
+
+        try:
+            lock.unlink(missing_ok=True)
+        finally:
+            lock_file.close()
+
+    def invalidate(self, section_id: int) -> None:
+        """Removes the cached archive of a section, and its lock file unless a build holds it"""
+        archive, manifest, _ = self._paths(section_id)
+
+        manifest.unlink(missing_ok=True)
+        archive.unlink(missing_ok=True)
+        self._remove_lock(section_id)
+
+
+def section_archive_cache() -> SectionArchiveCache | None:
+    """
+    Returns the archive cache configured on the current app or None if caching is turned off
+    """
+    if not current_app.config["ARCHIVE_CACHE_ENABLED"]:
+        return None
+
+    return SectionArchiveCache(
+        current_app.config["ARCHIVE_CACHE_PATH"],
+        CompressionPolicy.from_config(current_app.config),
+        chunk_size=current_app.config["ARCHIVE_CHUNK_SIZE"],
+        max_bytes=current_app.config["ARCHIVE_CACHE_MAX_BYTES"],
+        wait=current_app.config["ARCHIVE_CACHE_WAIT"],
+        storage=get_storage(),
+        logger=current_app.logger
+    )
+
+
+def invalidate_section_archive(section_id: int | str) -> None:
+    """
+    Drops the cached archive of a section after its submissions changed. A new submission
+    isn't appended to it, copying the whole archive on every upload costs more than the next
+    download rebuilding it.
+    """
+    cache = section_archive_cache()
+
+    if cache is None:
+        return
+
+    try:
+        cache.invalidate(int(section_id))
+    except Exception as e:
+        current_app.logger.warning(f"Couldn't invalidate the archive of section {section_id} due to {str(e)}", exc_info=True)
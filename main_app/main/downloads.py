@@ -0,0 +1,264 @@
+"""
+Sending stored files to the browser.
+
+With DOWNLOAD_BACKEND set to "x-accel" the app only checks ownership and answers with an
+X-Accel-Redirect header, nginx then sends the file from an internal location, e.g.
+
+    location /protected/uploads/ {
+        internal;
+        alias /var/www/uploaded_files/;
+    }
+
+    location /protected/archives/ {
+        internal;
+        alias /var/www/archive_cache/;
+    }
+
+"x-sendfile" does the same for Apache's mod_xsendfile (and lighttpd) using the absolute path.
+"local" sends the file from Python and is what development and tests use.
+
+Submission downloads are conditional: the stored checksum is a strong ETag and uploaded_at is
+Last-Modified, so If-None-Match/If-Modified-Since answer 304 and If-Range decides whether a
+Range request is honoured. With the local backend single and multiple byte ranges are served
+by the app; with a proxy backend the proxy serves the ranges itself. Files that aren't on a
+local disk, like those in S3 storage, are always streamed by the app.
+"""
+from flask import current_app, send_file, request, Response
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import quote
+import uuid
+
+from main_app.storage import Storage, get_storage
+from .helper import content_disposition
+
+
+def internal_location(path: str | Path) -> str | None:
+    """
+    Maps a stored file to the internal nginx location that serves it
+
+    :param path: Path to a file under UPLOAD_PATH or ARCHIVE_CACHE_PATH
+    :type path: str | Path
+    :return: The internal URI or None if the file is outside both directories
+    :rtype: str | None
+    """
+    path = Path(path).resolve()
+
+    roots = (
+        (current_app.config["UPLOAD_PATH"], current_app.config["X_ACCEL_UPLOAD_PREFIX"]),
+        (current_app.config["ARCHIVE_CACHE_PATH"], current_app.config["X_ACCEL_ARCHIVE_PREFIX"]),
+    )
+
+    for root, prefix in roots:
+        try:
+            relative = path.relative_to(Path(root).resolve())
+        except ValueError:
+            continue
+
+        return f"{prefix.rstrip('/')}/{quote(relative.as_posix())}"
+
+    return None
+
+
+def send_stored_file(path: str | Path, *, download_name: str, mimetype: str, conditional: bool = True) -> Response:
+    """
+    Sends a stored file as an attachment through the configured DOWNLOAD_BACKEND. Ownership
+    must be checked by the caller before this is called.
+
+    :param path: Path to the file
+    :type path: str | Path
+    :param download_name: The name the browser saves the file as
+    :type download_name: str
+    :param mimetype: Mimetype of the file
+    :type mimetype: str
+    :param conditional: Let send_file answer conditional and Range requests on its own
+    :type conditional: bool
+    :rtype: Response
+    """
+    backend = current_app.config["DOWNLOAD_BACKEND"]
+
+    if backend == "x-accel":
+        location = internal_location(path)
+
+        if location is not None:
+            response = Response(mimetype=mimetype)
+            response.headers["X-Accel-Redirect"] = location
+            response.headers["Content-Disposition"] = content_disposition(download_name)
+
+            return response
+
+        current_app.logger.warning(f"{path} is outside every internal location, sending it from the app")
+
+    elif backend == "x-sendfile":
+        response = Response(mimetype=mimetype)
+        response.headers["X-Sendfile"] = str(Path(path).resolve())
+        response.headers["Content-Disposition"] = content_disposition(download_name)
+
+        return response
+
+    return send_file(
+        path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+        conditional=conditional, etag=conditional
+    )
+
+
+def _satisfiable_ranges(size: int) -> list[tuple[int, int]] | None:
+    """
+    Returns the requested byte ranges clamped to the file size as (start, stop) pairs, an
+    empty list if none of them can be satisfied, or None if the Range header should be ignored
+    """
+    requested = request.range
+
+    if requested is None or requested.units != "bytes":
+        return None
+
+    # Too many ranges is more likely abuse than a download manager, send the whole file
+    if len(requested.ranges) > current_app.config["DOWNLOAD_MAX_RANGES"]:
+        return None
+
+    ranges = []
+
+    for start, stop in requested.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+
+        if start < stop:
+            ranges.append((start, stop))
+
+    return ranges
+
+
+def _if_range_matches(etag: str | None, last_modified: datetime | None) -> bool:
+    if_range = request.if_range
+
+    if if_range.etag is None and if_range.date is None:
+        return True
+
+    # If-Range needs a strong comparison
+    if if_range.etag is not None:
+        return etag is not None and if_range.etag == etag
+
+    return last_modified is not None and if_range.date == last_modified.replace(microsecond=0)
+
+
+def _is_not_modified(etag: str | None, last_modified: datetime | None) -> bool:
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+
+    return False
+
+
+def send_conditional_file(
+    path: str | Path, *, download_name: str, mimetype: str,
+    etag: str | None = None, last_modified: datetime | None = None, storage: Storage | None = None
+) -> Response:
+    """
+    Sends a stored file honouring conditional and Range requests so interrupted downloads can
+    be resumed instead of starting again from zero.
+
+    :param path: Name of the file in storage
+    :type path: str | Path
+    :param download_name: The name the browser saves the file as
+    :type download_name: str
+    :param mimetype: Mimetype of the file
+    :type mimetype: str
+    :param etag: A strong validator of the content, mostly the stored checksum
+    :type etag: str | None
+    :param last_modified: When the content was last changed
+    :type last_modified: datetime | None
+    :param storage: Where the file is stored, the configured storage if None
+    :type storage: Storage | None
+    :rtype: Response
+    """
+    storage = storage or get_storage()
+    name = str(path)
+    local = storage.local_path(name)
+    chunk_size = current_app.config["DOWNLOAD_CHUNK_SIZE"]
+
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    def with_validators(response: Response) -> Response:
+        if etag is not None:
+            response.set_etag(etag)
+
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+        response.headers["Accept-Ranges"] = "bytes"
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+        return response
+
+    if _is_not_modified(etag, last_modified):
+        return with_validators(Response(status=304))
+
+    def whole_file() -> Response:
+        if local is not None:
+            return send_stored_file(local, download_name=download_name, mimetype=mimetype, conditional=False)
+
+        # Not on this machine, stream it from the storage backend
+        size = storage.stat(name).size
+        response = Response(storage.read_range(name, 0, size, chunk_size), mimetype=mimetype, direct_passthrough=True)
+        response.headers["Content-Length"] = str(size)
+        response.headers["Content-Disposition"] = content_disposition(download_name)
+
+        return response
+
+    # The proxy backends serve Range requests of the files they can reach themselves
+    if (current_app.config["DOWNLOAD_BACKEND"] != "local" and local is not None) or request.range is None:
+        return with_validators(whole_file())
+
+    size = storage.stat(name).size
+    ranges = _satisfiable_ranges(size) if _if_range_matches(etag, last_modified) else None
+
+    if ranges is None:
+        return with_validators(whole_file())
+
+    if not ranges:
+        response = Response(status=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+
+        return with_validators(response)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+
+        response = Response(storage.read_range(name, start, stop, chunk_size), status=206, mimetype=mimetype, direct_passthrough=True)
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        response.headers["Content-Length"] = str(stop - start)
+        response.headers["Content-Disposition"] = content_disposition(download_name)
+
+        return with_validators(response)
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+        ).encode() for start, stop in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    length = sum(len(head) + (stop - start) + 2 for head, (start, stop) in zip(parts, ranges)) + len(closing)
+
+    def multipart() -> Iterator[bytes]:
+        for head, (start, stop) in zip(parts, ranges):
+            yield head
+            yield from storage.read_range(name, start, stop, chunk_size)
+            yield b"\r\n"
+
+        yield closing
+
+    response = Response(multipart(), status=206, direct_passthrough=True)
+    response.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    response.headers["Content-Length"] = str(length)
+    response.headers["Content-Disposition"] = content_disposition(download_name)
+
+    return with_validators(response)
@@ -0,0 +1,33 @@
+class UploadNotFound(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadChecksumMismatch(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadLocked(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadContentMismatch(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class InvalidCursor(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
@@ -1,10 +1,19 @@
 from flask import current_app
 from pathlib import Path
 from main_app.extensions import db
-from main_app.models import Submissions, Section
+from main_app.models import Submissions, Section, User
+from main_app.storage import get_storage
+from main_app.deletions import schedule_deletion
+from .staging import StagedFile
+from .sniffing import check_container, detect_content_type
+from .trash import move_to_trash, restore_from_trash
 import sqlalchemy as sql
-import shutil
-from typing import Sequence, Callable
+import functools
+import hashlib
+import os
+import tempfile
+import unicodedata
+from urllib.parse import quote
 
 
 def allowed_extension(filename: str) -> bool:
@@ -17,7 +26,7 @@ def allowed_extension(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in current_app.config["UPLOAD_EXTENSIONS"]
 
 
-def save_uploaded_file(file, filename: str, section: str) -> Path:
+def save_uploaded_file(file, filename: str, section: str) -> str:
     """
     This function is responsible for saving files to their respective directory
 
@@ -25,21 +34,30 @@ def save_uploaded_file(file, filename: str, section: str) -> Path:
         file: File object\n
         filename: Name of the file mostly gotten form secure_filname() function.\n
         section: The name of the section that will be used as a directory where the file will be saved
-    """
-    file_path = Path(current_app.config["UPLOAD_PATH"]) / section / filename
 
+    :returns:
+        The name of the stored file, what goes into Submissions.file_path
+    """
     try:
-        # Create a directory if it doesn't exist
-        file_path.parent.mkdir(parents=True, exist_ok=True)
+        # A staged upload is only moved into place
+        if isinstance(file.stream, StagedFile):
+            return store_file(file.stream.path, filename, section, file.stream.checksum)[0]
 
-        #Checks if the file already exist
-        if file_path.exists():
-            raise FileExistsError
+        if is_content_addressed():
+            staging = Path(current_app.config["UPLOAD_PATH"]) / current_app.config["UPLOAD_STAGING_DIR"]
+            staging.mkdir(parents=True, exist_ok=True)
 
-        # Save the file
-        file.save(file_path)
+            fd, name = tempfile.mkstemp(dir=staging, suffix=".upload")
+            os.close(fd)
 
-        return file_path
+            try:
+                file.save(name)
+                return store_file(Path(name), filename, section)[0]
+            finally:
+                Path(name).unlink(missing_ok=True)
+
+        # Save the file
+        return get_storage().put_stream(f"{section}/{filename}", file.stream)
     
     except FileExistsError:
         raise FileExistsError
@@ -49,6 +67,129 @@ def save_uploaded_file(file, filename: str, section: str) -> Path:
         raise Exception
     
 
+def is_content_addressed() -> bool:
+    """Returns True if uploads are stored as blobs named by their sha256 (STORAGE_MODE = "cas")"""
+    return current_app.config["STORAGE_MODE"] == "cas"
+
+
+def blob_key(checksum: str) -> str:
+    """
+    Returns the key of the blob of a content, fanned out by the first two bytes of its
+    checksum so no directory grows too large. e.g. .blobs/9f/86/9f86d081...
+
+    :param checksum: sha256 hex digest of the content
+    :type checksum: str
+    :rtype: str
+    """
+    return f"{current_app.config['BLOB_DIR']}/{checksum[:2]}/{checksum[2:4]}/{checksum}"
+
+
+def blob_references(file_path: str) -> int:
+    """
+    Returns how many submissions point at a stored file. It is the reference count of a blob.
+
+    :param file_path: Name of the stored file
+    :type file_path: str
+    :rtype: int
+    """
+    return db.session.scalar(
+        sql.select(sql.func.count(Submissions.id)).where(Submissions.file_path == str(file_path))
+    )
+
+
+def store_file(source: Path, filename: str, section: str, checksum: str | None = None) -> tuple[str, str]:
+    """
+    Moves a received file into storage and returns its name and sha256, what goes into
+    Submissions.file_path and Submissions.checksum. With local storage the file is renamed,
+    so source must be on the same filesystem as UPLOAD_PATH.
+
+    With STORAGE_MODE = "cas" the file becomes the blob of its checksum, or is dropped if
+    that content is stored already. Otherwise it's stored as section/filename.
+
+    :param source: The received file
+    :type source: Path
+    :param filename: Name of the file mostly gotten form secure_filname() function
+    :type filename: str
+    :param section: Name of the section the file is submitted to
+    :type section: str
+    :param checksum: sha256 of the file if it is known already
+    :type checksum: str | None
+    :raises FileExistsError: If the section already has a file with that name
+    :rtype: tuple[str, str]
+    """
+    # Hashed before the move, every stored file has its checksum recorded with it
+    checksum = checksum or file_checksum(source)
+
+    if is_content_addressed():
+        # Keeps a filename unique in its section like the directory layout does
+        if db.session.scalar(sql.select(Submissions.id).join(Submissions.section).where(
+            (Section.section_name == section) & (Submissions.original_filename == filename)
+        ).limit(1)) is not None:
+            raise FileExistsError(f"{filename} already exists in {section}")
+
+        return get_storage().put_file(blob_key(checksum), source, exist_ok=True), checksum
+
+    return get_storage().put_file(f"{section}/{filename}", source), checksum
+
+
+def uploaded_file_details(file, file_path: str) -> tuple[int, str]:
+    """
+    Returns the size and sha256 of a saved upload. Staged uploads were measured while they were
+    received, anything else is read back from storage.
+
+    :param file: File object that was saved
+    :param file_path: Name of the stored file
+    :type file_path: str
+    :rtype: tuple[int, str]
+    """
+    if isinstance(file.stream, StagedFile):
+        return file.stream.size, file.stream.checksum
+
+    storage = get_storage()
+
+    return storage.stat(file_path).size, storage.checksum(file_path)
+
+
+def uploaded_content_type(file, filename: str) -> str | None:
+    """
+    Returns the MIME type of an upload from its content, None when the content doesn't match the
+    extension of filename. Staged uploads were sniffed while they were received.
+
+    :param file: File object of the upload
+    :param filename: Name of the file mostly gotten form secure_filname() function
+    :type filename: str
+    :rtype: str | None
+    """
+    extension = filename.rsplit(".", 1)[1].lower()
+
+    if not isinstance(file.stream, StagedFile):
+        return detect_content_type(file.stream, extension)
+
+    mime_type = file.stream.mime_type
+
+    if mime_type is not None and not check_container(file.stream.path, extension):
+        return None
+
+    return mime_type
+
+
+def file_checksum(file_path: str | Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Returns the sha256 hex digest of a file's content
+
+    :param file_path: Path to the file
+    :type file_path: str | Path
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
 def bytes_converter(bytes: int) -> str:
     """
     Converts from bytes to either KB or MB
@@ -64,115 +205,97 @@ def bytes_converter(bytes: int) -> str:
         return f"{bytes/1048576:.1f} MB"
 
 
-def delete_multiple_files(section_id: int) -> None:
+def delete_multiple_files(section_id: int) -> list[str]:
     """
-    This function deletes all files that are submitted against a particular section in the database
+    This function deletes all files that are submitted against a particular section in the database,
+    in one DELETE, and returns the names of their stored files. The stored files are left for the
+    caller, see main_app.deletions.schedule_deletion.
 
     :params:
         section_id: An integer of the section that will be queried against the database
 
     :return:
-        None
+        list[str]
     """
     try:
-        files = db.session.scalars(sql.select(Submissions).where(Submissions.section_id == section_id)).all()
-
-        for file in files:
-            db.session.delete(file)
+        delete = sql.delete(Submissions).where(Submissions.section_id == section_id)
+
+        if db.engine.dialect.delete_returning:
+            file_paths = list(db.session.scalars(delete.returning(Submissions.file_path)))
+        else:
+            file_paths = list(db.session.scalars(sql.select(Submissions.file_path).where(Submissions.section_id == section_id).with_for_update()))
+            db.session.execute(delete)
+
+        # A bulk DELETE skips the events keeping the counters
+        db.session.execute(
+            sql.update(Section).where(Section.id == section_id)
+            .values(submission_count=0, total_bytes=0, last_submission_at=None)
+        )
         db.session.commit()
 
-    except Exception:
-        raise Exception
-    
+        return file_paths
 
-def delete_section_directory_and_its_files(section_name: str) -> bool:
-    """
-    This function deletes a directory in the uploaded_files and the files in that directory
-    
-    :params:
-        section_name: A string: Name of the section
-
-    :returns:
-        bool
-    """
-    try:
-        section_dir = Path(current_app.config["UPLOAD_PATH"]) / section_name
-
-        if section_dir.exists() and section_dir.is_dir():
-            shutil.rmtree(section_dir)
-
-        return True
-        
-      
-    except PermissionError:
-        raise PermissionError
-    except OSError:
-        raise OSError
     except Exception:
-        raise Exception
-    
-    
-def number_of_submissions(section_id: int) -> Sequence[Submissions]:
-    """
-    Returns total number of objects related to that particular section
+        db.session.rollback()
+        raise
 
-    :param:
-        section_id: The section id
-    """
-    try:
-        files = db.session.scalars(sql.select(Submissions).where(Submissions.section_id == section_id)).all()
 
-        return files
-    except Exception:
-        raise Exception
+def _delete_with_sections(instance: User | Section, sections: sql.ColumnElement[bool]) -> list[tuple[int, str]]:
+    # Locking the sections holds off uploads to them, whose files would be missed
+    owned = db.session.execute(sql.select(Section.id, Section.section_name).where(sections).with_for_update()).all()
+    stored = db.session.execute(
+        sql.select(Section.section_name, Submissions.file_path).join(Submissions.section).where(sections)
+    ).all()
+    trashed = {}
 
+    try:
+        for _, section_name in owned:
+            if (path := move_to_trash(section_name)) is not None:
+                trashed[section_name] = path
 
+        # passive_deletes leaves the sections and submissions to ON DELETE CASCADE
+        db.session.delete(instance)
+        db.session.commit()
 
-def delete_file_from_directory(file_path: str) -> bool:
-    """
-    Deletes file in a particular directory.
+    except Exception:
+        db.session.rollback()
 
-    :param:
-        file_path: A full path to that points to the file itself. eg. uploaded_file/Assignment/example.pdf or uploaded_files/example.pdf
-    """
-    try:
-        path = Path(file_path)
+        for section_name, path in trashed.items():
+            restore_from_trash(path, section_name)
+        raise
 
+    schedule_deletion([
+        file_path for section_name, file_path in stored
+        if section_name not in trashed or is_content_addressed()
+    ])
 
-        if path.exists() and path.is_file():
-            path.unlink()
+    return [tuple(section) for section in owned]
 
-            return True
-        
-        raise FileNotFoundError
-    
-    except FileNotFoundError:
-        return True
-    except PermissionError:
-        raise PermissionError
-    except OSError:
-        raise OSError
-    except Exception:
-        raise Exception
-    
 
+def delete_section_and_its_files(section: Section) -> None:
+    """
+    Deletes a section, the database deletes its submissions. Its directory is renamed into the
+    trash beforehand and renamed back if the transaction fails, flask purge-trash removes it
+    later. Blobs, and files of storages without directories, go to the deletion worker.
 
-def get_percentage(expected_submission: int, section_id: int, func: Callable[[int], Sequence] = number_of_submissions) -> float | int:
-    try:
-        files = func(section_id)
+    :param section: The section to delete
+    :type section: Section
+    """
+    _delete_with_sections(section, Section.id == section.id)
 
-        if files:
-            number_of_files = len(files)
 
-            percentage = number_of_files / expected_submission * 100
+def delete_user_and_their_files(user: User) -> list[tuple[int, str]]:
+    """
+    Deletes a user in a fixed number of statements, the database deletes their sections and
+    submissions. Files are handled like delete_section_and_its_files does. Returns the id and
+    name of the deleted sections.
 
-            return percentage
-        
-        return 0
+    :param user: The user to delete
+    :type user: User
+    :rtype: list[tuple[int, str]]
+    """
+    return _delete_with_sections(user, Section.user_id == user.id)
     
-    except Exception:
-        raise Exception
-
 
 def restore_path(file_path: str) -> None:
     """
@@ -195,9 +318,28 @@ def restore_path(file_path: str) -> None:
         raise Exception
 
 
+def normalize_mat_no(mat_no: str | None) -> str | None:
+    """
+    Returns a mat_no without surrounding spaces, or None if it is blank
+
+    :param mat_no: Uploader's mat-no as submitted
+    :type mat_no: str | None
+    :rtype: str | None
+    """
+    if mat_no is None:
+        return None
+
+    mat_no = str(mat_no).strip()
+
+    return mat_no or None
+
+
 def duplicate_submission(*, name: str | None = None, mat_no: str | None = None, section_obj: Section) -> bool:
     """
     Prevent duplicate upload of files by same on a section either by name or mat_no. Keyword argument is required on your choice.
+
+    It's a single EXISTS query served by the (section_id, uploader_name) index or the
+    (section_id, mat_no) unique constraint, so it costs the same however big the section is.
     
     :param name: Uploader's name
     :type name: str | None
@@ -208,32 +350,38 @@ def duplicate_submission(*, name: str | None = None, mat_no: str | None = None,
     :return: True if duplicate otherwise false
     :rtype: bool
     """
-    uploader_details = section_obj.submissions
-
     if name:
-        if not isinstance(name, str):
-            try:
-                name = str(name)
-            except ValueError:
-                raise
-
-        for uploader_name in uploader_details:
-            if uploader_name.uploader_name == name:
-                return True
-        
-        return False
-    
-    if not isinstance(mat_no, str):
-        try:
-            mat_no = str(mat_no)
-        except ValueError:
-            raise
+        condition = Submissions.uploader_name == str(name)
+    else:
+        mat_no = normalize_mat_no(mat_no)
+
+        if mat_no is None:
+            return False
+
+        condition = Submissions.mat_no == mat_no
+
+    return db.session.scalar(
+        sql.select(sql.exists().where((Submissions.section_id == section_obj.id) & condition))
+    )
+
+
+def is_duplicate_submission(*, section_obj: Section, name: str, mat_no: str | None) -> bool:
+    """
+    Applies the duplicate rules of an upload: by name when no mat_no was given, otherwise by mat_no.
+
+    :param section_obj: Database object of where the upload is made
+    :type section_obj: Section
+    :param name: Uploader's name
+    :type name: str
+    :param mat_no: Uploader's mat-no
+    :type mat_no: str | None
+    :return: True if duplicate otherwise false
+    :rtype: bool
+    """
+    if normalize_mat_no(mat_no) is None:
+        return duplicate_submission(name=name, section_obj=section_obj)
 
-    for uploader_mat_no in uploader_details:
-        if uploader_mat_no.mat_no == mat_no:
-            return True
-        
-    return False
+    return duplicate_submission(mat_no=mat_no, section_obj=section_obj)
 
 
 def get_file_extension(file_path: str) -> str:
@@ -269,6 +417,18 @@ def special_alphanum() -> str:
 
 
 
+@functools.cache
+def _gibberish_tables(key: int) -> tuple[dict[int, str], dict[int, str]]:
+    # Built once per key, every upload link goes through them
+    alphabet = special_alphanum()
+    shifted = alphabet[key % len(alphabet):] + alphabet[:key % len(alphabet)]
+
+    encode = str.maketrans(alphabet + "'", shifted + "~")
+    decode = str.maketrans(shifted + "~", alphabet + "'")
+
+    return encode, decode
+
+
 def username_to_gibberish(username: str, key: int = 10) -> str:
     """
     This takes a username and returns a gibberish version that using key as a mixer
@@ -280,28 +440,7 @@ def username_to_gibberish(username: str, key: int = 10) -> str:
     :return: Returns gibberish
     :rtype: str
     """
-    list_of_special_alphanum = special_alphanum()
-    len_list_of_special_alphanum = len(list_of_special_alphanum)
-    char_to_index = {char: idx for idx, char in enumerate(list_of_special_alphanum)}
-
-    gibberish = []
-
-    key = key % len_list_of_special_alphanum
-    
-    for char in username:
-        if char not in char_to_index:
-            if char == "'":
-                gibberish.append("~")
-                continue
-            else:
-                gibberish.append(char)
-                continue
-        
-        idx = char_to_index[char]
-        new_idx = (key + idx) % len_list_of_special_alphanum
-        gibberish.append(list_of_special_alphanum[new_idx])
-        
-    return "".join(gibberish)
+    return username.translate(_gibberish_tables(key)[0])
 
 
 def gibberish_to_username(gibberish: str, key: int = 10) -> str:
@@ -315,26 +454,27 @@ def gibberish_to_username(gibberish: str, key: int = 10) -> str:
     :return: Returns a username
     :rtype: str
     """
-    list_of_special_alphanum = special_alphanum()
-    len_list_of_special_alphanum = len(list_of_special_alphanum)
-    char_to_index = {char: idx for idx, char in enumerate(list_of_special_alphanum)}
+    return gibberish.translate(_gibberish_tables(key)[1])
 
-    username = []
 
-    key = key % len_list_of_special_alphanum
-    
-    for char in gibberish:
-        if char not in char_to_index:
-            if char == "~":
-                username.append("'")
-                continue
-            else:
-                username.append(char)
-                continue
+def content_disposition(download_name: str) -> str:
+    """
+    Builds an attachment Content-Disposition header value the same way send_file does,
+    falling back to the RFC 2231 form when the name is not plain ASCII.
+
+    :param download_name: The name the browser should save the file as
+    :type download_name: str
+    :return: The header value
+    :rtype: str
+    """
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii").replace('"', "")
+        quoted = quote(download_name, safe="!#$&+^`|~")
 
-        idx = char_to_index[char]
-        new_idx = (idx - key) % len_list_of_special_alphanum
+        return f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quoted}"
 
-        username.append(list_of_special_alphanum[new_idx])
+    simple = download_name.replace('"', "")
 
-    return "".join(username)
\ No newline at end of file
+    return f"attachment; filename=\"{simple}\""
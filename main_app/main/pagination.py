@@ -0,0 +1,200 @@
+"""
+Keyset pagination, search and filtering of a section's submissions.
+
+Pages are ordered by a sort column and the id, and a page starts right after, or ends right
+before, the submission its cursor points at. Every sort has an index starting with section_id
+(ix_submissions_section_id_uploaded_at, ..._uploader_name, ..._file_size), so the database
+seeks to that position and a deep page costs the same as the first one. No COUNT is needed,
+totals come from Section.submission_count.
+
+Searches match the start of the uploader's name or mat_no case-insensitively, a range on
+lower(column) served by the lower() expression indexes. Matching anywhere in them can't use a
+B-tree and scans the section's rows instead, which the section_id index bounds to one section.
+"""
+from datetime import datetime, timezone
+from typing import NamedTuple, Sequence
+import base64
+import binascii
+import json
+import sqlalchemy as sql
+
+from main_app.extensions import db
+from main_app.models import Submissions
+from .exception import InvalidCursor
+
+
+SORT_COLUMNS = {
+    "time": Submissions.uploaded_at,
+    "name": Submissions.uploader_name,
+    "size": Submissions.file_size,
+}
+
+
+class SubmissionPage(NamedTuple):
+    items: Sequence[Submissions]
+    next_cursor: str | None
+    prev_cursor: str | None
+
+
+def _sort_value(submission: Submissions, sort: str) -> str | int:
+    value = getattr(submission, SORT_COLUMNS[sort].key)
+
+    if isinstance(value, datetime):
+        # Submissions still in the session carry the timezone the column doesn't store
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+        return value.isoformat()
+
+    return value
+
+
+def encode_cursor(submission: Submissions, direction: str, sort: str = "time") -> str:
+    """
+    Returns an opaque cursor for the page after ("next") or before ("prev") submission
+
+    :param submission: The last submission of a page for next, the first for prev
+    :type submission: Submissions
+    :param direction: next or prev
+    :type direction: str
+    :param sort: The sort the page is in
+    :type sort: str
+    :rtype: str
+    """
+    raw = json.dumps([direction, sort, _sort_value(submission, sort), submission.id], separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str = "time") -> tuple[str, datetime | str | int, int]:
+    """
+    Returns the direction, sort value and id a cursor points at, or raises InvalidCursor when
+    it is malformed or was made for another sort
+
+    :param cursor: A cursor made by encode_cursor
+    :type cursor: str
+    :param sort: The sort of the page requested
+    :type sort: str
+    :rtype: tuple[str, datetime | str | int, int]
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, cursor_sort, value, submission_id = json.loads(raw)
+
+        if direction not in {"next", "prev"} or cursor_sort != sort:
+            raise ValueError(f"Cursor for {direction} {cursor_sort}")
+
+        if sort == "time":
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, str if sort == "name" else int):
+            raise TypeError(f"Bad {sort} value {value!r}")
+
+        return direction, value, int(submission_id)
+
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidCursor(f"Invalid cursor {cursor!r}") from e
+
+
+def _starts_with(expression, prefix: str):
+    # A range instead of LIKE, so the lower() indexes are used whatever the database's LIKE rules
+    if ord(prefix[-1]) == 0x10FFFF:
+        return expression >= prefix
+
+    return (expression >= prefix) & (expression < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def submission_filters(search: str | None = None, anywhere: bool = False, level: str | None = None, group: str | None = None) -> list:
+    """
+    Returns the conditions selecting the submissions that match a search and filters, blank
+    values are ignored
+
+    :param search: Start of the uploader's name or mat_no, case-insensitive
+    :type search: str | None
+    :param anywhere: Match search anywhere in the name or mat_no instead of at the start
+    :type anywhere: bool
+    :param level: Exact level
+    :type level: str | None
+    :param group: Exact group
+    :type group: str | None
+    :rtype: list
+    """
+    conditions = []
+    search = (search or "").strip().lower()
+
+    if search:
+        name = sql.func.lower(Submissions.uploader_name)
+        mat_no = sql.func.lower(Submissions.mat_no)
+
+        if anywhere:
+            conditions.append(name.contains(search, autoescape=True) | mat_no.contains(search, autoescape=True))
+        else:
+            conditions.append(_starts_with(name, search) | _starts_with(mat_no, search))
+
+    if level and level.strip():
+        conditions.append(Submissions.level == level.strip())
+
+    if group and group.strip():
+        conditions.append(Submissions.group == group.strip())
+
+    return conditions
+
+
+def paginate_submissions(
+    section_id: int, cursor: str | None = None, per_page: int = 15, *,
+    filters: Sequence = (), sort: str = "time", descending: bool = False
+) -> SubmissionPage:
+    """
+    Returns a page of the submissions of a section, the first one when cursor is None
+
+    :param section_id: ID of the section
+    :type section_id: int
+    :param cursor: next_cursor or prev_cursor of another page in the same sort
+    :type cursor: str | None
+    :param per_page: Number of submissions on a page
+    :type per_page: int
+    :param filters: Conditions from submission_filters
+    :type filters: Sequence
+    :param sort: time, name or size
+    :type sort: str
+    :param descending: Newest, Z to A or largest first
+    :type descending: bool
+    :rtype: SubmissionPage
+    """
+    column = SORT_COLUMNS[sort]
+    key = sql.tuple_(column, Submissions.id)
+    query = sql.select(Submissions).where(Submissions.section_id == section_id, *filters)
+
+    forward = (column.desc(), Submissions.id.desc()) if descending else (column, Submissions.id)
+    backward = (column, Submissions.id) if descending else (column.desc(), Submissions.id.desc())
+
+    if cursor is None:
+        direction = "next"
+        query = query.order_by(*forward)
+    else:
+        direction, value, submission_id = decode_cursor(cursor, sort)
+        position = sql.tuple_(sql.literal(value, column.type), sql.literal(submission_id))
+
+        # Walking towards the end of the sort or back towards its start
+        if (direction == "next") != descending:
+            query = query.where(key > position)
+        else:
+            query = query.where(key < position)
+
+        query = query.order_by(*(forward if direction == "next" else backward))
+
+    # One row more than a page tells whether there is a page beyond it
+    items = list(db.session.scalars(query.limit(per_page + 1)))
+    more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == "prev":
+        items.reverse()
+
+    has_next = more if direction == "next" else True
+    has_prev = cursor is not None if direction == "next" else more
+
+    return SubmissionPage(
+        items,
+        encode_cursor(items[-1], "next", sort) if items and has_next else None,
+        encode_cursor(items[0], "prev", sort) if items and has_prev else None
+    )
@@ -1,5 +1,6 @@
-from flask import request, render_template, url_for, redirect, flash, send_file, abort, jsonify
+from flask import request, render_template, url_for, redirect, flash, send_file, abort, jsonify, Response, g
 from flask_login import login_required, current_user
+from markupsafe import Markup
 import sqlalchemy as sql
 from werkzeug.utils import secure_filename
 from flask import current_app
@@ -7,19 +8,37 @@ from pathlib import Path
 
 from . import main_bp
 from .forms import SectionForm, FileUpload
-from main_app.models import Section, Submissions, User, Message
+from main_app.models import Section, Submissions, Message
 from main_app.validation import free_from_special_characters,is_email_valid, is_username_validated
 
 from .helper import (
     allowed_extension, save_uploaded_file, bytes_converter, delete_multiple_files, 
-    delete_section_directory_and_its_files, number_of_submissions, delete_file_from_directory,
-    restore_path, duplicate_submission, get_file_extension, username_to_gibberish, gibberish_to_username
+    delete_section_and_its_files,
+    is_duplicate_submission, get_file_extension, username_to_gibberish,
+    content_disposition, uploaded_file_details, blob_references, normalize_mat_no, uploaded_content_type
+)
+from .downloads import send_stored_file, send_conditional_file
+from .archive import (
+    archive_members, stream_zip, CompressionPolicy, section_archive_cache, invalidate_section_archive
+)
+from .pagination import paginate_submissions, submission_filters, SORT_COLUMNS
+from .uploads import (
+    parse_upload_metadata, create_staged_upload, load_staged_upload, append_chunk, finalize_staged_upload,
+    discard_staged_upload
+)
+from .exception import (
+    UploadNotFound, UploadOffsetMismatch, UploadChecksumMismatch, UploadTooLarge, UploadLocked, UploadContentMismatch,
+    InvalidCursor
 )
 
-from main_app.extensions import db, limiter
-
-import zipfile
-import io
+from main_app.extensions import db, limiter, csrf
+from main_app.storage import get_storage
+from main_app.events import emit, submission_added, submission_deleted, section_changed
+from main_app.cache import cached_fragment
+from main_app.live import stream_progress
+from main_app.deletions import schedule_deletion
+from .upload_links import upload_links
+from .staging import StagedFile
 
 
 @main_bp.route("/")
@@ -39,8 +58,22 @@ def welcome():
 def home():
     try:
         current_app.logger.info(f"The home route is being accessed by {current_user.username}.")
-        existing_sections = db.session.scalars(sql.select(Section).where(Section.user_id == current_user.id)).all()
-        return render_template("main/home.html", sections=existing_sections, url_base=request.host_url.rstrip("/"), number_of_submissions=number_of_submissions, gibberish=username_to_gibberish)
+        user_id = current_user.id
+
+        def render_stats():
+            section_count = db.session.scalar(sql.select(sql.func.count(Section.id)).where(Section.user_id == user_id))
+            return render_template("main/_dashboard_stats.html", section_count=section_count)
+
+        def render_sections():
+            existing_sections = db.session.scalars(sql.select(Section).where(Section.user_id == user_id)).all()
+            share_slug = current_user.share_slug or username_to_gibberish(current_user.username)
+            return render_template("main/_section_cards.html", sections=existing_sections, url_base=request.host_url.rstrip("/"), bytes_converter=bytes_converter, share_slug=share_slug)
+
+        return render_template(
+            "main/home.html",
+            stats_fragment=cached_fragment(f"user:{user_id}", "stats", render_stats),
+            sections_fragment=cached_fragment(f"user:{user_id}", f"sections:{request.host}", render_sections)
+        )
     except Exception as e:
         flash("An unexpected error occured, we are handling it.")
         current_app.logger.error(f"{current_user.username} got an unexpected error due to {str(e)}", exc_info=True)
@@ -48,6 +81,25 @@ def home():
 
 
 
+@main_bp.get("/live-progress")
+@limiter.limit("10 per minute")
+@login_required
+def live_progress():
+    try:
+        config = current_app.config
+        stream = stream_progress(
+            current_user.id, heartbeat=config["LIVE_PROGRESS_HEARTBEAT"],
+            max_duration=config["LIVE_PROGRESS_MAX_DURATION"], retry=config["LIVE_PROGRESS_RETRY"]
+        )
+
+        # Buffering proxies would hold the events back
+        return Response(stream, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    except Exception as e:
+        current_app.logger.error(f"{current_user.username} couldn't open the live progress stream due to {str(e)}", exc_info=True)
+        return Response(status=503)
+
+
 @main_bp.route("/create-section", methods=["GET", "POST"])
 @limiter.limit("5 per minute")
 @login_required
@@ -66,6 +118,10 @@ def create_section():
                 db.session.add(section)
                 db.session.commit()
 
+                # Its link may have been cached as leading nowhere, and isn't in the link filters yet
+                upload_links.add(section.section_name)
+                emit(section_changed, current_user.id, section.id)
+
                 flash("Section created", "success")
                 current_app.logger.info(f"A successful post request is made by {current_user.username} on the create section route")
                 return redirect(url_for("main_bp.home"))
@@ -91,25 +147,35 @@ def create_section():
 @limiter.limit("10 per minute")
 def upload_file(username, section_name):
     form = FileUpload()
-    
-    user = db.session.scalar(sql.select(User).where(User.username == gibberish_to_username(username)))
-    section = db.session.scalar(sql.select(Section).where(Section.section_name == section_name))
+
+    # Resolved from the upload link cache, the page is reloaded constantly. An upload was
+    # resolved already when it was admitted, see admission.admit_upload
+    section = g.pop("upload_section", None) or upload_links.resolve(username, section_name)
+
+    if section is None:
+        current_app.logger.warning("A wrong url was tried on this route")
+        abort(404)
     
     if request.method == "POST":
+        file_path = None
+
         try:
             current_app.logger.info(
                 f"A Post request is being made on the upload route."
             )
+
+            upload = request.files.get("file")
+
+            # A file refused while it was received isn't kept, the form would only find it too small
+            if upload is not None and isinstance(upload.stream, StagedFile) and upload.stream.rejected:
+                flash("The file content doesn't match its extension", "error")
+                current_app.logger.warning(f"The content of a file submitted as {upload.filename} doesn't match its extension")
+                return render_template("main/upload.html", form=form, username=username, section_name=section_name)
+
             if form.validate_on_submit():
                 
                 # Prevents duplicate file upload either by name or mat_no
-                if not form.mat_no.data or not form.mat_no.data.strip():
-                    if duplicate_submission(name=form.full_name.data, section_obj=section):
-                        flash("Already uploaded file on this section", "warning")
-                        current_app.logger.info(f"{form.full_name.data} tried uploading twice to this route")
-                        return render_template("main/upload.html", form=form, username=username, section_name=section_name)
-
-                if duplicate_submission(mat_no=form.mat_no.data, section_obj=section):
+                if is_duplicate_submission(section_obj=section, name=form.full_name.data, mat_no=form.mat_no.data):
                     flash("Already uploaded file on this section", "warning")
                     current_app.logger.info(f"{form.full_name.data} tried uploading twice to this route")
                     return render_template("main/upload.html", form=form, username=username, section_name=section_name)
@@ -131,22 +197,34 @@ def upload_file(username, section_name):
                     current_app.logger.warning(f"File submitted have a wrong extension type")
                     return render_template("main/upload.html", form=form, username=username, section_name=section_name)
 
+                # Renamed executables and broken documents would be stored in full and break the section ZIPs
+                mime_type = uploaded_content_type(file, filename)
+
+                if mime_type is None:
+                    flash("The file content doesn't match its extension", "error")
+                    current_app.logger.warning(f"The content of a file submitted as {filename} doesn't match its extension")
+                    return render_template("main/upload.html", form=form, username=username, section_name=section_name)
+
 
                 # Save file to upload directory
                 file_path = save_uploaded_file(file, filename, section_name)
+                file_size, checksum = uploaded_file_details(file, file_path)
 
                 # Save other meta data and file_path to database
                 submission = Submissions(
                     section_id=section.id, uploader_name=form.full_name.data,
-                    mat_no=form.mat_no.data, level=form.level.data,
+                    mat_no=normalize_mat_no(form.mat_no.data), level=form.level.data,
                     group=form.group.data, original_filename=filename,
-                    stored_filename=f"{form.mat_no.data}_{filename}", file_path=str(file_path),
-                    file_size=file_path.stat().st_size, 
+                    stored_filename=f"{form.mat_no.data}_{filename}", file_path=file_path,
+                    file_size=file_size, checksum=checksum, mime_type=mime_type
                 )
 
                 db.session.add(submission)
                 db.session.commit()
 
+                invalidate_section_archive(section.id)
+                emit(submission_added, section.user_id, section.id)
+
                 flash("File Uploaded Sucessfully", "success")
                 current_app.logger.info(f"A successful file upload was made by {form.full_name.data}")
                 return redirect(url_for("main_bp.upload_file", username=username, section_name=section_name))
@@ -159,6 +237,17 @@ def upload_file(username, section_name):
             flash("The file exist, seems you have already uploaded the file", "error")
             current_app.logger.warning(f"A file with same details was being sent again by {form.full_name.data}", exc_info=True)
             return render_template("main/upload.html", form=form, username=username, section_name=section_name)
+
+        except sql.exc.IntegrityError:
+            # Another upload of the same student won the race past the duplicate check
+            db.session.rollback()
+
+            if file_path is not None and not blob_references(file_path):
+                get_storage().delete(file_path)
+
+            flash("Already uploaded file on this section", "warning")
+            current_app.logger.info(f"{form.full_name.data} uploaded twice to this route at the same time")
+            return render_template("main/upload.html", form=form, username=username, section_name=section_name)
         
         except FileNotFoundError:
             flash("An error occured from us. Please try again", "warning")
@@ -168,20 +257,152 @@ def upload_file(username, section_name):
         except Exception as e:
             db.session.rollback()
 
-            # Ensures that the file is deleted from the directory if the database fails to save to avoid oprhan storage.
-            path_to_file = Path(current_app.config["UPLOAD_PATH"]) / section_name / filename
-            delete_file_from_directory(path_to_file)
+            # Ensures that the file is deleted from storage if the database fails to save to avoid oprhan storage.
+            if file_path is not None and not blob_references(file_path):
+                get_storage().delete(file_path)
 
             flash("Internal server down", "warning")
             current_app.logger.error(f"An error occured due to {str(e)}", exc_info=True)
             return render_template("main/upload.html", form=form, username=username, section_name=section_name)
 
-    if user and section:
-        current_app.logger.info("Upload file route is being accessed")
-        return render_template("main/upload.html", form=form, username=username, section_name=section_name)
-    
-    current_app.logger.warning("A wrong url was tried on this route")
-    abort(404)
+    current_app.logger.info("Upload file route is being accessed")
+    return render_template("main/upload.html", form=form, username=username, section_name=section_name)
+
+
+
+def tus_response(body: dict | None = None, status: int = 204, **headers) -> Response:
+    """Builds a response of the resumable upload routes"""
+    response = jsonify(body) if body is not None else Response()
+    response.status_code = status
+    response.headers["Tus-Resumable"] = "1.0.0"
+    response.headers["Cache-Control"] = "no-store"
+
+    for name, value in headers.items():
+        response.headers[name.replace("_", "-")] = str(value)
+
+    return response
+
+
+@main_bp.route("/uploads/<username>/<section_name>", methods=["POST"])
+@csrf.exempt
+@limiter.limit("10 per minute")
+def create_upload(username, section_name):
+    try:
+        current_app.logger.info("A resumable upload is being created")
+
+        section = upload_links.resolve(username, section_name)
+
+        if section is None:
+            current_app.logger.warning("A wrong url was tried on the resumable upload route")
+            return tus_response({"error": "Section not found"}, 404)
+
+        try:
+            length = int(request.headers["Upload-Length"])
+            metadata = parse_upload_metadata(request.headers.get("Upload-Metadata"))
+        except (KeyError, ValueError):
+            current_app.logger.warning("A resumable upload was created with invalid headers")
+            return tus_response({"error": "Upload-Length and a valid Upload-Metadata are required"}, 400)
+
+        full_name = metadata.get("full_name", "").strip()
+        mat_no = normalize_mat_no(metadata.get("mat_no"))
+        filename = secure_filename(metadata.get("filename", ""))
+
+        if not full_name or not is_username_validated(full_name):
+            return tus_response({"error": "Please provide a valid name."}, 400)
+
+        if not filename or not allowed_extension(filename):
+            current_app.logger.warning("File submitted have a wrong extension type")
+            return tus_response({"error": "Invalid file extention"}, 400)
+
+        if not current_app.config["MIN_CONTENT_LENGTH"] <= length <= current_app.config["MAX_CONTENT_LENGTH"]:
+            return tus_response({"error": "File must be between 10K and 25MB"}, 413)
+
+        if is_duplicate_submission(section_obj=section, name=full_name, mat_no=mat_no):
+            current_app.logger.info(f"{full_name} tried uploading twice to this route")
+            return tus_response({"error": "Already uploaded file on this section"}, 409)
+
+        upload_id = create_staged_upload({
+            "section_id": section.id, "full_name": full_name, "mat_no": mat_no,
+            "level": metadata.get("level") or None, "group": metadata.get("group") or None,
+            "filename": filename
+        }, length)
+
+        current_app.logger.info(f"Resumable upload {upload_id} was created by {full_name}")
+        return tus_response(
+            None, 201, Location=url_for("main_bp.resume_upload", upload_id=upload_id), Upload_Offset=0
+        )
+
+    except Exception as e:
+        current_app.logger.error(f"An error occured while creating a resumable upload due to {str(e)}", exc_info=True)
+        return tus_response({"error": "Internal server down"}, 500)
+
+
+@main_bp.route("/uploads/<upload_id>", methods=["HEAD", "PATCH"])
+@csrf.exempt
+@limiter.limit("120 per minute")
+def resume_upload(upload_id):
+    try:
+        if request.method == "HEAD":
+            upload = load_staged_upload(upload_id)
+            return tus_response(None, 200, Upload_Offset=upload["offset"], Upload_Length=upload["length"])
+
+        if request.mimetype != "application/offset+octet-stream":
+            return tus_response({"error": "Content-Type must be application/offset+octet-stream"}, 415)
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return tus_response({"error": "Upload-Offset is required"}, 400)
+
+        new_offset = append_chunk(
+            upload_id, offset, request.stream, request.headers.get("Upload-Checksum"),
+            chunk_size=current_app.config["UPLOAD_CHUNK_SIZE"]
+        )
+
+        if new_offset == load_staged_upload(upload_id)["length"]:
+            submission = finalize_staged_upload(upload_id)
+            invalidate_section_archive(submission.section_id)
+            emit(submission_added, submission.section.user_id, submission.section_id)
+
+            current_app.logger.info(f"A successful resumable upload was made by {submission.uploader_name}")
+
+        return tus_response(None, 204, Upload_Offset=new_offset)
+
+    except UploadNotFound:
+        current_app.logger.info(f"Resumable upload {upload_id} doesn't exist or has expired")
+        return tus_response({"error": "Upload not found"}, 404)
+
+    except UploadOffsetMismatch as e:
+        current_app.logger.info(f"Resumable upload {upload_id} was sent at a wrong offset. {str(e)}")
+        return tus_response({"error": str(e)}, 409)
+
+    except UploadLocked:
+        return tus_response({"error": "Upload is in use by another request"}, 423)
+
+    except UploadTooLarge as e:
+        return tus_response({"error": str(e)}, 413)
+
+    except UploadChecksumMismatch as e:
+        current_app.logger.info(f"Resumable upload {upload_id} got a corrupted chunk")
+        return tus_response({"error": str(e)}, 460)
+
+    except UploadContentMismatch as e:
+        # Nothing the client sends can make it match, the upload is over
+        discard_staged_upload(upload_id)
+        current_app.logger.warning(f"Resumable upload {upload_id} has content that doesn't match its extension")
+        return tus_response({"error": str(e)}, 415)
+
+    except ValueError as e:
+        return tus_response({"error": str(e)}, 400)
+
+    except FileExistsError:
+        current_app.logger.warning(f"Resumable upload {upload_id} was a duplicate submission", exc_info=True)
+        return tus_response({"error": "Already uploaded file on this section"}, 409)
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"An error occured on resumable upload {upload_id} due to {str(e)}", exc_info=True)
+        return tus_response({"error": "Internal server down"}, 500)
 
 
 
@@ -198,14 +419,18 @@ def delete_section(section_id):
 
 
         if section:
-            if delete_section_directory_and_its_files(section.section_name):
-                delete_multiple_files(section_id)
-                db.session.delete(section)
-                db.session.commit()
+            section_id, section_name = section.id, section.section_name
 
-                flash("Section was deleted successfully", "success")
-                current_app.logger.info(f"A section-{section.section_name} was successfully deleted by {current_user.username}")
-                return redirect(url_for("main_bp.home"))
+            # The directory is renamed into the trash, flask purge-trash deletes the files
+            delete_section_and_its_files(section)
+
+            upload_links.invalidate(section_name)
+            invalidate_section_archive(section_id)
+            emit(section_changed, current_user.id, section_id)
+
+            flash("Section was deleted successfully", "success")
+            current_app.logger.info(f"A section-{section_name} was successfully deleted by {current_user.username}")
+            return redirect(url_for("main_bp.home"))
         
         flash("Unauthorized", "warning")
         current_app.logger.warning(f"Unathorized delete attempt by {current_user.username} on section {section_id}")
@@ -245,21 +470,58 @@ def view_files(section_id):
             current_app.logger.warning(f"Unathorized view attempt by {current_user.username} on section {section_id}")
             return abort(403)
 
-        page = request.args.get("page", 1, type=int)
+        cursor = request.args.get("cursor")
+
+        search = {
+            "q": request.args.get("q", "").strip(),
+            "match": "anywhere" if request.args.get("match") == "anywhere" else "",
+            "level": request.args.get("level", "").strip(),
+            "group": request.args.get("group", "").strip(),
+            "sort": request.args.get("sort") if request.args.get("sort") in SORT_COLUMNS else "time",
+            "order": "desc" if request.args.get("order") == "desc" else "asc",
+        }
+        filtered = bool(search["q"] or search["level"] or search["group"])
+        filters = submission_filters(search["q"], search["match"] == "anywhere", search["level"], search["group"])
+
+        # The links of other pages keep the search, leaving out what is at its default
+        params = {key: value for key, value in search.items() if value and (key, value) not in {("sort", "time"), ("order", "asc")}}
+
+        def render_files():
+            files = paginate_submissions(
+                section.id, cursor, current_app.config["FILES_PER_PAGE"],
+                filters=filters, sort=search["sort"], descending=search["order"] == "desc"
+            )
 
-        query = sql.select(Submissions).where(Submissions.section_id == section_id)
-        files = db.paginate(query, page=page, per_page=current_app.config["FILES_PER_PAGE"], error_out=False)
+            next_url = url_for("main_bp.view_files", section_id=section.id, cursor=files.next_cursor, **params) \
+                if files.next_cursor else None
+            
+            prev_url = url_for("main_bp.view_files", section_id=section.id, cursor=files.prev_cursor, **params) \
+                if files.prev_cursor else None
 
-        next_url = url_for("main_bp.view_files", section_id=section_id, page=files.next_num) \
-            if files.has_next else None
-        
-        prev_url = url_for("main_bp.view_files", section_id=section_id, page=files.prev_num) \
-            if files.has_prev else None
+            return render_template(
+                "main/_file_cards.html", files=files, total=None if filtered else section.submission_count,
+                filtered=filtered, bytes_converter=bytes_converter, next=next_url, prev=prev_url
+            )
         
+        # Only listings are cached, searches are too varied to be worth keeping
+        if filtered:
+            files_fragment = Markup(render_files())
+        else:
+            files_fragment = cached_fragment(f"section:{section.id}", f"files:{search['sort']}:{search['order']}:{cursor or 'first'}", render_files)
 
         current_app.logger.info(f"View-files routes was accessed by {current_user.username}")
-        return render_template("main/view-file.html", files=files, bytes_converter=bytes_converter, next=next_url, prev=prev_url)
+        return render_template(
+            "main/view-file.html",
+            section=section, search=search,
+            submission_count=section.submission_count,
+            files_fragment=files_fragment
+        )
     
+    except InvalidCursor:
+        flash("That page doesn't exist anymore", "warning")
+        current_app.logger.info(f"{current_user.username} sent an invalid cursor on the view-files route")
+        return redirect(url_for("main_bp.view_files", section_id=section_id))
+
     
     except Exception as e:
         flash("An error occured! Please try again", "warning")
@@ -287,27 +549,28 @@ def download_files(section_id: str, section_name: str):
             current_app.logger.info(f"{current_user.username} tried to download an empty file")
             return redirect(url_for("main_bp.home"))
 
-        # create ZIP in memory
-        memory_file = io.BytesIO()
-
-        with zipfile.ZipFile(memory_file, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file in files:
-                file_path = file.file_path
-
-                file_absolute_path = Path(file_path)
-                filename = file_absolute_path.name
-
-                zipf.write(file_path, arcname=filename)
-
-
-        memory_file.seek(0)
+        download_name = f"{section_name}.zip"
+        cache = section_archive_cache()
+
+        if cache is not None:
+            archive = cache.open_or_build(int(section_id), files)
+
+            if isinstance(archive, Path):
+                current_app.logger.info(f"Sending cached archive of section {section_id} to {current_user.username}")
+                return send_stored_file(archive, download_name=download_name, mimetype="application/zip")
+        else:
+            # Stream the ZIP so memory stays bounded by one chunk regardless of the section size
+            storage = get_storage()
+            archive = stream_zip(
+                archive_members(files, storage), chunk_size=current_app.config["ARCHIVE_CHUNK_SIZE"],
+                policy=CompressionPolicy.from_config(current_app.config), storage=storage
+            )
 
         current_app.logger.info(f"Downloading files in progress made by {current_user.username}")
-        return send_file(
-            memory_file,
+        return Response(
+            archive,
             mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{section_name}.zip"
+            headers={"Content-Disposition": content_disposition(download_name)}
         )
     
     except FileNotFoundError:
@@ -336,13 +599,19 @@ def delete_file(file_id: int):
                 current_app.logger.warning(f"Unathorized delete attempt by {current_user.username} on File {file_id}")
                 abort(403)
 
-            if delete_file_from_directory(file.file_path):
-                db.session.delete(file)
-                db.session.commit()
+            section_id, file_path = file.section_id, file.file_path
+
+            db.session.delete(file)
+            db.session.commit()
+
+            # Removed once committed, and kept while another submission points at it, see main_app.deletions
+            schedule_deletion([file_path])
+            invalidate_section_archive(section_id)
+            emit(submission_deleted, current_user.id, section_id)
 
-                flash("File deleted successfully", "success")
-                current_app.logger.info(f"{current_user.username} successfully deleted a file with ID {file_id}")
-                return redirect(url_for("main_bp.view_files", section_id=file.section_id))
+            flash("File deleted successfully", "success")
+            current_app.logger.info(f"{current_user.username} successfully deleted a file with ID {file_id}")
+            return redirect(url_for("main_bp.view_files", section_id=section_id))
         
         flash("File not found", "warning")
         current_app.logger.warning(f"File not found in an attempt to delete it made by {current_user.username}.")
@@ -382,28 +651,18 @@ def delete_files(section_id: int):
             current_app.logger.warning(f"Unathorized delete attempt by {current_user.username} on a file tried to section {section_id}")
             abort(403)
             
-        files = db.session.scalars(sql.select(Submissions).where(Submissions.section_id == section_id)).all()
+        # The rows go in one DELETE, their files are removed by the deletion worker
+        file_paths = delete_multiple_files(section_id)
 
-        if not files:
+        if not file_paths:
             flash("No files to delete", "warning")
             current_app.logger.warning(f"{current_user.username}::File on section with ID-{section_id} not found in an attempt to delete it.")
             return redirect(url_for("main_bp.home"))
-        
-        deleted_file_path = [] # Keeps track of files_paths that was deleted
 
-        for file in files:
-            if delete_file_from_directory(file.file_path):
-                deleted_file_path.append(file.file_path)
-                db.session.delete(file)
-            else:
-                current_app.logger.error(f"{current_user.username}::File-{file} couldn't be deleted")
-                for path in deleted_file_path:
-                    restore_path(path)
-                    current_app.logger.info(f"{current_user.username}::Restoring file with {path} that was deleted.")
-                    raise OSError
-
-        db.session.commit()
+        schedule_deletion(file_paths)
 
+        invalidate_section_archive(section_id)
+        emit(submission_deleted, current_user.id, section_id)
 
         flash("All files deleted", "success")
         current_app.logger.info(f"{current_user.username} successfully deleted multiple files")
@@ -431,6 +690,8 @@ def delete_files(section_id: int):
 @main_bp.route("/download-file/<int:file_id>", methods=["GET"])
 @login_required
 def download_file(file_id):
+    file = None
+
     try:
         current_app.logger.info(f"{current_user.username} is downloading a single file with file id {file_id}")
         file = db.session.scalar(sql.select(Submissions).where(Submissions.id == file_id))
@@ -442,28 +703,30 @@ def download_file(file_id):
         if file.section.user_id != current_user.id:
             flash("Unathroized", "error")
             current_app.logger.warning(f"{current_user.id} trying to download file with the ID {file.id} it doesn't posssed")
-            return redirect(url_for("main_bp.view_file", section_id=file.section_id))
-            
+            return redirect(url_for("main_bp.view_files", section_id=file.section_id))
 
-        ext = get_file_extension(file.file_path)
+        # Submissions from before content sniffing have no MIME type stored
+        mimetype = file.mime_type or f"application/{get_file_extension(file.original_filename)}"
 
         current_app.logger.info(f"Downloading file with id {file_id} by {current_user.username} in progress")
-        return send_file(
+        return send_conditional_file(
             file.file_path,
-            mimetype=f"application/{ext}",
-            as_attachment=True,
-            download_name=f"{file.original_filename}"
+            download_name=f"{file.original_filename}",
+            mimetype=mimetype,
+            # Files from before checksums were stored have no ETag until flask backfill-checksums runs
+            etag=file.checksum,
+            last_modified=file.uploaded_at
         )
 
     except FileNotFoundError:
         flash("Coulnd't find file", "error")
         current_app.logger.warning(f"{current_user.username}::A file couldn't download due to it missing", exc_info=True)
-        return redirect(url_for("main_bp.view_file", section_id=file.section_id))
+        return redirect(url_for("main_bp.view_files", section_id=file.section_id) if file else url_for("main_bp.home"))
     
     except Exception as e:
         flash("Internal Service issue", "error")
         current_app.logger.error(f"{current_user.username}::An unexpected error occured due to {str(e)}", exc_info=True)
-        return redirect(url_for("main_bp.view_file", section_id=file.section_id))
+        return redirect(url_for("main_bp.view_files", section_id=file.section_id) if file else url_for("main_bp.home"))
     
 
 
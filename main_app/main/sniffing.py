@@ -0,0 +1,160 @@
+"""
+Content sniffing of uploads.
+
+allowed_extension only looks at the filename, so a renamed executable or a broken document was
+stored in full. The first SNIFF_BYTES of an upload are checked against the magic bytes of its
+extension while it is received: the PDF header, the zip local header of OOXML and ODF documents
+(ODF names its mimetype in the first entry), the OLE2 header of doc and ppt, and for txt the
+absence of NUL and control characters, read as UTF-16 or UTF-32 when it starts with their BOM
+as Notepad's "Unicode" files do. Once the file is complete, the zip central directory of OOXML
+and ODF documents must list the part every such document has, which a truncated file doesn't.
+
+The MIME type found is stored on the submission and sent with its downloads.
+"""
+from pathlib import Path
+from typing import BinaryIO
+import codecs
+import zipfile
+
+
+SNIFF_BYTES = 4096
+
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "odt": "application/vnd.oasis.opendocument.text",
+    "doc": "application/msword",
+    "ppt": "application/vnd.ms-powerpoint",
+    "txt": "text/plain",
+}
+
+# The part the central directory of every document of the extension lists
+ZIP_PARTS = {"docx": "word/document.xml", "pptx": "ppt/presentation.xml", "odt": "content.xml"}
+
+_ZIP = b"PK\x03\x04"
+_OLE2 = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_TEXT_CONTROLS = {8, 9, 10, 12, 13, 27}
+
+# The UTF-32 LE BOM starts with the UTF-16 LE one, so it is tried first
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"), (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+
+def _decode_wide(head: bytes) -> str | None:
+    """Decodes a head starting with a UTF-16 or UTF-32 BOM, None for any other head"""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            # Not final, the head may end in the middle of a character
+            return codecs.getincrementaldecoder(encoding)().decode(head[len(bom):])
+
+    return None
+
+
+def _is_text(head: bytes) -> bool:
+    if head.startswith((_ZIP, _OLE2, b"%PDF-")):
+        return False
+
+    try:
+        text = _decode_wide(head)
+    except UnicodeDecodeError:
+        return False
+
+    codes = head if text is None else [ord(char) for char in text]
+
+    if 0 in codes:
+        return False
+
+    controls = sum(1 for code in codes if code < 32 and code not in _TEXT_CONTROLS)
+
+    return controls <= len(codes) // 100
+
+
+def _matches(head: bytes, extension: str) -> bool:
+    if extension == "pdf":
+        # Readers accept the header anywhere in the first KB
+        return b"%PDF-" in head[:1024]
+
+    if extension == "odt":
+        mimetype = MIME_TYPES["odt"].encode()
+        return head.startswith(_ZIP) and head[30:38] == b"mimetype" and head[38:38 + len(mimetype)] == mimetype
+
+    if extension in ("docx", "pptx"):
+        # Both are zips, the directory of the other kind (or an ODF mimetype) gives a renamed one away
+        other = b"ppt/" if extension == "docx" else b"word/"
+        return head.startswith(_ZIP) and other not in head and head[30:38] != b"mimetype"
+
+    if extension in ("doc", "ppt"):
+        return head.startswith(_OLE2)
+
+    if extension == "txt":
+        return _is_text(head)
+
+    return False
+
+
+def sniff(head: bytes, extension: str) -> str | None:
+    """
+    Returns the MIME type of a file of the extension starting with head, None when the content
+    isn't that kind of file
+
+    :param head: The first SNIFF_BYTES of the file, or all of it when it is shorter
+    :type head: bytes
+    :param extension: Extension of its filename, e.g. pdf
+    :type extension: str
+    :rtype: str | None
+    """
+    extension = extension.lower()
+
+    if extension not in MIME_TYPES or not _matches(head, extension):
+        return None
+
+    return MIME_TYPES[extension]
+
+
+def check_container(file: str | Path | BinaryIO, extension: str) -> bool:
+    """
+    Returns whether a complete OOXML or ODF document has a readable central directory listing
+    its main part, True for the other extensions
+
+    :param file: Path or seekable file of the document
+    :type file: str | Path | BinaryIO
+    :param extension: Extension of its filename
+    :type extension: str
+    :rtype: bool
+    """
+    part = ZIP_PARTS.get(extension.lower())
+
+    if part is None:
+        return True
+
+    try:
+        with zipfile.ZipFile(file) as archive:
+            return part in archive.namelist()
+
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+
+def detect_content_type(file: BinaryIO, extension: str) -> str | None:
+    """
+    Returns the MIME type of a complete file, None when its content doesn't match the extension.
+    The file is left at its start.
+
+    :param file: Seekable file opened in binary mode
+    :type file: BinaryIO
+    :param extension: Extension of its filename
+    :type extension: str
+    :rtype: str | None
+    """
+    file.seek(0)
+    mime_type = sniff(file.read(SNIFF_BYTES), extension)
+
+    if mime_type is not None and not check_container(file, extension):
+        mime_type = None
+
+    file.seek(0)
+
+    return mime_type
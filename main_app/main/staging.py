@@ -0,0 +1,101 @@
+"""
+Staging of form uploads.
+
+Werkzeug spools a multipart file to a temporary file (or memory) and the upload route then
+copied it into UPLOAD_PATH, writing every upload twice. For the endpoints in
+StagingRequest.staged_endpoints the file is instead spooled into the staging directory under
+UPLOAD_PATH, hashed and measured while the bytes arrive, and moved into place by
+helper.store_file, which is a rename since both paths are on the same filesystem.
+
+The first bytes are sniffed against the extension of the filename as they arrive. A file whose
+content doesn't match it isn't written any further, the view then refuses it.
+"""
+from flask import Request, current_app
+from pathlib import Path
+import hashlib
+import io
+import tempfile
+
+from .sniffing import SNIFF_BYTES, sniff
+
+
+class StagedFile(io.FileIO):
+    """A spooled upload that knows its size, sha256 and MIME type once the request body has been parsed"""
+
+    def __init__(self, directory: Path, extension: str | None = None) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=directory, suffix=".upload")
+
+        super().__init__(fd, "r+")
+
+        self.path = Path(name)
+        self.size = 0
+        self.extension = extension
+        self.rejected = False
+        self._digest = hashlib.sha256()
+        self._head = bytearray() if extension else None
+        self._mime_type = None
+
+
+    def write(self, data) -> int:
+        # Nothing more of a file that isn't what its name says is kept
+        if self.rejected:
+            return len(memoryview(data))
+
+        # The form parser only ever appends, so the digest follows the file content
+        written = super().write(data)
+
+        self._digest.update(memoryview(data)[:written])
+        self.size += written
+
+        if self._head is not None:
+            self._head += memoryview(data)[:min(written, SNIFF_BYTES - len(self._head))]
+
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+
+        return written
+
+
+    def _sniff(self) -> None:
+        self._mime_type = sniff(bytes(self._head), self.extension)
+        self._head = None
+
+        if self._mime_type is None:
+            self.rejected = True
+            self.truncate(0)
+
+
+    @property
+    def mime_type(self) -> str | None:
+        """What the file was sniffed as, None when it doesn't match its extension"""
+        # Files shorter than SNIFF_BYTES are sniffed once they are complete
+        if self._head is not None:
+            self._sniff()
+
+        return self._mime_type
+
+
+    @property
+    def checksum(self) -> str:
+        return self._digest.hexdigest()
+
+
+    def close(self) -> None:
+        super().close()
+
+        # A stored upload was already moved away, anything else is discarded
+        self.path.unlink(missing_ok=True)
+
+
+
+class StagingRequest(Request):
+    staged_endpoints = {"main_bp.upload_file"}
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in self.staged_endpoints:
+            extension = filename.rsplit(".", 1)[1].lower() if filename and "." in filename else None
+
+            return StagedFile(Path(current_app.config["UPLOAD_PATH"]) / current_app.config["UPLOAD_STAGING_DIR"], extension)
+
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
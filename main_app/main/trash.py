@@ -0,0 +1,130 @@
+"""
+Trash of deleted section directories.
+
+Deleting a section renames its directory into UPLOAD_PATH/<TRASH_DIR>, which is one rename
+whatever the number of files since both are on the same filesystem, and renames it back if the
+delete of the section in the database fails. `flask purge-trash` removes directories that have
+been in the trash for TRASH_GRACE seconds, pacing itself to TRASH_PURGE_FILES_PER_SECOND and
+TRASH_PURGE_BYTES_PER_SECOND so purging a large section doesn't starve uploads and downloads of
+disk I/O. Storages without directories (S3) have nothing to rename, their files are handed to
+the deletion worker instead.
+"""
+from flask import current_app
+from pathlib import Path
+import os
+import time
+import uuid
+
+from main_app.storage import get_storage
+
+
+class IOBudget:
+    """Sleeps whenever more files or bytes were spent than the rates allow since it was created"""
+
+    def __init__(self, files_per_second: float | None, bytes_per_second: float | None) -> None:
+        self.files_per_second = files_per_second
+        self.bytes_per_second = bytes_per_second
+        self.started = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+
+    def spend(self, files: int, size: int) -> None:
+        self.files += files
+        self.bytes += size
+
+        needed = max(
+            self.files / self.files_per_second if self.files_per_second else 0,
+            self.bytes / self.bytes_per_second if self.bytes_per_second else 0
+        )
+        ahead = needed - (time.monotonic() - self.started)
+
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def trash_directory() -> Path:
+    return Path(current_app.config["UPLOAD_PATH"]) / current_app.config["TRASH_DIR"]
+
+
+def move_to_trash(prefix: str) -> Path | None:
+    """
+    Renames the directory of prefix into the trash and returns where it went, None when the
+    storage has no such directory
+
+    :param prefix: Directory of a section, e.g. its name
+    :type prefix: str
+    :rtype: Path | None
+    """
+    source = get_storage().local_path(prefix)
+
+    if source is None or not source.is_dir():
+        return None
+
+    # The time in the name tells the purger how long it has been there, a rename keeps the mtime
+    trashed = trash_directory() / f"{int(time.time())}-{uuid.uuid4().hex}"
+    trashed.parent.mkdir(parents=True, exist_ok=True)
+    os.rename(source, trashed)
+
+    return trashed
+
+
+def restore_from_trash(trashed: Path, prefix: str) -> None:
+    """
+    Renames a directory moved by move_to_trash back to prefix
+
+    :param trashed: What move_to_trash returned
+    :type trashed: Path
+    :param prefix: The prefix it was moved from
+    :type prefix: str
+    """
+    os.rename(trashed, get_storage().local_path(prefix))
+
+
+def purge_trash(grace: float, files_per_second: float | None = None, bytes_per_second: float | None = None) -> tuple[int, int]:
+    """
+    Removes the trash directories older than grace seconds and returns how many directories and
+    files were removed
+
+    :param grace: Seconds a directory is kept, so a failed delete can still restore it
+    :type grace: float
+    :param files_per_second: Most files removed per second, None for no limit
+    :type files_per_second: float | None
+    :param bytes_per_second: Most bytes removed per second, None for no limit
+    :type bytes_per_second: float | None
+    :rtype: tuple[int, int]
+    """
+    trash = trash_directory()
+
+    if not trash.is_dir():
+        return 0, 0
+
+    budget = IOBudget(files_per_second, bytes_per_second)
+    cutoff = time.time() - grace
+    purged, removed = 0, 0
+
+    for entry in sorted(trash.iterdir()):
+        try:
+            trashed_at = int(entry.name.split("-", 1)[0])
+        except ValueError:
+            current_app.logger.warning(f"Skipping {entry} in the trash, it wasn't put there by a section delete")
+            continue
+
+        if trashed_at > cutoff:
+            continue
+
+        for directory, subdirectories, filenames in os.walk(entry, topdown=False):
+            for filename in filenames:
+                path = Path(directory) / filename
+                size = path.lstat().st_size
+
+                path.unlink()
+                removed += 1
+                budget.spend(1, size)
+
+            for subdirectory in subdirectories:
+                (Path(directory) / subdirectory).rmdir()
+
+        entry.rmdir()
+        purged += 1
+
+    return purged, removed
@@ -0,0 +1,320 @@
+"""
+Resolution of public upload links.
+
+An upload link is /upload-file/<slug>/<section_name>, and students reload it all the time. The
+section behind it is kept as a small UploadSection record in an LRU of each process, backed by
+Redis, so a link resolved once costs no database query. Section names are unique, the record is
+keyed by the name and carries the slug the link must have. Links that lead nowhere are cached
+too, for UPLOAD_LINK_MISSING_TTL seconds, so guessing them doesn't reach the database either.
+
+Deleting a section must call upload_links.invalidate with the section names, creating one or
+renaming its owner upload_links.add. Both delete them from Redis and publish them so every
+process drops them from its LRU. The LRU also keeps an entry for UPLOAD_LINK_LOCAL_TTL seconds
+only, which bounds how stale a process gets if it misses a message.
+
+Before any of that, each process checks the link against a Bloom filter of every (slug, section
+name) pair, so links made up by bots or mistyped are turned away without a Redis or database
+round trip. The filter is built from the database when a process first resolves a link and every
+UPLOAD_LINK_FILTER_REBUILD seconds after, which also drops deleted sections, and upload_links.add
+puts new links in the filters of every process. A filter never says a link it was given doesn't
+exist. It isn't used while the process isn't subscribed, since it could miss new links then.
+"""
+from collections import OrderedDict
+from flask import current_app
+from typing import Iterable, Iterator, NamedTuple
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import redis
+import sqlalchemy as sql
+
+from main_app.extensions import db, redis_client
+from main_app.models import Section, User
+from .helper import username_to_gibberish
+
+
+class UploadSection(NamedTuple):
+    id: int
+    user_id: int
+    slug: str
+
+
+_MISSING = "null"
+
+
+class BloomFilter:
+    """Set of upload links that can answer "maybe" for links never added, at fp_rate when holding capacity links"""
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, slug: str, section_name: str) -> Iterable[int]:
+        # Neither part of a link can hold a "/", two halves of one digest give every position
+        digest = hashlib.blake2b(f"{slug}/{section_name}".encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, slug: str, section_name: str) -> None:
+        for position in self._positions(slug, section_name):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, link: tuple[str, str]) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(*link))
+
+    @property
+    def fp_rate(self) -> float:
+        """False positive rate expected with the links added so far"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+def _links(section_names: Iterable[str] | None = None) -> Iterator[tuple[str, str]]:
+    query = sql.select(Section.section_name, User.share_slug, User.username).join(Section.user)
+
+    if section_names is not None:
+        query = query.where(Section.section_name.in_(section_names))
+
+    # Users not backfilled yet, see flask backfill-share-slugs
+    for row in db.session.execute(query.execution_options(yield_per=1000)):
+        yield row.share_slug or username_to_gibberish(row.username), row.section_name
+
+
+def build_link_filter(fp_rate: float) -> BloomFilter:
+    """
+    Returns a Bloom filter of the links of every section
+
+    :param fp_rate: False positive rate wanted
+    :type fp_rate: float
+    :rtype: BloomFilter
+    """
+    sections = db.session.scalar(sql.select(sql.func.count(Section.id)))
+
+    # Room for the sections created until the next rebuild
+    link_filter = BloomFilter(max(2 * sections, 1024), fp_rate)
+
+    for slug, section_name in _links():
+        link_filter.add(slug, section_name)
+
+    return link_filter
+
+
+class UploadLinkResolver:
+    def __init__(self, client: redis.Redis, prefix: str = "upload-link", size: int = 1024) -> None:
+        self.client = client
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidations"
+        self.size = size
+        self._local: OrderedDict[str, tuple[float, UploadSection | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._listener = None
+        self._filter: BloomFilter | None = None
+        self._filter_built = 0.0
+        self._filter_lock = threading.Lock()
+        self._added_while_building: list[tuple[str, str]] | None = None
+
+    def _key(self, section_name: str) -> str:
+        return f"{self.prefix}:{section_name}"
+
+    def _evict(self, *section_names: str) -> None:
+        with self._lock:
+            for section_name in section_names:
+                self._local.pop(section_name, None)
+
+    def _add_to_filter(self, links: list[tuple[str, str]]) -> None:
+        with self._lock:
+            if self._filter is not None:
+                for slug, section_name in links:
+                    self._filter.add(slug, section_name)
+
+            # A filter being built may have read the sections before these were committed
+            if self._added_while_building is not None:
+                self._added_while_building.extend(links)
+
+    def _on_invalidation(self, message: dict) -> None:
+        data = json.loads(message["data"])
+
+        self._evict(*data["evict"])
+        self._add_to_filter([tuple(link) for link in data.get("add", ())])
+
+    def _listen(self) -> None:
+        # Threads don't survive a fork, every worker process subscribes for itself
+        if self._listener_pid == os.getpid():
+            return
+
+        self._listener_pid = os.getpid()
+
+        with self._lock:
+            self._local.clear()
+            self._filter = None
+
+        logger = current_app.logger
+
+        def on_error(e: Exception, pubsub: redis.client.PubSub, thread: redis.client.PubSubWorkerThread) -> None:
+            # Messages are lost until the next request subscribes again, the filter would miss new links
+            logger.warning(f"Lost the upload link invalidations, subscribing again due to {str(e)}")
+            thread.stop()
+            pubsub.close()
+
+            with self._lock:
+                self._filter = None
+                self._listener = None
+                self._listener_pid = None
+
+        try:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_invalidation})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=on_error)
+
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Couldn't subscribe to upload link invalidations, relying on the LRU TTL due to {str(e)}")
+
+    def _current_filter(self) -> BloomFilter | None:
+        config = current_app.config
+
+        if self._listener is None:
+            return None
+
+        if self._filter is not None and time.monotonic() - self._filter_built < config["UPLOAD_LINK_FILTER_REBUILD"]:
+            return self._filter
+
+        # One thread rebuilds, the others go on with the filter there is, or without one
+        if not self._filter_lock.acquire(blocking=False):
+            return self._filter
+
+        try:
+            with self._lock:
+                self._added_while_building = []
+
+            link_filter = build_link_filter(config["UPLOAD_LINK_FILTER_FP_RATE"])
+
+            with self._lock:
+                for slug, section_name in self._added_while_building:
+                    link_filter.add(slug, section_name)
+
+                self._added_while_building = None
+                self._filter = link_filter
+                self._filter_built = time.monotonic()
+
+        except sql.exc.SQLAlchemyError as e:
+            current_app.logger.error(f"Couldn't build the upload link filter due to {str(e)}")
+
+            with self._lock:
+                self._added_while_building = None
+
+        finally:
+            self._filter_lock.release()
+
+        return self._filter
+
+    def _load(self, section_name: str) -> UploadSection | None:
+        row = db.session.execute(
+            sql.select(Section.id, Section.user_id, User.share_slug, User.username).join(Section.user).where(Section.section_name == section_name)
+        ).first()
+
+        if row is None:
+            return None
+
+        # Users not backfilled yet, see flask backfill-share-slugs
+        return UploadSection(row.id, row.user_id, row.share_slug or username_to_gibberish(row.username))
+
+    def _lookup(self, section_name: str) -> UploadSection | None:
+        config = current_app.config
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._local.get(section_name)
+
+            if cached is not None and cached[0] > now:
+                self._local.move_to_end(section_name)
+                return cached[1]
+
+        try:
+            raw = self.client.get(self._key(section_name))
+
+            if raw is None:
+                section = self._load(section_name)
+                ttl = config["UPLOAD_LINK_TTL"] if section else config["UPLOAD_LINK_MISSING_TTL"]
+                self.client.set(self._key(section_name), json.dumps(section) if section else _MISSING, ex=ttl)
+            else:
+                section = UploadSection(*json.loads(raw)) if raw != _MISSING else None
+
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Upload link cache unavailable, resolving {section_name} from the database due to {str(e)}")
+            return self._load(section_name)
+
+        with self._lock:
+            self._local[section_name] = (now + config["UPLOAD_LINK_LOCAL_TTL"], section)
+            self._local.move_to_end(section_name)
+
+            while len(self._local) > self.size:
+                self._local.popitem(last=False)
+
+        return section
+
+    def resolve(self, slug: str, section_name: str) -> UploadSection | None:
+        """
+        Returns the section an upload link leads to, None when there is no such section or it
+        isn't the section of the user the slug stands for
+
+        :param slug: The user part of the link
+        :type slug: str
+        :param section_name: The section part of the link
+        :type section_name: str
+        :rtype: UploadSection | None
+        """
+        config = current_app.config
+
+        if config["UPLOAD_LINK_CACHE_ENABLED"]:
+            self._listen()
+
+            link_filter = self._current_filter() if config["UPLOAD_LINK_FILTER_ENABLED"] else None
+
+            if link_filter is not None and (slug, section_name) not in link_filter:
+                return None
+
+            section = self._lookup(section_name)
+        else:
+            section = self._load(section_name)
+
+        if section is None or section.slug != slug:
+            return None
+
+        return section
+
+    def _publish(self, section_names: tuple[str, ...], links: list[tuple[str, str]]) -> None:
+        self._evict(*section_names)
+        self._add_to_filter(links)
+
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.delete(*(self._key(section_name) for section_name in section_names))
+                pipe.publish(self.channel, json.dumps({"evict": section_names, "add": links}))
+                pipe.execute()
+
+        except redis.RedisError as e:
+            # Other processes resolve the old section until the TTLs run out, and turn new links
+            # away until their filter is rebuilt
+            current_app.logger.error(f"Couldn't invalidate the upload links of {', '.join(section_names)} due to {str(e)}")
+
+    def invalidate(self, *section_names: str) -> None:
+        """Forgets the sections of the links in every process, after they were deleted"""
+        if section_names:
+            self._publish(section_names, [])
+
+    def add(self, *section_names: str) -> None:
+        """Makes the links of the sections known to every process, after they were created or their owner renamed"""
+        if section_names:
+            self._publish(section_names, list(_links(section_names)))
+
+
+upload_links = UploadLinkResolver(redis_client)
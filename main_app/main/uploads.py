@@ -0,0 +1,322 @@
+"""
+Resumable uploads.
+
+Students on unstable connections can send a submission in chunks following the tus 1.0 core
+protocol with its creation and checksum extensions. An upload is created with its metadata and
+total length, each PATCH appends a chunk at the offset the client believes the server has, and a
+HEAD tells the client where to resume after a dropped connection. Chunks are appended to
+UPLOAD_PATH/<UPLOAD_STAGING_DIR>/<id>.part next to an <id>.json holding the metadata, and the
+upload becomes a Submissions row once the last byte arrives. Its first SNIFF_BYTES are sniffed
+against the extension of its filename as soon as they are in, so an upload whose content doesn't
+match is refused before the rest is sent.
+"""
+from flask import current_app
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+import base64
+import binascii
+import fcntl
+import hashlib
+import json
+import os
+import re
+import uuid
+import sqlalchemy as sql
+
+from main_app.extensions import db
+from main_app.models import Section, Submissions
+from main_app.storage import get_storage
+from .exception import (
+    UploadNotFound, UploadOffsetMismatch, UploadChecksumMismatch, UploadTooLarge, UploadLocked, UploadContentMismatch
+)
+from .helper import is_duplicate_submission, store_file, blob_references
+from .sniffing import SNIFF_BYTES, sniff, detect_content_type
+
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def staging_dir() -> Path:
+    """Returns the directory where partial uploads are kept"""
+    return Path(current_app.config["UPLOAD_PATH"]) / current_app.config["UPLOAD_STAGING_DIR"]
+
+
+def _paths(upload_id: str) -> tuple[Path, Path]:
+    if not UPLOAD_ID.match(upload_id):
+        raise UploadNotFound(f"Upload {upload_id} does not exist")
+
+    directory = staging_dir()
+
+    return directory / f"{upload_id}.part", directory / f"{upload_id}.json"
+
+
+def parse_upload_metadata(header: str | None) -> dict[str, str]:
+    """
+    Parses a tus Upload-Metadata header: comma separated "key base64(value)" pairs
+
+    :param header: The raw header value
+    :type header: str | None
+    :rtype: dict[str, str]
+    """
+    metadata = {}
+
+    for pair in (header or "").split(","):
+        if not pair.strip():
+            continue
+
+        key, _, value = pair.strip().partition(" ")
+
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError(f"Invalid metadata value for {key}")
+
+    return metadata
+
+
+def create_staged_upload(metadata: dict, length: int) -> str:
+    """
+    Starts a new resumable upload and returns its ID
+
+    :param metadata: Submission details: section_id, section_name, full_name, mat_no, level, group and filename
+    :type metadata: dict
+    :param length: Total size of the file in bytes
+    :type length: int
+    :rtype: str
+    """
+    upload_id = uuid.uuid4().hex
+    part, info = _paths(upload_id)
+
+    part.parent.mkdir(parents=True, exist_ok=True)
+    part.touch(exist_ok=False)
+
+    info.write_text(json.dumps({
+        **metadata,
+        "length": length,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }))
+
+    return upload_id
+
+
+def discard_staged_upload(upload_id: str) -> None:
+    """Removes a partial upload and its metadata"""
+    part, info = _paths(upload_id)
+
+    info.unlink(missing_ok=True)
+    part.unlink(missing_ok=True)
+
+
+def load_staged_upload(upload_id: str) -> dict:
+    """
+    Returns the metadata of an upload with its current offset
+
+    :param upload_id: ID of the upload
+    :type upload_id: str
+    :rtype: dict
+    """
+    part, info = _paths(upload_id)
+
+    try:
+        data = json.loads(info.read_text())
+        data["offset"] = part.stat().st_size
+
+    except (FileNotFoundError, ValueError):
+        raise UploadNotFound(f"Upload {upload_id} does not exist")
+
+    expires_at = datetime.fromisoformat(data["created_at"]) + timedelta(seconds=current_app.config["UPLOAD_STAGING_TTL"])
+
+    if datetime.now(timezone.utc) > expires_at:
+        discard_staged_upload(upload_id)
+        raise UploadNotFound(f"Upload {upload_id} expired")
+
+    return data
+
+
+def _lock(file) -> None:
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadLocked("Another request is writing to this upload")
+
+
+def _expected_checksum(header: str | None):
+    """Parses a tus Upload-Checksum header: "<algorithm> base64(digest)" """
+    if not header:
+        return None, None
+
+    algorithm, _, value = header.strip().partition(" ")
+
+    if algorithm not in {"sha1", "sha256", "md5"}:
+        raise ValueError(f"Unsupported checksum algorithm {algorithm}")
+
+    try:
+        return hashlib.new(algorithm), base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid checksum value")
+
+
+def _extension(data: dict) -> str:
+    return data["filename"].rsplit(".", 1)[1].lower()
+
+
+def append_chunk(upload_id: str, offset: int, stream, checksum: str | None = None, chunk_size: int = 64 * 1024) -> int:
+    """
+    Appends the bytes of stream to an upload and returns the new offset.
+
+    The chunk is written straight into the partial file. If it would make the file bigger than
+    the declared length or does not match its checksum, the file is truncated back to offset
+    so the client can simply retry the chunk. When the body stops short, e.g. the client
+    disconnected, what arrived is kept so the client resumes from there, unless the chunk has a
+    checksum it can no longer be verified against. UploadContentMismatch is raised once the
+    first bytes show the file isn't what its extension says, the upload should then be discarded.
+
+    :param upload_id: ID of the upload
+    :type upload_id: str
+    :param offset: Where the client believes the upload currently ends
+    :type offset: int
+    :param stream: The request body
+    :param checksum: The Upload-Checksum header, if any
+    :type checksum: str | None
+    :rtype: int
+    """
+    data = load_staged_upload(upload_id)
+    digest, expected = _expected_checksum(checksum)
+    part, _ = _paths(upload_id)
+
+    with open(part, "r+b") as file:
+        _lock(file)
+
+        current = os.fstat(file.fileno()).st_size
+
+        if offset != current:
+            raise UploadOffsetMismatch(f"Upload is at offset {current} not {offset}")
+
+        file.seek(offset)
+        written = 0
+
+        head = min(SNIFF_BYTES, data["length"])
+        sniffed = offset >= head
+
+        def sniff_head() -> None:
+            file.seek(0)
+
+            if sniff(file.read(SNIFF_BYTES), _extension(data)) is None:
+                raise UploadContentMismatch("The file content doesn't match its extension")
+
+            file.seek(offset + written)
+
+        try:
+            while chunk := stream.read(chunk_size):
+                written += len(chunk)
+
+                if offset + written > data["length"]:
+                    raise UploadTooLarge("Chunk goes past the declared upload length")
+
+                file.write(chunk)
+
+                if digest is not None:
+                    digest.update(chunk)
+
+                # Sniffed as soon as the head is in, a dropped connection keeps what arrived and
+                # mustn't leave it unchecked. A chunk with a checksum is verified first.
+                elif not sniffed and offset + written >= head:
+                    sniff_head()
+                    sniffed = True
+
+            if digest is not None and digest.digest() != expected:
+                raise UploadChecksumMismatch("Chunk does not match its checksum")
+
+            if not sniffed and offset + written >= head:
+                sniff_head()
+
+        except (UploadTooLarge, UploadChecksumMismatch, UploadContentMismatch):
+            file.truncate(offset)
+            raise
+
+        except Exception:
+            # tus clients often send the whole file in one PATCH, throwing it away would restart it
+            if digest is not None:
+                file.truncate(offset)
+            else:
+                file.flush()
+
+            raise
+
+        file.flush()
+
+    return offset + written
+
+
+def finalize_staged_upload(upload_id: str) -> Submissions:
+    """
+    Turns a complete upload into a submission: the partial file is moved into storage and the
+    Submissions row is committed. The duplicate checks run again since
+    someone may have submitted through the form while this upload was in progress.
+
+    :param upload_id: ID of the upload
+    :type upload_id: str
+    :return: The new submission
+    :rtype: Submissions
+    """
+    part, _ = _paths(upload_id)
+
+    with open(part, "r+b") as file:
+        _lock(file)
+
+        data = load_staged_upload(upload_id)
+
+        if data["offset"] != data["length"]:
+            raise UploadOffsetMismatch("Upload is not complete yet")
+
+        section = db.session.get(Section, data["section_id"])
+
+        if section is None:
+            discard_staged_upload(upload_id)
+            raise UploadNotFound("The section of this upload no longer exists")
+
+        if is_duplicate_submission(section_obj=section, name=data["full_name"], mat_no=data["mat_no"]):
+            discard_staged_upload(upload_id)
+            raise FileExistsError("Already uploaded file on this section")
+
+        mime_type = detect_content_type(file, _extension(data))
+
+        if mime_type is None:
+            discard_staged_upload(upload_id)
+            raise UploadContentMismatch("The file content doesn't match its extension")
+
+        try:
+            file_path, checksum = store_file(part, data["filename"], section.section_name)
+        except FileExistsError:
+            discard_staged_upload(upload_id)
+            raise
+
+        try:
+            submission = Submissions(
+                section_id=section.id, uploader_name=data["full_name"],
+                mat_no=data["mat_no"], level=data["level"],
+                group=data["group"], original_filename=data["filename"],
+                stored_filename=f"{data['mat_no'] or ''}_{data['filename']}", file_path=file_path,
+                file_size=data["length"], checksum=checksum, mime_type=mime_type
+            )
+
+            db.session.add(submission)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+
+            # A blob can already belong to other submissions
+            if not blob_references(file_path):
+                get_storage().delete(file_path)
+
+            # Another upload of the same student won the race past the duplicate check
+            if isinstance(e, sql.exc.IntegrityError):
+                raise FileExistsError("Already uploaded file on this section")
+
+            raise
+
+        finally:
+            discard_staged_upload(upload_id)
+
+    return submission
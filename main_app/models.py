@@ -20,14 +20,29 @@ class User(UserMixin, db.Model):
     created_at: orm.Mapped[datetime] = orm.mapped_column(sql.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
     last_login: orm.Mapped[datetime] = orm.mapped_column(sql.DateTime(timezone=True), index=True, nullable=True)
 
-    # Ensures when a user is deleted, all of itself is removed from the database that referenced it
+    # The user part of their upload links, kept in step with username so links are built without the cipher
+    share_slug: orm.Mapped[Optional[str]] = orm.mapped_column(sql.String(20), unique=True, index=True, nullable=True)
+
+    # Ensures when a user is deleted, all of itself is removed from the database that referenced it.
+    # The database does it through ON DELETE CASCADE, the sections aren't loaded to be deleted one by one
     sections: orm.Mapped[list["Section"]] = orm.relationship(
         "Section",
         back_populates="user",
-        cascade="all, delete-orphan" # Remember to change to passive_deletes=True in proudction
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
 
+    @orm.validates("username")
+    def update_share_slug(self, key: str, username: str) -> str:
+        # main_app.main.helper imports the models, it can't be imported at the top
+        from main_app.main.helper import username_to_gibberish
+
+        self.share_slug = username_to_gibberish(username)
+
+        return username
+
+
     def hash_password(self, password: str):
         """This method takes in a password in string format and hashes it securely"""
         self.password_hash = generate_password_hash(password, method="pbkdf2:sha256")
@@ -66,21 +81,28 @@ class User(UserMixin, db.Model):
 
 class Section(db.Model):
     id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
-    user_id: orm.Mapped[int] = orm.mapped_column(sql.ForeignKey(User.id, name="fk_section_user_id"), index=True)
+    user_id: orm.Mapped[int] = orm.mapped_column(sql.ForeignKey(User.id, name="fk_section_user_id", ondelete="CASCADE"), index=True)
     section_name: orm.Mapped[str] = orm.mapped_column(sql.String(50), index=True, unique=True)
     section_code: orm.Mapped[str] = orm.mapped_column(sql.String(25), index=True, unique=True, nullable=True)
     expected_submission: orm.Mapped[int] = orm.mapped_column(sql.Integer, index=True, nullable=True)
     created_at: orm.Mapped[datetime] = orm.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
 
+    # Kept up to date by the submission insert and delete events below, flask recount-sections repairs drift
+    submission_count: orm.Mapped[int] = orm.mapped_column(sql.Integer, default=0, server_default="0")
+    total_bytes: orm.Mapped[int] = orm.mapped_column(sql.BigInteger, default=0, server_default="0")
+    last_submission_at: orm.Mapped[Optional[datetime]] = orm.mapped_column(nullable=True)
+
 
     # Backdoor to User
     user: orm.Mapped["User"] = orm.relationship("User", back_populates='sections')
 
-    # This relationship ensure that when a section is deleted, it removes itself from the submissions table
+    # This relationship ensure that when a section is deleted, it removes itself from the submissions table,
+    # through ON DELETE CASCADE like User.sections
     submissions: orm.Mapped[list["Submissions"]] = orm.relationship(
         "Submissions",
         back_populates="section",
-        cascade="all, delete-orphan" # Remember to change to passive_deletes=True in proudction
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
 
@@ -98,19 +120,68 @@ class Submissions(db.Model):
     group: orm.Mapped[str] = orm.mapped_column(sql.String(20), nullable=True)
     original_filename: orm.Mapped[str] = orm.mapped_column(sql.String(30))
     stored_filename: orm.Mapped[str] = orm.mapped_column(sql.String(30))
-    file_path: orm.Mapped[str] = orm.mapped_column(sql.String(250), index=True, unique=True)
+    file_path: orm.Mapped[str] = orm.mapped_column(sql.String(250), index=True) # Not unique, submissions of the same content share a blob
     file_size: orm.Mapped[int] = orm.mapped_column(sql.Integer)
+    checksum: orm.Mapped[Optional[str]] = orm.mapped_column(sql.String(64), nullable=True) # sha256 of the content, used as the ETag
+    mime_type: orm.Mapped[Optional[str]] = orm.mapped_column(sql.String(100), nullable=True) # Sniffed from the content, NULL for older submissions
     uploaded_at: orm.Mapped[datetime] = orm.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
 
     # Establishes a backdoor to Section
     section: orm.Mapped["Section"] = orm.relationship("Section", back_populates="submissions") 
 
+    # Backs the duplicate submission checks. A student submits once per section; a blank mat_no
+    # is stored as NULL so students without one don't collide.
+    __table_args__ = (
+        sql.UniqueConstraint("section_id", "mat_no", name="uq_submissions_section_id_mat_no"),
+        sql.Index("ix_submissions_section_id_uploader_name", "section_id", "uploader_name"),
+        sql.Index("ix_submissions_section_id_uploaded_at", "section_id", "uploaded_at", "id"), # Keyset pagination
+        sql.Index("ix_submissions_section_id_file_size", "section_id", "file_size", "id"),
+        sql.Index("ix_submissions_section_id_level", "section_id", "level"),
+        sql.Index("ix_submissions_section_id_group", "section_id", "group"),
+    )
+
 
     def __str__(self) -> str:
         return f"Filename: {self.original_filename} by {self.uploader_name} at {self.uploaded_at}"
     
 
 
+# Case-insensitive prefix searches of a section's submissions
+sql.Index("ix_submissions_section_id_lower_uploader_name", Submissions.section_id, sql.func.lower(Submissions.uploader_name))
+sql.Index("ix_submissions_section_id_lower_mat_no", Submissions.section_id, sql.func.lower(Submissions.mat_no))
+
+
+@sql.event.listens_for(Submissions, "after_insert")
+def count_submission(mapper, connection, target: Submissions) -> None:
+    """Adds a new submission to the counters of its section, in the transaction that inserts it"""
+    connection.execute(
+        sql.update(Section).where(Section.id == target.section_id).values(
+            submission_count=Section.submission_count + 1,
+            total_bytes=Section.total_bytes + target.file_size,
+            last_submission_at=sql.case(
+                (Section.last_submission_at == None, target.uploaded_at),
+                (Section.last_submission_at < target.uploaded_at, target.uploaded_at),
+                else_=Section.last_submission_at
+            )
+        )
+    )
+
+
+@sql.event.listens_for(Submissions, "after_delete")
+def uncount_submission(mapper, connection, target: Submissions) -> None:
+    """Removes a deleted submission from the counters of its section, in the transaction that deletes it"""
+    connection.execute(
+        sql.update(Section).where(Section.id == target.section_id).values(
+            submission_count=Section.submission_count - 1,
+            total_bytes=Section.total_bytes - target.file_size,
+            last_submission_at=sql.select(sql.func.max(Submissions.uploaded_at)).where(
+                Submissions.section_id == target.section_id
+            ).scalar_subquery()
+        )
+    )
+
+
+
 class ResetToken(db.Model):
     id: orm.Mapped[int] = orm.mapped_column(primary_key=True, index=True)
     user_id: orm.Mapped[int] = orm.mapped_column(sql.Integer, index=True)
@@ -515,6 +515,44 @@ document.addEventListener('keydown', function(e) {
     }
 });
 
+// Live submission progress on the dashboard
+document.addEventListener('DOMContentLoaded', function() {
+    if (!document.querySelector('.dashboard-sections-grid') || !window.EventSource) return;
+
+    const source = new EventSource('/live-progress');
+
+    function updateProgress(e) {
+        const data = JSON.parse(e.data);
+        const progress = document.querySelector(`.dashboard-progress-section[data-section-id="${data.section_id}"]`);
+
+        if (!progress || data.submission_count === undefined) return;
+
+        const count = progress.querySelector('.dashboard-progress-text strong');
+        const fill = progress.querySelector('.dashboard-progress-fill');
+        const size = progress.querySelector('.dashboard-progress-size');
+
+        if (data.expected_submission) {
+            count.textContent = `${data.submission_count}/${data.expected_submission}`;
+            fill.style.width = Math.round(data.submission_count / data.expected_submission * 100) + '%';
+        } else {
+            count.textContent = data.submission_count;
+        }
+
+        if (size) {
+            size.textContent = formatFileSize(data.total_bytes);
+        }
+    }
+
+    source.addEventListener('submission-added', updateProgress);
+    source.addEventListener('submission-deleted', updateProgress);
+
+    // Sections were added or removed, the cards are rebuilt
+    source.addEventListener('section-changed', function() {
+        source.close();
+        window.location.reload();
+    });
+});
+
 
 // Admin Base HTML
 
@@ -0,0 +1,324 @@
+"""
+Storage of submitted files.
+
+Uploads, downloads, section archives and deletes reach the files through a Storage so web nodes
+don't need to share a disk. LocalStorage keeps them under UPLOAD_PATH, S3Storage in an S3
+compatible bucket (AWS S3, MinIO, ...). A file is written under a key such as
+"Assignment/report.pdf" and the put methods return its name, the value kept in
+Submissions.file_path that every other method takes.
+"""
+from flask import current_app
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple
+from abc import ABC, abstractmethod
+import hashlib
+import os
+import shutil
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+class StoredFile(NamedTuple):
+    name: str
+    size: int
+    modified: datetime
+
+
+class Storage(ABC):
+    """The operations every storage backend provides, a backend missing one can't be created"""
+
+    @abstractmethod
+    def put_file(self, key: str, source: Path, exist_ok: bool = False) -> str:
+        """
+        Moves a local file into storage and returns its name. source is consumed either way.
+
+        :param key: Where the file is stored, e.g. Assignment/report.pdf
+        :type key: str
+        :param source: The local file
+        :type source: Path
+        :param exist_ok: Keep the stored file if key exists instead of raising FileExistsError. Its
+            modification time is then refreshed, the deletion worker keeps files written after
+            they were queued, see main_app.deletions
+        :type exist_ok: bool
+        :rtype: str
+        """
+
+    @abstractmethod
+    def put_stream(self, key: str, stream: BinaryIO, exist_ok: bool = False) -> str:
+        """Like put_file, but writes the content of a readable stream"""
+
+    @abstractmethod
+    def open(self, name: str) -> BinaryIO:
+        """Returns a readable stream of a stored file"""
+
+    def read_range(self, name: str, start: int, stop: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yields bytes start to stop (exclusive) of a stored file, chunk_size at a time"""
+        with self.open(name) as file:
+            file.seek(start)
+            remaining = stop - start
+
+            while remaining > 0:
+                chunk = file.read(min(chunk_size, remaining))
+
+                if not chunk:
+                    break
+
+                remaining -= len(chunk)
+                yield chunk
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        """Removes a stored file, a missing file is not an error"""
+
+    @abstractmethod
+    def stat(self, name: str) -> StoredFile:
+        """Returns the size and modification time of a stored file or raises FileNotFoundError"""
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.stat(name)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[str]:
+        """Yields the names of the stored files whose key starts with prefix"""
+
+    def local_path(self, name: str) -> Path | None:
+        """Returns the path of a stored file on this machine, None if it isn't on a local disk"""
+        return None
+
+    def checksum(self, name: str, chunk_size: int = 1024 * 1024) -> str:
+        """Returns the sha256 hex digest of a stored file"""
+        digest = hashlib.sha256()
+
+        with self.open(name) as file:
+            while chunk := file.read(chunk_size):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+
+
+class LocalStorage(Storage):
+    """
+    Files in a directory. Names are root / key, so names of files stored before this class
+    existed, which are full paths, keep working.
+    """
+
+    def __init__(self, root: str | Path = ".") -> None:
+        self.root = Path(root)
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def put_file(self, key: str, source: Path, exist_ok: bool = False) -> str:
+        path = self.path(key)
+
+        if path.exists():
+            source.unlink(missing_ok=True)
+
+            if not exist_ok:
+                raise FileExistsError(f"{path} already exists")
+
+            os.utime(path)
+
+            return str(path)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # mkstemp creates files only the owner can read, the proxy backends need to read them too
+        os.chmod(source, 0o644)
+        os.replace(source, path)
+
+        return str(path)
+
+    def put_stream(self, key: str, stream: BinaryIO, exist_ok: bool = False) -> str:
+        path = self.path(key)
+
+        if path.exists():
+            if not exist_ok:
+                raise FileExistsError(f"{path} already exists")
+
+            os.utime(path)
+
+            return str(path)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(path, "xb") as file:
+            shutil.copyfileobj(stream, file)
+
+        return str(path)
+
+    def open(self, name: str) -> BinaryIO:
+        return open(self.path(name), "rb")
+
+    def delete(self, name: str) -> None:
+        path = self.path(name)
+        path.unlink(missing_ok=True)
+
+        # Drop directories left empty, like a section's or the fan out of a blob
+        root = self.root.resolve()
+        parent = path.parent.resolve()
+
+        while parent != root and root in parent.parents:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+            parent = parent.parent
+
+    def stat(self, name: str) -> StoredFile:
+        result = self.path(name).stat()
+
+        return StoredFile(name, result.st_size, datetime.fromtimestamp(result.st_mtime, timezone.utc))
+
+    def list(self, prefix: str) -> Iterator[str]:
+        base = self.path(prefix)
+
+        if base.is_file():
+            yield str(base)
+            return
+
+        for directory, _, filenames in os.walk(base):
+            for filename in filenames:
+                yield str(Path(directory) / filename)
+
+    def local_path(self, name: str) -> Path | None:
+        return self.path(name)
+
+
+
+class S3Storage(Storage):
+    """
+    Files in an S3 compatible bucket. Names are the keys without the prefix.
+
+    boto3 is only needed when this backend is used; credentials come from its usual sources
+    such as AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, **client_options) -> None:
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("The s3 storage backend needs boto3, install it with pip install boto3")
+
+            client = boto3.client("s3", **client_options)
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def _object(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def put_file(self, key: str, source: Path, exist_ok: bool = False) -> str:
+        try:
+            if self.exists(key):
+                if not exist_ok:
+                    raise FileExistsError(f"{key} already exists")
+
+                self._touch(key)
+
+                return key
+
+            self.client.upload_file(str(source), self.bucket, self._object(key))
+
+            return key
+
+        finally:
+            source.unlink(missing_ok=True)
+
+    def put_stream(self, key: str, stream: BinaryIO, exist_ok: bool = False) -> str:
+        if self.exists(key):
+            if not exist_ok:
+                raise FileExistsError(f"{key} already exists")
+
+            self._touch(key)
+
+            return key
+
+        self.client.upload_fileobj(stream, self.bucket, self._object(key))
+
+        return key
+
+    def _touch(self, key: str) -> None:
+        # Copying an object onto itself is how S3 refreshes its LastModified
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._object(key), CopySource={"Bucket": self.bucket, "Key": self._object(key)},
+            MetadataDirective="REPLACE"
+        )
+
+    def _get(self, name: str, **options):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object(name), **options)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in {"NoSuchKey", "404"}:
+                raise FileNotFoundError(name)
+            raise
+
+    def open(self, name: str) -> BinaryIO:
+        return self._get(name)["Body"]
+
+    def read_range(self, name: str, start: int, stop: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        if start >= stop:
+            return
+
+        body = self._get(name, Range=f"bytes={start}-{stop - 1}")["Body"]
+
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(name))
+
+    def stat(self, name: str) -> StoredFile:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object(name))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in {"NoSuchKey", "404"}:
+                raise FileNotFoundError(name)
+            raise
+
+        return StoredFile(name, head["ContentLength"], head["LastModified"])
+
+    def list(self, prefix: str) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object(prefix)):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):]
+
+
+
+def get_storage() -> Storage:
+    """
+    Returns the storage backend set by STORAGE_BACKEND, "local" or "s3"
+
+    :rtype: Storage
+    """
+    config = current_app.config
+
+    if config["STORAGE_BACKEND"] == "local":
+        return LocalStorage(config["UPLOAD_PATH"])
+
+    # The boto3 client is reused, creating one per request is slow
+    storage = current_app.extensions.get("storage")
+
+    if storage is None:
+        storage = current_app.extensions["storage"] = S3Storage(
+            config["S3_BUCKET"], prefix=config["S3_PREFIX"],
+            endpoint_url=config["S3_ENDPOINT_URL"], region_name=config["S3_REGION"]
+        )
+
+    return storage
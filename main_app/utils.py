@@ -9,6 +9,7 @@ from main_app.extensions import (db, migrate, login_manager, limiter, csrf, mail
 from main_app.auth import auth_bp
 from main_app.main import main_bp
 from main_app.admin import admin_bp
+from main_app.main.admission import register_upload_admission
 
 def initialize_extensions(app):
     db.init_app(app)
@@ -17,6 +18,9 @@ def initialize_extensions(app):
     login_manager.init_app(app)
     limiter.init_app(app)
 
+    # Ahead of csrf, which reads the body of an upload
+    register_upload_admission(app)
+
     csrf.init_app(app)
     mail.init_app(app)
     talisman.init_app(
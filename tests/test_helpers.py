@@ -0,0 +1,1338 @@
+import pytest
+import base64
+import codecs
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+import sqlalchemy as sql
+from pathlib import Path
+from types import SimpleNamespace
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import ClientDisconnected
+
+from datetime import datetime, timezone
+from main_app.extensions import db, redis_client
+from main_app.cache import FragmentCache, cached_fragment
+from main_app.commands import backfill_checksums, backfill_share_slugs
+from main_app.events import emit, submission_added
+from main_app.live import progress_channel, stream_progress
+from main_app.deletions import DeletionQueue, process_deletions, schedule_deletion
+from main_app.fsck import StorageFsck, walk_files
+from main_app.models import Section, Submissions, User
+from main_app.main.downloads import send_stored_file, send_conditional_file
+from main_app.main.helper import (
+    file_checksum, save_uploaded_file, uploaded_file_details, blob_key, blob_references, is_duplicate_submission,
+    delete_multiple_files, delete_section_and_its_files, delete_user_and_their_files, username_to_gibberish,
+    gibberish_to_username, uploaded_content_type
+)
+from main_app.main import staging
+from main_app.main.staging import StagedFile
+from main_app.main.admission import UploadSlots
+from main_app.main.sniffing import sniff, check_container, detect_content_type
+from main_app.main.uploads import create_staged_upload, load_staged_upload, append_chunk, finalize_staged_upload
+from main_app.main.exception import (
+    UploadNotFound, UploadOffsetMismatch, UploadChecksumMismatch, UploadTooLarge, UploadContentMismatch, InvalidCursor
+)
+from main_app.main.pagination import paginate_submissions, submission_filters
+from main_app.main.trash import IOBudget, purge_trash, trash_directory
+from main_app.main.upload_links import BloomFilter, UploadLinkResolver
+from main_app.main.archive import (
+    stream_zip, choose_compression, CompressionPolicy, SectionArchiveCache, submission_set_key
+)
+
+
+def pdf_bytes(size: int) -> bytes:
+    """Random content that sniffs as a PDF"""
+    return b"%PDF-1.7\n" + os.urandom(size - 9)
+
+
+
+class TestSectionArchive:
+    def test_stream_zip_round_trip(self, tmp_path):
+        first = tmp_path / "first.txt"
+        second = tmp_path / "second.pdf"
+
+        first.write_bytes(b"Testing! This is just a sample of file for testing" * 500)
+        second.write_bytes(os.urandom(300 * 1024))
+
+        archive = b"".join(stream_zip([(first, first.name), (second, second.name)], chunk_size=16 * 1024))
+
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipf:
+            assert zipf.testzip() is None
+            assert zipf.read("first.txt") == first.read_bytes()
+            assert zipf.read("second.pdf") == second.read_bytes()
+
+            # Members are written with data descriptors in a single pass
+            assert all(info.flag_bits & 0x08 for info in zipf.infolist())
+
+
+    def test_stream_zip_chunks_are_bounded(self, tmp_path):
+        big = tmp_path / "big.pdf"
+        big.write_bytes(os.urandom(2 * 1024 * 1024))
+
+        chunk_size = 32 * 1024
+        chunks = list(stream_zip([(big, big.name)], chunk_size=chunk_size))
+
+        assert len(chunks) > 1
+
+        # Incompressible data can grow slightly under deflate, but never by a whole chunk
+        assert max(len(chunk) for chunk in chunks) < chunk_size * 2
+
+
+    def test_adaptive_compression_policy(self, tmp_path):
+        policy = CompressionPolicy(stored_extensions=frozenset({"docx", "pptx", "odt"}))
+
+        report = tmp_path / "report.docx"
+        notes = tmp_path / "notes.txt"
+        scanned = tmp_path / "scanned.pdf"
+
+        report.write_bytes(b"Plain text that would compress well" * 1000)
+        notes.write_bytes(b"Plain text that would compress well" * 1000)
+        scanned.write_bytes(os.urandom(100 * 1024))
+
+        assert choose_compression(report, policy) == zipfile.ZIP_STORED
+        assert choose_compression(notes, policy) == zipfile.ZIP_DEFLATED
+        assert choose_compression(scanned, policy) == zipfile.ZIP_STORED
+
+        assert choose_compression(scanned, policy._replace(mode="deflated")) == zipfile.ZIP_DEFLATED
+        assert choose_compression(notes, policy._replace(mode="stored")) == zipfile.ZIP_STORED
+
+        archive = b"".join(stream_zip([(p, p.name) for p in (report, notes, scanned)], policy=policy))
+
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipf:
+            assert zipf.testzip() is None
+            assert zipf.getinfo("report.docx").compress_type == zipfile.ZIP_STORED
+            assert zipf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+            assert zipf.getinfo("scanned.pdf").compress_type == zipfile.ZIP_STORED
+
+
+    @pytest.mark.skipif(not hasattr(zipfile.ZipInfo, "compress_level"), reason="Python 3.13 or later sets the member level")
+    def test_compression_level_of_the_policy(self, tmp_path):
+        notes = tmp_path / "notes.txt"
+        notes.write_bytes(b"Plain text that would compress well, more or less " * 20000)
+
+        sizes = [
+            len(b"".join(stream_zip([(notes, notes.name)], policy=CompressionPolicy(mode="deflated", level=level))))
+            for level in (1, 9)
+        ]
+
+        assert sizes[1] < sizes[0]
+
+
+
+class TestSectionArchiveCache:
+    def make_files(self, directory: Path, count: int, start: int = 1):
+        files = []
+
+        for idx in range(start, start + count):
+            path = directory / f"student_{idx}.txt"
+            path.write_bytes(f"Submission of student {idx}. ".encode() * 400)
+            files.append(SimpleNamespace(id=idx, file_path=str(path), original_filename=path.name))
+
+        return files
+
+
+    def test_first_download_builds_then_repeat_is_a_file_send(self, tmp_path):
+        files = self.make_files(tmp_path, 3)
+        cache = SectionArchiveCache(tmp_path / "cache", CompressionPolicy())
+
+        first = cache.open_or_build(1, files)
+
+        assert not isinstance(first, Path)
+        streamed = b"".join(first)
+
+        second = cache.open_or_build(1, files)
+
+        assert isinstance(second, Path)
+        assert second.read_bytes() == streamed
+
+
+    def test_invalidate_drops_the_archive_and_its_lock(self, tmp_path):
+        files = self.make_files(tmp_path, 2)
+        cache = SectionArchiveCache(tmp_path / "cache", CompressionPolicy())
+
+        b"".join(cache.open_or_build(1, files))
+        assert cache.lookup(1, submission_set_key(files)) is not None
+
+        cache.invalidate(1)
+
+        assert cache.lookup(1, submission_set_key(files)) is None
+        assert list((tmp_path / "cache").iterdir()) == []
+        assert not isinstance(cache.open_or_build(1, files), Path)
+
+
+    def test_concurrent_downloads_share_one_build(self, tmp_path, monkeypatch):
+        files = self.make_files(tmp_path, 3)
+        cache = SectionArchiveCache(tmp_path / "cache", CompressionPolicy(), chunk_size=1024)
+
+        builds = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def gated_stream_zip(*args, **kwargs):
+            builds.append(args)
+            started.set()
+            release.wait(5)
+            yield from stream_zip(*args, **kwargs)
+
+        monkeypatch.setattr("main_app.main.archive.stream_zip", gated_stream_zip)
+
+        first = cache.open_or_build(1, files)
+        assert started.wait(5)
+
+        # The build is in progress when the second download starts
+        second = cache.open_or_build(1, files)
+        release.set()
+
+        assert not isinstance(second, Path)
+        assert b"".join(first) == b"".join(second)
+        assert len(builds) == 1
+        assert isinstance(cache.open_or_build(1, files), Path)
+
+
+    def test_least_recently_downloaded_archives_are_evicted(self, tmp_path):
+        files = self.make_files(tmp_path, 2)
+        cache = SectionArchiveCache(tmp_path / "cache", CompressionPolicy())
+
+        b"".join(cache.open_or_build(1, files))
+        size = cache.lookup(1, submission_set_key(files)).stat().st_size
+        cache.max_bytes = 2 * size
+
+        b"".join(cache.open_or_build(2, files))
+        os.utime(tmp_path / "cache" / "2.zip", (0, 0))
+        assert isinstance(cache.open_or_build(1, files), Path)
+
+        b"".join(cache.open_or_build(3, files))
+
+        assert cache.lookup(2, submission_set_key(files)) is None
+        assert not (tmp_path / "cache" / "2.lock").exists()
+        assert cache.lookup(1, submission_set_key(files)) is not None
+        assert cache.lookup(3, submission_set_key(files)) is not None
+
+
+
+class TestDownloadBackends:
+    def test_x_accel_redirect_points_at_internal_location(self, app, monkeypatch):
+        monkeypatch.setitem(app.config, "DOWNLOAD_BACKEND", "x-accel")
+
+        with app.test_request_context():
+            path = Path(app.config["UPLOAD_PATH"]) / "Assignment" / "john stares.pdf"
+            response = send_stored_file(path, download_name="john stares.pdf", mimetype="application/pdf")
+
+            assert response.headers["X-Accel-Redirect"] == "/protected/uploads/Assignment/john%20stares.pdf"
+            assert "attachment" in response.headers["Content-Disposition"]
+            assert response.get_data() == b""
+
+
+    def test_x_sendfile_uses_absolute_path(self, app, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "DOWNLOAD_BACKEND", "x-sendfile")
+        path = tmp_path / "report.pdf"
+
+        with app.test_request_context():
+            response = send_stored_file(path, download_name="report.pdf", mimetype="application/pdf")
+
+            assert response.headers["X-Sendfile"] == str(path.resolve())
+
+
+    def test_local_backend_sends_from_the_app(self, app, tmp_path):
+        path = tmp_path / "report.txt"
+        path.write_bytes(b"Sent by the app")
+
+        with app.test_request_context():
+            response = send_stored_file(path, download_name="report.txt", mimetype="text/plain")
+            response.direct_passthrough = False
+
+            assert "X-Accel-Redirect" not in response.headers
+            assert response.get_data() == b"Sent by the app"
+
+
+
+class TestResumableDownloads:
+    uploaded_at = datetime(2026, 3, 2, 10, 30, 15, 123456)
+
+    def send(self, app, path, headers=None):
+        with app.test_request_context(headers=headers or {}):
+            response = send_conditional_file(
+                path, download_name=path.name, mimetype="application/pdf",
+                etag=file_checksum(path), last_modified=self.uploaded_at
+            )
+            response.direct_passthrough = False
+
+            return response, response.get_data()
+
+
+    def make_file(self, tmp_path):
+        path = tmp_path / "seminar.pdf"
+        path.write_bytes(os.urandom(200 * 1024))
+
+        return path
+
+
+    def test_full_download_carries_validators(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+        response, body = self.send(app, path)
+
+        assert response.status_code == 200
+        assert body == path.read_bytes()
+        assert response.headers["ETag"] == f'"{file_checksum(path)}"'
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert response.last_modified == self.uploaded_at.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+    def test_resume_download_mid_file(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+        content = path.read_bytes()
+
+        # The connection dropped after the first 120000 bytes
+        received = content[:120000]
+        etag = f'"{file_checksum(path)}"'
+
+        response, body = self.send(app, path, {"Range": f"bytes={len(received)}-", "If-Range": etag})
+
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == f"bytes 120000-{len(content) - 1}/{len(content)}"
+        assert received + body == content
+
+
+    def test_if_range_mismatch_sends_the_whole_file(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+
+        response, body = self.send(app, path, {"Range": "bytes=100-", "If-Range": '"stale-etag"'})
+
+        assert response.status_code == 200
+        assert body == path.read_bytes()
+
+
+    def test_if_none_match_is_not_modified(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+
+        response, body = self.send(app, path, {"If-None-Match": f'"{file_checksum(path)}"'})
+
+        assert response.status_code == 304
+        assert body == b""
+
+
+    def test_multiple_ranges(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+        content = path.read_bytes()
+
+        response, body = self.send(app, path, {"Range": "bytes=0-99,1000-1099,-50"})
+
+        assert response.status_code == 206
+        assert response.mimetype == "multipart/byteranges"
+        assert int(response.headers["Content-Length"]) == len(body)
+
+        boundary = response.mimetype_params["boundary"].encode()
+        parts = body.split(b"--" + boundary)[1:-1]
+
+        assert len(parts) == 3
+
+        expected = [(0, 100), (1000, 1100), (len(content) - 50, len(content))]
+        for part, (start, stop) in zip(parts, expected):
+            head, data = part.split(b"\r\n\r\n", 1)
+
+            assert f"Content-Range: bytes {start}-{stop - 1}/{len(content)}".encode() in head
+            assert data[:-2] == content[start:stop]
+
+
+    def test_unsatisfiable_range(self, app, tmp_path):
+        path = self.make_file(tmp_path)
+
+        response, _ = self.send(app, path, {"Range": "bytes=999999999-"})
+
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == f"bytes */{path.stat().st_size}"
+
+
+
+class TestResumableUploads:
+    metadata = {"full_name": "John Stares", "mat_no": "DE.2018/5161", "level": "200", "group": None, "filename": "seminar.pdf"}
+
+
+    def start(self, section, content):
+        return create_staged_upload({**self.metadata, "section_id": section.id}, len(content))
+
+
+    def test_upload_resumes_after_a_dropped_connection(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = pdf_bytes(100 * 1024)
+
+        with app.test_request_context():
+            upload_id = self.start(sample_section, content)
+
+            # The connection dropped after the first 30000 bytes
+            assert append_chunk(upload_id, 0, io.BytesIO(content[:30000])) == 30000
+            assert load_staged_upload(upload_id)["offset"] == 30000
+
+            with pytest.raises(UploadOffsetMismatch):
+                append_chunk(upload_id, 0, io.BytesIO(content))
+
+            assert append_chunk(upload_id, 30000, io.BytesIO(content[30000:])) == len(content)
+
+            submission = finalize_staged_upload(upload_id)
+            stored = Path(submission.file_path)
+
+            assert stored.read_bytes() == content
+            assert submission.checksum == file_checksum(stored)
+            assert submission.mime_type == "application/pdf"
+            assert submission.file_size == len(content)
+
+            with pytest.raises(UploadNotFound):
+                load_staged_upload(upload_id)
+
+
+    def test_dropped_connection_keeps_what_arrived(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = pdf_bytes(100 * 1024)
+
+        class DroppedStream(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() >= 70000:
+                    raise ClientDisconnected()
+
+                return super().read(size)
+
+        with app.test_request_context():
+            upload_id = self.start(sample_section, content)
+
+            # The whole file was sent in one PATCH and the connection dropped at 70%
+            with pytest.raises(ClientDisconnected):
+                append_chunk(upload_id, 0, DroppedStream(content), chunk_size=10000)
+
+            assert load_staged_upload(upload_id)["offset"] == 70000
+            assert append_chunk(upload_id, 70000, io.BytesIO(content[70000:])) == len(content)
+            assert Path(finalize_staged_upload(upload_id).file_path).read_bytes() == content
+
+
+    def test_corrupted_chunk_is_rolled_back(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = pdf_bytes(20 * 1024)
+
+        with app.test_request_context():
+            upload_id = self.start(sample_section, content)
+            checksum = "sha256 " + base64.b64encode(hashlib.sha256(content[:10000]).digest()).decode()
+
+            with pytest.raises(UploadChecksumMismatch):
+                append_chunk(upload_id, 0, io.BytesIO(b"x" * 10000), checksum)
+
+            assert load_staged_upload(upload_id)["offset"] == 0
+            assert append_chunk(upload_id, 0, io.BytesIO(content[:10000]), checksum) == 10000
+
+            with pytest.raises(UploadTooLarge):
+                append_chunk(upload_id, 10000, io.BytesIO(content[10000:] + b"extra"))
+
+            assert load_staged_upload(upload_id)["offset"] == 10000
+
+
+    def test_duplicate_is_refused_at_finalization(self, app, session, sample_submission, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = pdf_bytes(20 * 1024)
+
+        with app.test_request_context():
+            upload_id = create_staged_upload({**self.metadata, "section_id": sample_submission.section_id}, len(content))
+            append_chunk(upload_id, 0, io.BytesIO(content))
+
+            with pytest.raises(FileExistsError):
+                finalize_staged_upload(upload_id)
+
+            assert not any((tmp_path / app.config["UPLOAD_STAGING_DIR"]).iterdir())
+
+
+    def test_form_upload_is_staged_and_moved_into_place(self, app, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = pdf_bytes(40 * 1024)
+
+        with app.test_request_context(
+            "/upload-file/Tyrxj2DkBoC/Assignment", method="POST",
+            data={"file": (io.BytesIO(content), "seminar.pdf")}, content_type="multipart/form-data"
+        ) as ctx:
+            file = ctx.request.files["file"]
+
+            assert isinstance(file.stream, StagedFile)
+            assert file.stream.path.parent == tmp_path / app.config["UPLOAD_STAGING_DIR"]
+
+            file_path = Path(save_uploaded_file(file, "seminar.pdf", "Assignment"))
+
+            assert file_path.read_bytes() == content
+            assert uploaded_file_details(file, file_path) == (len(content), file_checksum(file_path))
+
+        # Nothing is left behind in the staging directory
+        assert not any((tmp_path / app.config["UPLOAD_STAGING_DIR"]).iterdir())
+
+
+
+class TestContentAddressedStorage:
+    def submit(self, session, section, content, name):
+        file = FileStorage(io.BytesIO(content), filename=name)
+        file_path = save_uploaded_file(file, name, section.section_name)
+
+        submission = Submissions(
+            section_id=section.id, uploader_name=name, original_filename=name,
+            stored_filename=name, file_path=str(file_path), file_size=len(content)
+        )
+        session.add(submission)
+        session.commit()
+
+        return submission
+
+
+    def test_identical_submissions_share_one_blob(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        monkeypatch.setitem(app.config, "STORAGE_MODE", "cas")
+        content = os.urandom(20 * 1024)
+
+        other = Section(section_name="Seminar", user_id=sample_section.user_id)
+        session.add(other)
+        session.commit()
+
+        with app.test_request_context():
+            first = self.submit(session, sample_section, content, "report.pdf")
+            second = self.submit(session, other, content, "report.pdf")
+
+            blob = tmp_path / blob_key(hashlib.sha256(content).hexdigest())
+
+            assert first.file_path == second.file_path == str(blob)
+            assert blob.read_bytes() == content
+
+            # The same name twice in a section is refused like in the directory layout
+            with pytest.raises(FileExistsError):
+                self.submit(session, other, os.urandom(20 * 1024), "report.pdf")
+
+            assert blob_references(first.file_path) == 2
+
+            session.delete(first)
+            session.commit()
+
+            assert blob_references(second.file_path) == 1
+
+
+
+class TestDuplicateSubmission:
+    def test_duplicates_by_mat_no_or_by_name(self, app, session, sample_submission):
+        with app.test_request_context():
+            section = sample_submission.section
+
+            assert is_duplicate_submission(section_obj=section, name="Someone Else", mat_no="DE.2018/5161")
+            assert not is_duplicate_submission(section_obj=section, name="John Stares", mat_no="DE.2018/0001")
+
+            # Without a mat_no the name decides
+            assert is_duplicate_submission(section_obj=section, name="John Stares", mat_no="  ")
+            assert not is_duplicate_submission(section_obj=section, name="Someone Else", mat_no=None)
+
+
+    def test_check_is_one_query(self, app, session, sample_submission):
+        queries = []
+
+        with app.test_request_context():
+            section = sample_submission.section
+            session.add_all([
+                Submissions(
+                    section_id=section.id, uploader_name=f"Student {idx}", mat_no=f"DE.2018/{idx:04}",
+                    original_filename=f"{idx}.pdf", stored_filename=f"{idx}.pdf",
+                    file_path=f"uploaded_files/Assignment/{idx}.pdf", file_size=11141
+                ) for idx in range(200)
+            ])
+            session.commit()
+
+            section.id # Refreshed after the commit before counting
+
+            def record(conn, cursor, statement, *args):
+                queries.append(statement)
+
+            sql.event.listen(db.engine, "before_cursor_execute", record)
+
+            try:
+                assert not is_duplicate_submission(section_obj=section, name="Someone Else", mat_no="DE.2019/0001")
+            finally:
+                sql.event.remove(db.engine, "before_cursor_execute", record)
+
+            # No submission row is loaded, the database answers with a single EXISTS
+            assert len(queries) == 1
+            assert "EXISTS" in queries[0]
+
+
+
+class TestFragmentCache:
+    @pytest.fixture
+    def cache(self, app, monkeypatch):
+        cache = FragmentCache(redis_client, prefix=f"test-fragment-{uuid.uuid4().hex}")
+
+        monkeypatch.setattr("main_app.cache.fragment_cache", cache)
+        monkeypatch.setitem(app.config, "FRAGMENT_CACHE_ENABLED", True)
+
+        yield cache
+
+        redis_client.delete(*redis_client.keys(f"{cache.prefix}:*") or [cache.prefix])
+
+
+    def test_fragment_is_rendered_once(self, app, cache):
+        renders = []
+
+        def render():
+            renders.append(1)
+            return "<p>3 submissions</p>"
+
+        with app.test_request_context():
+            for _ in range(3):
+                assert cached_fragment("user:1", "stats", render) == "<p>3 submissions</p>"
+
+        assert len(renders) == 1
+        assert cache.stats() == {"hits": 2, "misses": 1}
+
+
+    def test_events_invalidate_scopes_of_the_section(self, app, session, cache):
+        count = {"user:1": 0, "user:2": 0, "section:5": 0}
+
+        def renderer(scope):
+            def render():
+                count[scope] += 1
+                return f"{scope} {count[scope]}"
+            return render
+
+        with app.test_request_context():
+            for scope in count:
+                cached_fragment(scope, "cards", renderer(scope))
+
+            emit(submission_added, user_id=1, section_id=5)
+
+            assert cached_fragment("user:1", "cards", renderer("user:1")) == "user:1 2"
+            assert cached_fragment("section:5", "cards", renderer("section:5")) == "section:5 2"
+
+            # Fragments of another user are kept
+            assert cached_fragment("user:2", "cards", renderer("user:2")) == "user:2 1"
+
+
+
+class TestLiveProgress:
+    def test_events_publish_section_counters(self, app, session, sample_submission):
+        with app.test_request_context():
+            section = sample_submission.section
+
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(progress_channel(section.user_id))
+
+            try:
+                emit(submission_added, user_id=section.user_id, section_id=section.id)
+                message = pubsub.get_message(timeout=1) or pubsub.get_message(timeout=1)
+            finally:
+                pubsub.close()
+
+            assert json.loads(message["data"]) == {
+                "event": "submission-added", "section_id": section.id, "submission_count": 1,
+                "expected_submission": 10, "total_bytes": sample_submission.file_size
+            }
+
+
+    def test_stream_relays_events_and_ends(self, app):
+        stream = stream_progress(42, heartbeat=0.05, max_duration=1, retry=1000)
+
+        assert next(stream) == "retry: 1000\n\n"
+
+        redis_client.publish(progress_channel(42), json.dumps({"event": "submission-deleted", "section_id": 7}))
+        events = list(stream)
+
+        assert 'event: submission-deleted\ndata: {"event": "submission-deleted", "section_id": 7}\n\n' in events
+        assert ": keep-alive\n\n" in events
+
+
+
+class TestKeysetPagination:
+    @pytest.fixture
+    def submissions(self, app, session, sample_section):
+        # Two submissions share an upload time, the id breaks the tie
+        times = [datetime(2026, 3, 1, 9, minute) for minute in (5, 1, 3, 3, 7, 2, 9)]
+        sizes = [300, 100, 200, 200, 500, 100, 400]
+
+        submissions = [
+            Submissions(
+                section_id=sample_section.id, uploader_name=f"Student {idx}", mat_no=f"DE.2018/{idx:04}",
+                level="200" if idx % 2 else "300", group="A",
+                original_filename=f"{idx}.pdf", stored_filename=f"{idx}.pdf",
+                file_path=f"uploaded_files/Assignment/{idx}.pdf", file_size=sizes[idx], uploaded_at=uploaded_at
+            ) for idx, uploaded_at in enumerate(times)
+        ]
+        session.add_all(submissions)
+        session.commit()
+
+        yield sorted(submissions, key=lambda s: (s.uploaded_at, s.id))
+
+
+    def test_pages_forward_and_back(self, app, session, sample_section, submissions):
+        with app.app_context():
+            expected = [s.id for s in submissions]
+            pages, cursor = [], None
+
+            while True:
+                page = paginate_submissions(sample_section.id, cursor, per_page=3)
+                pages.append([s.id for s in page.items])
+
+                if page.next_cursor is None:
+                    break
+
+                cursor = page.next_cursor
+
+            assert pages == [expected[:3], expected[3:6], expected[6:]]
+            assert paginate_submissions(sample_section.id, per_page=3).prev_cursor is None
+
+            # Back from the last page
+            back = paginate_submissions(sample_section.id, page.prev_cursor, per_page=3)
+
+            assert [s.id for s in back.items] == expected[3:6]
+            assert back.next_cursor is not None
+
+            first = paginate_submissions(sample_section.id, back.prev_cursor, per_page=3)
+
+            assert [s.id for s in first.items] == expected[:3]
+            assert first.prev_cursor is None
+
+
+    def test_deep_page_is_one_seek(self, app, session, sample_section, submissions):
+        queries = []
+
+        with app.app_context():
+            cursor = paginate_submissions(sample_section.id, per_page=5).next_cursor
+
+            def record(conn, cursor, statement, *args):
+                queries.append(statement)
+
+            sql.event.listen(db.engine, "before_cursor_execute", record)
+
+            try:
+                page = paginate_submissions(sample_section.id, cursor, per_page=5)
+            finally:
+                sql.event.remove(db.engine, "before_cursor_execute", record)
+
+            assert [s.id for s in page.items] == [s.id for s in submissions[5:]]
+            assert len(queries) == 1
+            # SQLite renders LIMIT with OFFSET 0, the page is found by comparing with the cursor
+            assert "(submissions.uploaded_at, submissions.id) > (" in queries[0]
+            assert "count" not in queries[0].lower()
+
+
+    def test_sorted_descending_in_pages(self, app, session, sample_section, submissions):
+        with app.app_context():
+            expected = [s.id for s in sorted(submissions, key=lambda s: (s.file_size, s.id), reverse=True)]
+            ids, cursor = [], None
+
+            while True:
+                page = paginate_submissions(sample_section.id, cursor, per_page=2, sort="size", descending=True)
+                ids += [s.id for s in page.items]
+
+                if page.next_cursor is None:
+                    break
+
+                cursor = page.next_cursor
+
+            assert ids == expected
+
+            back = paginate_submissions(sample_section.id, page.prev_cursor, per_page=2, sort="size", descending=True)
+
+            assert [s.id for s in back.items] == expected[4:6]
+
+            # A cursor only works in the sort it was made for
+            with pytest.raises(InvalidCursor):
+                paginate_submissions(sample_section.id, page.prev_cursor, sort="name")
+
+
+    def test_search_and_filters(self, app, session, sample_section, submissions):
+        def names(**filters):
+            page = paginate_submissions(sample_section.id, filters=submission_filters(**filters), sort="name")
+            return [s.uploader_name for s in page.items]
+
+        with app.app_context():
+            assert names(search="student 1") == ["Student 1"]
+            assert names(search="de.2018/000") == [f"Student {idx}" for idx in range(7)]
+            assert names(search="0003") == []
+            assert names(search="0003", anywhere=True) == ["Student 3"]
+            assert names(search="t 5", anywhere=True) == ["Student 5"]
+            assert names(level="200") == ["Student 1", "Student 3", "Student 5"]
+            assert names(search="stu", level="300", group="B") == []
+            assert names(search="   ", level=" ") == [f"Student {idx}" for idx in range(7)]
+
+
+    def test_invalid_cursor(self, app, session, sample_section):
+        with app.app_context():
+            for cursor in ("not a cursor", base64.urlsafe_b64encode(b'["sideways","2026-01-01",1]').decode()):
+                with pytest.raises(InvalidCursor):
+                    paginate_submissions(sample_section.id, cursor)
+
+
+
+class TestDeletionQueue:
+    @pytest.fixture
+    def queue(self, monkeypatch):
+        queue = DeletionQueue(redis_client, name=f"test-deletions-{uuid.uuid4().hex}")
+
+        monkeypatch.setattr("main_app.deletions.deletion_queue", queue)
+
+        yield queue
+
+        redis_client.delete(queue.name, queue.processing, queue.failed)
+
+
+    def submit(self, session, section, tmp_path, name):
+        path = tmp_path / section.section_name / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+
+        submission = Submissions(
+            section_id=section.id, uploader_name=name, original_filename=name,
+            stored_filename=name, file_path=str(path), file_size=10
+        )
+        session.add(submission)
+        session.commit()
+
+        return path
+
+
+    def test_blob_attached_again_after_it_was_queued_is_kept(self, app, session, sample_section, queue, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        monkeypatch.setitem(app.config, "STORAGE_MODE", "cas")
+        content = os.urandom(20 * 1024)
+
+        with app.test_request_context():
+            first = TestContentAddressedStorage().submit(session, sample_section, content, "report.pdf")
+            blob = Path(first.file_path)
+            os.utime(blob, (time.time() - 3600, time.time() - 3600))
+
+            session.delete(first)
+            session.commit()
+            schedule_deletion([str(blob)])
+            time.sleep(0.05)
+
+            # Another upload of the same content attaches to the blob but hasn't committed yet
+            assert save_uploaded_file(FileStorage(io.BytesIO(content), filename="notes.pdf"), "notes.pdf", "Seminar") == str(blob)
+
+            assert process_deletions(10, 0.1, 5) == 1
+            assert blob.read_bytes() == content
+
+
+    def test_bulk_delete_returns_paths_and_resets_counters(self, app, session, sample_section, tmp_path):
+        with app.app_context():
+            paths = {str(self.submit(session, sample_section, tmp_path, f"{n}.pdf")) for n in range(3)}
+
+            assert set(delete_multiple_files(sample_section.id)) == paths
+
+            section = db.session.get(Section, sample_section.id)
+            assert (section.submission_count, section.total_bytes, section.last_submission_at) == (0, 0, None)
+            assert not session.scalar(sql.select(sql.func.count(Submissions.id)))
+
+            # Only the rows are gone, the files wait for the worker
+            assert all(Path(path).exists() for path in paths)
+
+
+    def test_worker_deletes_unused_files_and_recovers(self, app, session, sample_section, queue, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        with app.test_request_context():
+            gone = self.submit(session, sample_section, tmp_path, "gone.pdf")
+            crashed = self.submit(session, sample_section, tmp_path, "crashed.pdf")
+            paths = delete_multiple_files(sample_section.id)
+
+            # Uploaded again under the same name before the worker ran
+            kept = self.submit(session, sample_section, tmp_path, "gone.pdf")
+
+            schedule_deletion(paths)
+
+            # A worker took the last name and died before deleting it
+            assert queue.take(1, 0.1) == [redis_client.lindex(queue.processing, 0)]
+            assert queue.recover() == 1
+
+            assert process_deletions(10, 0.1, 3) == 2
+            assert process_deletions(10, 0.1, 3) == 0
+
+            assert gone == kept and kept.exists()
+            assert not crashed.exists()
+            assert queue.stats() == {"queued": 0, "processing": 0, "failed": 0}
+
+
+    def test_failed_deletes_are_retried_then_parked(self, app, session, sample_section, queue, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        def refuse(self, name):
+            raise PermissionError(name)
+
+        monkeypatch.setattr("main_app.storage.LocalStorage.delete", refuse)
+
+        with app.test_request_context():
+            self.submit(session, sample_section, tmp_path, "locked.pdf")
+            schedule_deletion(delete_multiple_files(sample_section.id))
+
+            assert process_deletions(10, 0.1, 2) == 1
+            assert queue.stats() == {"queued": 1, "processing": 0, "failed": 0}
+
+            assert process_deletions(10, 0.1, 2) == 1
+            assert queue.stats() == {"queued": 0, "processing": 0, "failed": 1}
+            assert json.loads(redis_client.lindex(queue.failed, 0))["attempts"] == 2
+
+
+
+class TestSectionTrash:
+    def submit(self, session, section, tmp_path, name):
+        path = tmp_path / section.section_name / "nested" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+
+        session.add(Submissions(
+            section_id=section.id, uploader_name=name, original_filename=name,
+            stored_filename=name, file_path=str(path), file_size=10
+        ))
+        session.commit()
+
+        return path
+
+
+    def test_deleted_section_is_trashed_then_purged(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        with app.test_request_context():
+            for n in range(3):
+                self.submit(session, sample_section, tmp_path, f"{n}.pdf")
+
+            delete_section_and_its_files(session.get(Section, sample_section.id))
+
+            assert session.get(Section, sample_section.id) is None
+            assert not session.scalar(sql.select(sql.func.count(Submissions.id)))
+            assert not (tmp_path / "Assignment").exists()
+
+            trashed, = trash_directory().iterdir()
+            assert len(list(trashed.rglob("*.pdf"))) == 3
+
+            # Too recent to be purged
+            assert purge_trash(grace=60) == (0, 0)
+            assert purge_trash(grace=-1) == (1, 3)
+            assert not any(trash_directory().iterdir())
+
+
+    def test_failed_delete_restores_directory(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        with app.test_request_context():
+            path = self.submit(session, sample_section, tmp_path, "kept.pdf")
+
+            def fail():
+                raise RuntimeError("database went away")
+
+            with monkeypatch.context() as patch, pytest.raises(RuntimeError):
+                patch.setattr(db.session, "commit", fail)
+                delete_section_and_its_files(session.get(Section, sample_section.id))
+
+            assert path.exists()
+            assert session.get(Section, sample_section.id).submission_count == 1
+            assert not any(trash_directory().iterdir())
+
+
+    def test_user_delete_is_a_fixed_number_of_statements(self, app, session, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        def delete_user(sections, files):
+            user = User(username=f"user{sections}", email=f"user{sections}@gmail.com")
+            session.add(user)
+            session.commit()
+
+            for n in range(sections):
+                section = Section(section_name=f"Section{sections}-{n}", user_id=user.id)
+                session.add(section)
+                session.commit()
+
+                for f in range(files):
+                    self.submit(session, section, tmp_path, f"{f}.pdf")
+
+            session.expire_all()
+            statements = []
+            record = lambda *args: statements.append(args[2])
+
+            sql.event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                assert len(delete_user_and_their_files(session.get(User, user.id))) == sections
+            finally:
+                sql.event.remove(db.engine, "before_cursor_execute", record)
+
+            return statements
+
+        with app.test_request_context():
+            assert len(delete_user(1, 1)) == len(delete_user(4, 5))
+
+            assert not session.scalar(sql.select(sql.func.count(Section.id)))
+            assert not session.scalar(sql.select(sql.func.count(Submissions.id)))
+            assert len(list(trash_directory().iterdir())) == 5
+
+
+    def test_budget_paces_files_and_bytes(self, monkeypatch):
+        slept = []
+        monkeypatch.setattr("main_app.main.trash.time.sleep", slept.append)
+
+        budget = IOBudget(files_per_second=10, bytes_per_second=1000)
+        budget.spend(1, 0)
+        budget.spend(1, 2000)
+
+        assert slept[0] == pytest.approx(0.1, abs=0.05)
+        assert slept[1] == pytest.approx(2, abs=0.05)
+
+
+
+class TestStorageFsck:
+    def write(self, path, age=0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (path.stat().st_atime - age, path.stat().st_mtime - age))
+
+        return path
+
+
+    def test_walk_is_sorted_and_resumes_after_checkpoint(self, tmp_path):
+        for name in ("b/2", "b/1", "a/x/1", "c", ".trash/1", "d/.trash/1"):
+            self.write(tmp_path / name)
+
+        walked = [parts for parts, _ in walk_files(tmp_path, skip=frozenset({".trash"}))]
+
+        assert walked == [("a", "x", "1"), ("b", "1"), ("b", "2"), ("c",), ("d", ".trash", "1")]
+        assert [parts for parts, _ in walk_files(tmp_path, ("b", "1"), frozenset({".trash"}))] == walked[2:]
+
+
+    def test_reports_orphans_and_missing_files_and_resumes(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        day = 24 * 60 * 60
+
+        with app.test_request_context():
+            kept = self.write(tmp_path / "Assignment" / "kept.pdf", day)
+            self.write(tmp_path / "Assignment" / "orphan.pdf", day)
+            self.write(tmp_path / "Assignment" / "uploading.pdf")
+            self.write(tmp_path / ".staging" / "old.part", 2 * day)
+            self.write(tmp_path / ".staging" / "new.part", day / 2)
+            self.write(tmp_path / ".trash" / "1-abc" / "trashed.pdf", day)
+
+            for name, file_path in (("kept.pdf", str(kept)), ("gone.pdf", str(tmp_path / "Assignment" / "gone.pdf"))):
+                session.add(Submissions(
+                    section_id=sample_section.id, uploader_name=name, original_filename=name,
+                    stored_filename=name, file_path=file_path, file_size=10
+                ))
+            session.commit()
+
+            lines = []
+
+            def interrupt(line):
+                # Stops in the second batch, once the first one was saved
+                if lines:
+                    raise KeyboardInterrupt
+
+                lines.append(line)
+
+            checkpoint = tmp_path.parent / f"{tmp_path.name}-fsck.json"
+
+            with pytest.raises(KeyboardInterrupt):
+                StorageFsck(checkpoint, batch_size=2, orphans="quarantine", report=interrupt).run()
+
+            assert checkpoint.exists()
+            counts = StorageFsck(checkpoint, batch_size=2, orphans="quarantine", report=lines.append).run()
+
+            assert lines == ["orphan .staging/old.part 10", "orphan Assignment/orphan.pdf 10", f"missing 2 {tmp_path / 'Assignment' / 'gone.pdf'}"]
+            assert counts == {"files": 5, "orphans": 2, "orphan_bytes": 20, "rows": 2, "missing": 1}
+            assert not checkpoint.exists()
+
+            assert (tmp_path / ".quarantine" / "Assignment" / "orphan.pdf").exists()
+            assert kept.exists() and (tmp_path / "Assignment" / "uploading.pdf").exists()
+            assert (tmp_path / ".trash" / "1-abc" / "trashed.pdf").exists()
+
+
+
+class TestUploadLinks:
+    @pytest.fixture
+    def resolvers(self, app, monkeypatch):
+        prefix = f"test-upload-link-{uuid.uuid4().hex}"
+        resolvers = [UploadLinkResolver(redis_client, prefix), UploadLinkResolver(redis_client, prefix)]
+
+        monkeypatch.setitem(app.config, "UPLOAD_LINK_CACHE_ENABLED", True)
+        monkeypatch.setitem(app.config, "UPLOAD_LINK_FILTER_ENABLED", False)
+
+        yield resolvers
+
+        for resolver in resolvers:
+            if resolver._listener is not None:
+                resolver._listener.stop()
+
+        redis_client.delete(*redis_client.keys(f"{prefix}:*") or [prefix])
+
+
+    def count_statements(self, resolve):
+        statements = []
+        record = lambda *args: statements.append(args[2])
+
+        sql.event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            return resolve(), len(statements)
+        finally:
+            sql.event.remove(db.engine, "before_cursor_execute", record)
+
+
+    def test_gibberish_round_trips(self):
+        for username in ("John_Stares", "O'Neil.9-x", "émile"):
+            assert gibberish_to_username(username_to_gibberish(username)) == username
+
+
+    def test_links_resolve_without_queries_once_cached(self, app, session, sample_section, resolvers):
+        first, second = resolvers
+        slug = username_to_gibberish("John_Stares")
+
+        with app.test_request_context():
+            section, queries = self.count_statements(lambda: first.resolve(slug, "Assignment"))
+            assert (section.id, section.user_id, queries) == (sample_section.id, sample_section.user_id, 1)
+
+            assert self.count_statements(lambda: first.resolve(slug, "Assignment")) == (section, 0)
+
+            # Another process finds it in Redis
+            assert self.count_statements(lambda: second.resolve(slug, "Assignment")) == (section, 0)
+
+            # A link with another user's slug, and one leading nowhere, which is cached as well
+            assert first.resolve(username_to_gibberish("Someone"), "Assignment") is None
+            assert first.resolve(slug, "Seminar") is None
+            assert self.count_statements(lambda: second.resolve(slug, "Seminar")) == (None, 0)
+
+
+    def test_invalidation_reaches_other_processes(self, app, session, sample_section, resolvers):
+        first, second = resolvers
+        slug = username_to_gibberish("John_Stares")
+
+        with app.test_request_context():
+            assert first.resolve(slug, "Assignment") is not None
+            second.resolve(slug, "Assignment")
+
+            session.delete(session.get(Section, sample_section.id))
+            session.commit()
+
+            second.invalidate("Assignment")
+
+            for _ in range(50):
+                if "Assignment" not in first._local:
+                    break
+                time.sleep(0.05)
+
+            assert first.resolve(slug, "Assignment") is None
+
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        link_filter = BloomFilter(1000, 0.01)
+        links = [(uuid.uuid4().hex, f"Section{i}") for i in range(1000)]
+
+        for slug, section_name in links:
+            link_filter.add(slug, section_name)
+
+        assert all(link in link_filter for link in links)
+        assert sum((uuid.uuid4().hex, "Section1") in link_filter for _ in range(10000)) < 300
+        assert link_filter.fp_rate == pytest.approx(0.01, rel=0.2)
+
+
+    def test_filter_turns_away_made_up_links_and_learns_new_ones(self, app, session, sample_section, resolvers, monkeypatch):
+        first, second = resolvers
+        slug = username_to_gibberish("John_Stares")
+        monkeypatch.setitem(app.config, "UPLOAD_LINK_FILTER_ENABLED", True)
+
+        with app.test_request_context():
+            assert first.resolve(slug, "Assignment") is not None
+            assert second.resolve(slug, "Assignment") is not None
+
+            assert self.count_statements(lambda: first.resolve(slug, "Seminar")) == (None, 0)
+            assert redis_client.get(first._key("Seminar")) is None
+
+            session.add(Section(section_name="Seminar", section_code="SEM-1", expected_submission=5, user_id=sample_section.user_id))
+            session.commit()
+            second.add("Seminar")
+
+            for _ in range(50):
+                if (slug, "Seminar") in first._filter:
+                    break
+                time.sleep(0.05)
+
+            assert first.resolve(slug, "Seminar") is not None
+
+
+
+
+class TestShareSlugs:
+    def test_share_slug_follows_the_username(self, app, session, sample_user):
+        with app.app_context():
+            user = session.get(User, sample_user.id)
+            assert user.share_slug == username_to_gibberish("John_Stares")
+
+            user.username = "Jane_Stares"
+            session.commit()
+
+            assert session.scalar(sql.select(User.share_slug).where(User.id == user.id)) == username_to_gibberish("Jane_Stares")
+
+
+    def test_backfill_sets_missing_slugs(self, app, session, sample_user):
+        with app.app_context():
+            other = User(username="Jane_Doe", email="jane@gmail.com")
+            other.hash_password("jane123456")
+            session.add(other)
+            session.commit()
+
+            session.execute(sql.update(User).where(User.id == sample_user.id).values(share_slug=None))
+            session.commit()
+
+            assert backfill_share_slugs(0, 1) == (sample_user.id, 1)
+            assert backfill_share_slugs(sample_user.id, 1) == (other.id, 0)
+            assert backfill_share_slugs(other.id, 1) == (None, 0)
+
+            assert session.scalar(sql.select(User.share_slug).where(User.id == sample_user.id)) == username_to_gibberish("John_Stares")
+
+
+
+class TestChecksumBackfill:
+    def test_backfill_sets_missing_checksums(self, app, session, sample_submission, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+
+        with app.app_context():
+            stored = tmp_path / "Assignment" / "old.pdf"
+            stored.parent.mkdir()
+            stored.write_bytes(b"uploaded before checksums")
+
+            old = Submissions(
+                section_id=sample_submission.section_id, uploader_name="Jane Doe", mat_no="DE.2018/5162",
+                level=200, group="ACADEMY_NERD", original_filename="old.pdf",
+                stored_filename="old.pdf", file_path=str(stored), file_size=25
+            )
+            session.add(old)
+            session.commit()
+
+            # The file of sample_submission was never stored, it keeps no checksum
+            assert backfill_checksums(0, 1) == (sample_submission.id, 0)
+            assert backfill_checksums(sample_submission.id, 1) == (old.id, 1)
+            assert backfill_checksums(old.id, 1) == (None, 0)
+
+            assert session.scalar(sql.select(Submissions.checksum).where(Submissions.id == old.id)) == file_checksum(stored)
+            assert session.scalar(sql.select(Submissions.checksum).where(Submissions.id == sample_submission.id)) is None
+
+
+
+class TestUploadAdmission:
+    @pytest.fixture
+    def unread_body(self, monkeypatch):
+        def read_body(*args, **kwargs):
+            raise AssertionError("The body of a rejected upload was read")
+
+        monkeypatch.setattr(staging, "StagedFile", read_body)
+
+
+    def post(self, client, section_name, size):
+        return client.post(
+            f"/upload-file/{username_to_gibberish('John_Stares')}/{section_name}",
+            data={"full_name": "Justice Stares", "file": (io.BytesIO(b"x" * size), "seminar.pdf")},
+            content_type="multipart/form-data"
+        )
+
+
+    def test_uploads_are_rejected_before_the_body_is_read(self, app, session, sample_section, client, monkeypatch, unread_body):
+        monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 64 * 1024)
+
+        assert self.post(client, "Seminar", 20 * 1024).status_code == 404
+
+        # Too large or too small, the student is sent back to the form
+        for size in (100 * 1024, 1024):
+            response = self.post(client, "Assignment", size)
+            assert (response.status_code, response.location) == (302, f"/upload-file/{username_to_gibberish('John_Stares')}/Assignment")
+
+            with client.session_transaction() as flask_session:
+                assert flask_session.pop("_flashes") == [("error", "File must be between 10K and 25MB")]
+
+
+    def test_uploads_beyond_the_section_concurrency_wait(self, app, session, sample_section, client, monkeypatch, unread_body):
+        slots = UploadSlots(redis_client, f"test-upload-slots-{uuid.uuid4().hex}")
+        first, second = slots.acquire(sample_section.id, 2, 60), slots.acquire(sample_section.id, 2, 60)
+
+        assert None not in (first, second)
+        assert slots.acquire(sample_section.id, 2, 60) is None
+
+        slots.release(sample_section.id, first)
+        assert slots.acquire(sample_section.id, 2, 60) is not None
+
+        monkeypatch.setitem(app.config, "UPLOAD_SECTION_CONCURRENCY", 0)
+
+        response = self.post(client, "Assignment", 20 * 1024)
+        assert (response.status_code, response.headers["Retry-After"]) == (429, "5")
+        assert b"many uploads right now" in response.data
+
+
+
+class TestContentSniffing:
+    def document(self, tmp_path, name, parts):
+        path = tmp_path / name
+
+        with zipfile.ZipFile(path, "w") as archive:
+            for part in parts:
+                archive.writestr(part, "<xml/>")
+
+        return path
+
+
+    def test_content_must_match_the_extension(self, tmp_path):
+        elf = b"\x7fELF\x02\x01\x01" + b"\x00" * 4000
+        odt = b"PK\x03\x04" + b"\x00" * 26 + b"mimetypeapplication/vnd.oasis.opendocument.text" + b"\x00" * 100
+
+        assert sniff(pdf_bytes(4096), "pdf") == "application/pdf"
+        assert sniff(b"Notes on the seminar\r\n" * 100, "txt") == "text/plain"
+        assert sniff(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 500, "doc") == "application/msword"
+        assert sniff(odt, "odt") == "application/vnd.oasis.opendocument.text"
+
+        assert sniff(elf, "pdf") is None
+        assert sniff(elf, "txt") is None
+        assert sniff(odt, "docx") is None
+        assert sniff(pdf_bytes(4096), "exe") is None
+
+        docx = self.document(tmp_path, "report.docx", ["[Content_Types].xml", "word/document.xml"])
+
+        with open(docx, "rb") as file:
+            assert detect_content_type(file, "docx") == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            assert detect_content_type(file, "pptx") is None
+
+        # A truncated document has no central directory
+        truncated = tmp_path / "truncated.docx"
+        truncated.write_bytes(docx.read_bytes()[:-30])
+
+        assert check_container(truncated, "docx") is False
+
+
+    def test_unicode_text_files_with_a_bom(self):
+        notes = "Notes on the séminaire\r\n" * 300
+
+        # Notepad's "Unicode", cut off in the middle of a character like any head
+        assert sniff(notes.encode("utf-16")[:4095], "txt") == "text/plain"
+        assert sniff(codecs.BOM_UTF16_BE + notes.encode("utf-16-be"), "txt") == "text/plain"
+        assert sniff(notes.encode("utf-32")[:4096], "txt") == "text/plain"
+
+        assert sniff(codecs.BOM_UTF16_LE + b"\x00\x00" * 500, "txt") is None
+        assert sniff(codecs.BOM_UTF16_LE + b"\x00\xdc" * 500, "txt") is None
+
+
+    def test_staged_upload_stops_being_written_on_a_mismatch(self, app, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = b"MZ\x90\x00" + os.urandom(40 * 1024)
+
+        with app.test_request_context(
+            "/upload-file/Tyrxj2DkBoC/Assignment", method="POST",
+            data={"file": (io.BytesIO(content), "seminar.pdf")}, content_type="multipart/form-data"
+        ) as ctx:
+            file = ctx.request.files["file"]
+
+            assert file.stream.rejected
+            assert file.stream.path.stat().st_size == 0
+            assert uploaded_content_type(file, "seminar.pdf") is None
+
+
+    def test_resumable_upload_is_refused_after_the_first_chunk(self, app, session, sample_section, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, "UPLOAD_PATH", tmp_path)
+        content = b"\x7fELF" + os.urandom(100 * 1024)
+
+        with app.test_request_context():
+            upload_id = create_staged_upload({**TestResumableUploads.metadata, "section_id": sample_section.id}, len(content))
+
+            # The head isn't complete yet
+            assert append_chunk(upload_id, 0, io.BytesIO(content[:1000])) == 1000
+
+            with pytest.raises(UploadContentMismatch):
+                append_chunk(upload_id, 1000, io.BytesIO(content[1000:20000]))
@@ -253,7 +253,7 @@ class TestSectionModel:
             submission1 = Submissions(
                 section_id=sample_section.id,
                 uploader_name="John Stares",
-                mat_no="DE.2018/5161",
+                mat_no="DE.2018/5151",
                 level=200,
                 group="ACADEMY_NERD",
                 original_filename="john_stares_project.pptx",
@@ -276,6 +276,54 @@ class TestSectionModel:
             assert "john_stares_project.pptx" in submissions
 
 
+    def test_section_submission_counters(self, app, session, sample_section):
+        with app.app_context():
+            submissions = [
+                Submissions(
+                    section_id=sample_section.id,
+                    uploader_name=f"Student {idx}",
+                    mat_no=f"DE.2018/516{idx}",
+                    original_filename=f"{idx}.pdf",
+                    stored_filename=f"{idx}.pdf",
+                    file_path=f"uploaded_files/{sample_section.section_name}/{idx}.pdf",
+                    file_size=1000 * (idx + 1)
+                ) for idx in range(3)
+            ]
+
+            session.add_all(submissions)
+            session.commit()
+
+            section = session.get(Section, sample_section.id)
+
+            assert section.submission_count == 3
+            assert section.total_bytes == 6000
+            assert section.last_submission_at == max(s.uploaded_at for s in submissions)
+
+            last = max(submissions, key=lambda s: s.uploaded_at)
+            session.delete(last)
+            session.commit()
+
+            assert section.submission_count == 2
+            assert section.total_bytes == 6000 - last.file_size
+            assert section.last_submission_at == max(s.uploaded_at for s in submissions if s is not last)
+
+
+    def test_recount_sections_repairs_drift(self, app, session, sample_submission):
+        with app.app_context():
+            session.execute(sql.update(Section).values(submission_count=7, total_bytes=0, last_submission_at=None))
+            session.commit()
+
+            result = app.test_cli_runner().invoke(args=["recount-sections", "--batch-size", "1"])
+
+            assert "1 had drifted" in result.output
+
+            section = session.get(Section, sample_submission.section_id)
+
+            assert section.submission_count == 1
+            assert section.total_bytes == sample_submission.file_size
+            assert section.last_submission_at is not None
+
+
     def test_cascade_section_delete(self, app, session, sample_user):
         with app.app_context():
             section = Section(
@@ -389,6 +437,36 @@ class TestSubmissonsModel:
                 session.commit()
 
 
+    def test_submission_unique_mat_no_per_section(self, app, session, sample_submission):
+        with app.app_context():
+            submission = Submissions(
+                section_id=sample_submission.section_id,
+                uploader_name="Empress Stares",
+                mat_no=sample_submission.mat_no,
+                original_filename="empress_stares_seminar.pptx",
+                stored_filename="empress_stares_seminar.pptx",
+                file_path=f"uploaded_files/Assignment/empress_stares_seminar.pptx",
+                file_size=11141
+            )
+
+            session.add(submission)
+
+            with pytest.raises(sql.exc.IntegrityError):
+                session.commit()
+
+            session.rollback()
+
+            # Students without a mat_no don't collide
+            for name in ["Empress Stares", "Raviva Stares"]:
+                session.add(Submissions(
+                    section_id=sample_submission.section_id, uploader_name=name, mat_no=None,
+                    original_filename=f"{name}.pptx", stored_filename=f"{name}.pptx",
+                    file_path=f"uploaded_files/Assignment/{name}.pptx", file_size=11141
+                ))
+
+            session.commit()
+
+
     def test_submission_section_relationship(self, app, session, sample_user):
         with app.app_context():
             section = Section(
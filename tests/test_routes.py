@@ -275,6 +275,60 @@ class TestAuthenticatedRoutes:
             assert b'Active Sections' in response.data
 
 
+    def test_homepage_query_count_does_not_grow_with_sections(self, app, session, sample_user, client):
+        """The dashboard statistics of every section come from one query"""
+        with app.app_context():
+            def add_section(idx: int) -> None:
+                section = Section(section_name=f"Section {idx}", section_code=f"SEC-{idx}", expected_submission=5, user_id=sample_user.id)
+                session.add(section)
+                session.flush()
+
+                for number in range(3):
+                    session.add(Submissions(
+                        section_id=section.id, uploader_name=f"Student {number}", mat_no=f"DE.2018/{idx}{number}",
+                        original_filename=f"{number}.pdf", stored_filename=f"{number}.pdf",
+                        file_path=f"Section {idx}/{number}.pdf", file_size=1024
+                    ))
+
+                session.commit()
+
+            def count_queries() -> int:
+                statements = []
+
+                def record(conn, cursor, statement, parameters, context, executemany):
+                    statements.append(statement)
+
+                sql.event.listen(session.get_bind(), "before_cursor_execute", record)
+
+                try:
+                    response = client.get("/home")
+                finally:
+                    sql.event.remove(session.get_bind(), "before_cursor_execute", record)
+
+                assert response.status_code == 200
+                return len(statements)
+
+            client.post(
+                "/auth/sign-in",
+                data={
+                    "username": f"{sample_user.username}",
+                    "password": "john123456"
+                }
+            )
+
+            add_section(0)
+            client.get("/home") # The first request after signing in does some one off work
+            one_section = count_queries()
+
+            for idx in range(1, 5):
+                add_section(idx)
+
+            response = client.get("/home")
+
+            assert count_queries() == one_section
+            assert b'<strong>3/5</strong>' in response.data
+
+
     def test_create_section_route_get_when_logged_in(self, app, sample_user, client):
         """This gets the create_section page when the user is logged in"""
         with app.app_context():
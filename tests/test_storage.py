@@ -0,0 +1,85 @@
+import pytest
+import io
+import os
+
+from main_app.storage import LocalStorage, S3Storage, Storage
+
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        yield LocalStorage(tmp_path / "uploads")
+        return
+
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="filehub")
+
+        yield S3Storage("filehub", prefix="submissions/", client=client)
+
+
+class TestStorage:
+    def test_put_read_and_stat(self, storage, tmp_path):
+        content = os.urandom(100 * 1024)
+        source = tmp_path / "upload.part"
+        source.write_bytes(content)
+
+        name = storage.put_file("Assignment/report.pdf", source)
+
+        assert not source.exists()
+        assert storage.exists(name)
+        assert storage.stat(name).size == len(content)
+
+        with storage.open(name) as file:
+            assert file.read() == content
+
+        assert b"".join(storage.read_range(name, 1000, 5000, chunk_size=1024)) == content[1000:5000]
+
+
+    def test_existing_key_is_kept(self, storage, tmp_path):
+        name = storage.put_stream("Assignment/report.pdf", io.BytesIO(b"first"))
+
+        with pytest.raises(FileExistsError):
+            storage.put_stream("Assignment/report.pdf", io.BytesIO(b"second"))
+
+        source = tmp_path / "upload.part"
+        source.write_bytes(b"second")
+
+        assert storage.put_file("Assignment/report.pdf", source, exist_ok=True) == name
+        assert storage.checksum(name) == storage.checksum(storage.put_stream("Seminar/copy.pdf", io.BytesIO(b"first")))
+
+
+    def test_list_and_delete(self, storage):
+        names = {storage.put_stream(f"Assignment/{idx}.pdf", io.BytesIO(b"content")) for idx in range(3)}
+        other = storage.put_stream("Seminar/0.pdf", io.BytesIO(b"content"))
+
+        assert set(storage.list("Assignment/")) == names
+
+        for name in names:
+            storage.delete(name)
+
+        assert list(storage.list("Assignment/")) == []
+        assert storage.exists(other)
+
+        # Deleting a missing file is not an error
+        storage.delete(other)
+        storage.delete(other)
+
+        with pytest.raises(FileNotFoundError):
+            storage.stat(other)
+
+
+
+    def test_incomplete_backend_fails_when_created(self):
+        class NoListing(Storage):
+            def put_file(self, key, source, exist_ok=False): ...
+            def put_stream(self, key, stream, exist_ok=False): ...
+            def open(self, name): ...
+            def delete(self, name): ...
+            def stat(self, name): ...
+
+        with pytest.raises(TypeError, match="list"):
+            NoListing()